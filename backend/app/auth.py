@@ -1,22 +1,38 @@
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
-from jose import jwt
 from jose.exceptions import ExpiredSignatureError, JWTError
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
-from . import models
+from . import models, schemas
+from .cache import TTLCache, build_cache
 from .config import settings
+from .tokens import load_backend
 
 logger = logging.getLogger(__name__)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+)
 security = HTTPBearer()
 
+# Identity claims added to tokens when settings.trust_token_claims is enabled
+IDENTITY_CLAIMS = ("username", "email", "created_at")
+
+user_cache = build_cache("user", settings.user_cache_size, settings.user_cache_ttl_seconds)
+
+token_backend = load_backend()
+# Verified token -> claims, each entry living no longer than the token itself
+token_cache = TTLCache(settings.token_cache_size, settings.access_token_expire_minutes * 60)
+
 
 class AuthService:
     """
@@ -47,17 +63,39 @@ class AuthService:
         # Standard claims
         to_encode.update({"exp": expire, "iat": now})
         # Keep token payload small: include `sub` (user id) and optionally other minimal claims
-        return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
+        return token_backend.encode(to_encode)
 
     @staticmethod
-    def verify_token(token: str) -> Optional[str]:
+    def create_user_token(user: models.User, expires_delta: Optional[timedelta] = None) -> str:
         """
-        Verify token and return subject (user id) or None if invalid/expired.
+        Create an access token for `user`, embedding identity claims when
+        settings.trust_token_claims is enabled.
         """
+        data = {"sub": user.id}
+        if settings.trust_token_claims:
+            data.update({
+                "username": user.username,
+                "email": user.email,
+                "created_at": user.created_at.isoformat(),
+            })
+        return AuthService.create_access_token(data, expires_delta)
+
+    @staticmethod
+    def decode_token(token: str) -> Optional[dict]:
+        """
+        Verify token and return its claims or None if invalid/expired.
+        Successful verifications are cached until the token's `exp`.
+        """
+        payload = token_cache.get(token)
+        if payload is not None:
+            if payload.get("exp", float("inf")) > time.time():
+                return payload
+            token_cache.delete(token)
+            logger.info("JWT token expired")
+            return None
+
         try:
-            payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-            user_id: Optional[str] = payload.get("sub")
-            return user_id
+            payload = token_backend.decode(token)
         except ExpiredSignatureError:
             logger.info("JWT token expired")
             return None
@@ -65,21 +103,40 @@ class AuthService:
             logger.warning("JWT verification failed: %s", e)
             return None
 
+        if "exp" in payload:
+            token_cache.set(token, payload, ttl=payload["exp"] - time.time())
+        return payload
+
+    @staticmethod
+    def verify_token(token: str) -> Optional[str]:
+        """
+        Verify token and return subject (user id) or None if invalid/expired.
+        """
+        payload = AuthService.decode_token(token)
+        if payload is None:
+            return None
+        user_id: Optional[str] = payload.get("sub")
+        return user_id
+
     @staticmethod
     def get_user_by_id(db: Session, user_id: str) -> Optional[models.User]:
         return db.query(models.User).filter(models.User.id == user_id).first()
 
+    @staticmethod
+    def credentials_exception() -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
     @staticmethod
     def get_authenticated_user(db: Session, token: str) -> models.User:
         """
         Higher level helper that decodes token, fetches user and raises HTTPException
         on failure. Use in FastAPI dependencies.
         """
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        credentials_exception = AuthService.credentials_exception()
 
         user_id = AuthService.verify_token(token)
         if user_id is None:
@@ -91,6 +148,54 @@ class AuthService:
 
         return user
 
+    @staticmethod
+    def get_authenticated_identity(db: Session, token: str) -> schemas.User:
+        """
+        Like get_authenticated_user, but returns a detached identity and serves
+        repeat lookups for the same subject from `user_cache`.
+        """
+        user_id = AuthService.verify_token(token)
+        if user_id is None:
+            raise AuthService.credentials_exception()
+
+        identity = AuthService.get_cached_identity(user_id)
+        if identity is not None:
+            return identity
+
+        user = AuthService.get_user_by_id(db, user_id)
+        if user is None:
+            raise AuthService.credentials_exception()
+        return AuthService.cache_identity(user)
+
+    @staticmethod
+    def get_cached_identity(user_id: str) -> Optional[schemas.User]:
+        cached = user_cache.get(user_id)
+        return None if cached is None else schemas.User.model_validate(cached)
+
+    @staticmethod
+    def cache_identity(user: models.User) -> schemas.User:
+        identity = schemas.User.model_validate(user)
+        user_cache.set(identity.id, identity.model_dump(mode="json"))
+        return identity
+
+    @staticmethod
+    def get_identity_from_claims(token: str) -> Optional[schemas.User]:
+        """
+        Build the identity from claims embedded by create_user_token without
+        touching the database. Returns None when the token carries no identity
+        claims so callers can fall back to a lookup.
+        """
+        payload = AuthService.decode_token(token)
+        if payload is None:
+            raise AuthService.credentials_exception()
+        if not all(claim in payload for claim in IDENTITY_CLAIMS):
+            return None
+        return schemas.User(id=payload["sub"], **{claim: payload[claim] for claim in IDENTITY_CLAIMS})
+
+    @staticmethod
+    def invalidate_user(user_id: str) -> None:
+        user_cache.delete(user_id)
+
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
@@ -0,0 +1,171 @@
+import csv
+import io
+import json
+import logging
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import crud, schemas
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# (row number, parsed record or None, parse error or None)
+ParsedRow = Tuple[int, Optional[dict], Optional[str]]
+
+CSV_TAG_SEPARATOR = ";"
+EXPORT_COLUMNS = ["id", "title", "amount", "timestamp", "type", "currency", "tags"]
+# Rows encoded per chunk handed to the streaming response
+EXPORT_FLUSH_ROWS = 500
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a stream of byte chunks into decoded lines without buffering the body."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", errors="replace")
+    if buffer:
+        yield buffer.rstrip(b"\r").decode("utf-8", errors="replace")
+
+
+async def iter_ndjson_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRow]:
+    """Parse newline-delimited JSON objects, skipping blank lines."""
+    row = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row, None, f"Invalid JSON: {e}"
+            continue
+        if not isinstance(record, dict):
+            yield row, None, "Expected a JSON object"
+            continue
+        yield row, record, None
+
+
+async def iter_csv_rows(chunks: AsyncIterator[bytes]) -> AsyncIterator[ParsedRow]:
+    """
+    Parse CSV with a header row (title, amount, timestamp, type, currency, tags).
+    Tags are separated by ';' and empty cells are treated as missing values.
+    Quoted fields may span lines.
+    """
+    header: Optional[List[str]] = None
+    pending = ""
+    row = 0
+    async for line in iter_lines(chunks):
+        record_text = f"{pending}\n{line}" if pending else line
+        # An odd number of quotes means a quoted field continues on the next line
+        if record_text.count('"') % 2:
+            pending = record_text
+            continue
+        pending = ""
+        if not record_text.strip():
+            continue
+
+        values = next(csv.reader([record_text]))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+
+        row += 1
+        if len(values) != len(header):
+            yield row, None, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        record = {key: value for key, value in zip(header, values) if value != ""}
+        if "tags" in record:
+            record["tags"] = [t.strip() for t in record["tags"].split(CSV_TAG_SEPARATOR) if t.strip()]
+        yield row, record, None
+
+    if pending:
+        yield row + 1, None, "Unterminated quoted field"
+
+
+class BulkImporter:
+    """
+    Validates parsed rows against ExpenseCreate and inserts them in chunks,
+    collecting per-row errors instead of aborting the whole import.
+    """
+
+    def __init__(self, db: Session, user_id: str, chunk_size: Optional[int] = None):
+        self.db = db
+        self.user_id = user_id
+        self.chunk_size = chunk_size or settings.bulk_chunk_size
+        self.result = schemas.BulkImportResult()
+        self._chunk: List[Tuple[int, schemas.ExpenseCreate]] = []
+
+    async def run(self, rows: AsyncIterator[ParsedRow]) -> schemas.BulkImportResult:
+        async for row, record, error in rows:
+            if error is None:
+                try:
+                    self._chunk.append((row, schemas.ExpenseCreate.model_validate(record)))
+                except ValidationError as e:
+                    error = "; ".join(
+                        f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+                    )
+            if error is not None:
+                self._add_error(row, error)
+            if len(self._chunk) >= self.chunk_size:
+                await run_in_threadpool(self._flush)
+        await run_in_threadpool(self._flush)
+        return self.result
+
+    def _flush(self) -> None:
+        chunk, self._chunk = self._chunk, []
+        if not chunk:
+            return
+        try:
+            self.result.inserted += crud.bulk_create_expenses(
+                self.db, [expense for _, expense in chunk], self.user_id
+            )
+        except Exception as e:
+            logger.exception("Bulk insert of %d rows failed", len(chunk))
+            for row, _ in chunk:
+                self._add_error(row, f"Insert failed: {e.__class__.__name__}")
+
+    def _add_error(self, row: int, error: str) -> None:
+        self.result.failed += 1
+        if len(self.result.errors) < settings.bulk_max_reported_errors:
+            self.result.errors.append(schemas.BulkImportError(row=row, error=error))
+
+
+def iter_csv(rows: Iterator[dict]) -> Iterator[str]:
+    """Encode expense rows as CSV in the same layout iter_csv_rows accepts."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow([
+            row["id"],
+            row["title"],
+            row["amount"],
+            row["timestamp"].isoformat() if row["timestamp"] else "",
+            row["type"] or "",
+            row["currency"],
+            CSV_TAG_SEPARATOR.join(row["tags"]),
+        ])
+        if count % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows: Iterator[dict]) -> Iterator[str]:
+    """Encode expense rows as newline-delimited JSON objects."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=lambda value: value.isoformat()))
+        if len(lines) == EXPORT_FLUSH_ROWS:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
@@ -0,0 +1,183 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after `ttl` seconds.
+    A size or ttl of 0 disables caching.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SizedLRUCache:
+    """
+    Thread-safe in-process LRU cache of string values bounded by their total
+    UTF-8 encoded size rather than entry count. Entries expire after `ttl`
+    seconds; `on_evict` is called with the number of entries pushed out for
+    space and `on_resize` with the new total size whenever it changes.
+    A max_bytes or ttl of 0 disables caching.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, on_evict: Optional[Callable[[int], None]] = None,
+                 on_resize: Optional[Callable[[int], None]] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.on_resize = on_resize
+        self.size = 0
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, size, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        size = len(value.encode())
+        if ttl <= 0 or size > self.max_bytes:
+            return
+        evicted = 0
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (value, size, time.monotonic() + ttl)
+            self._resize(size)
+            while self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+                evicted += 1
+        if evicted and self.on_evict is not None:
+            self.on_evict(evicted)
+
+    def _pop(self, key: str) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._resize(-entry[1])
+
+    def _resize(self, delta: int) -> None:
+        self.size += delta
+        if self.on_resize is not None:
+            self.on_resize(self.size)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._resize(-self.size)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisCache:
+    """
+    Shared cache backend storing JSON-encoded values in Redis so that every
+    worker process sees the same entries and invalidations.
+    """
+
+    def __init__(self, url: str, prefix: str, ttl: float):
+        import redis  # optional dependency, only needed when CACHE_URL is set
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.client.get(self._key(key))
+        except Exception as e:
+            logger.warning("Cache read failed: %s", e)
+            return None
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        try:
+            self.client.set(self._key(key), json.dumps(value), px=int(ttl * 1000))
+        except Exception as e:
+            logger.warning("Cache write failed: %s", e)
+
+    def delete(self, key: str) -> None:
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.warning("Cache invalidation failed: %s", e)
+
+    def clear(self) -> None:
+        for key in self.client.scan_iter(match=self._key("*")):
+            self.client.delete(key)
+
+
+def build_cache(prefix: str, maxsize: int, ttl: float):
+    """
+    Return the shared Redis backend when CACHE_URL is configured, otherwise an
+    in-process TTLCache. Values must be JSON serializable for the shared backend.
+    """
+    if settings.cache_url:
+        try:
+            return RedisCache(settings.cache_url, prefix, ttl)
+        except ImportError:
+            logger.warning("CACHE_URL is set but redis is not installed, using in-process cache")
+    return TTLCache(maxsize, ttl)
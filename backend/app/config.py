@@ -7,6 +7,11 @@ class Settings(BaseSettings):
     secret_key: str = Field(..., env="SECRET_KEY")
     algorithm: str = Field(default="HS256", env="ALGORITHM")
     access_token_expire_minutes: int = Field(default=30, env="ACCESS_TOKEN_EXPIRE_MINUTES")
+    # PEM key files for asymmetric algorithms (ES256, RS256, EdDSA); HS* uses secret_key
+    jwt_private_key_path: Optional[str] = Field(default=None, env="JWT_PRIVATE_KEY_PATH")
+    jwt_public_key_path: Optional[str] = Field(default=None, env="JWT_PUBLIC_KEY_PATH")
+    # Verified tokens remembered until they expire; 0 disables
+    token_cache_size: int = Field(default=10000, env="TOKEN_CACHE_SIZE")
 
     # Default to in-container path for Docker deployments
     database_url: str = Field(
@@ -14,6 +19,11 @@ class Settings(BaseSettings):
         env="DATABASE_URL"
     )
 
+    # Serve the core user/expense routes from async handlers on an async engine
+    async_routes: bool = Field(default=False, env="ASYNC_ROUTES")
+    # Async engine URL; derived from database_url (aiosqlite/asyncpg) when unset
+    async_database_url: Optional[str] = Field(default=None, env="ASYNC_DATABASE_URL")
+
     db_type: Optional[str] = "sqlite"
     db_host: Optional[str] = "localhost"
     db_port: Optional[str] = "5432"
@@ -21,6 +31,76 @@ class Settings(BaseSettings):
     db_user: Optional[str] = "postgres"
     db_password: Optional[str] = ""
 
+    # Connection pool sizing; ignored for in-memory SQLite
+    db_pool_size: int = Field(default=5, env="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    # Seconds to wait for a free connection before failing the request
+    db_pool_timeout: float = Field(default=30, env="DB_POOL_TIMEOUT")
+    # Test connections on checkout and replace ones older than db_pool_recycle seconds
+    db_pool_pre_ping: bool = Field(default=True, env="DB_POOL_PRE_PING")
+    db_pool_recycle: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    # Server-side statement timeout (Postgres only); 0 disables
+    db_statement_timeout_ms: int = Field(default=0, env="DB_STATEMENT_TIMEOUT_MS")
+
+    # Comma-separated read replica URLs for GET routes; reads use the primary when unset
+    db_replica_urls: Optional[str] = Field(default=None, env="DB_REPLICA_URLS")
+    # After a user's own write, their reads stay on the primary for this many seconds
+    read_your_writes_seconds: float = Field(default=5, env="READ_YOUR_WRITES_SECONDS")
+    # A replica that failed to connect is skipped for this many seconds
+    replica_retry_seconds: float = Field(default=30, env="REPLICA_RETRY_SECONDS")
+
+    # SQLite tuning profile applied to every new connection (file databases)
+    sqlite_pragmas: bool = Field(default=True, env="SQLITE_PRAGMAS")
+    sqlite_journal_mode: str = Field(default="WAL", env="SQLITE_JOURNAL_MODE")
+    sqlite_synchronous: str = Field(default="NORMAL", env="SQLITE_SYNCHRONOUS")
+    sqlite_busy_timeout_ms: int = Field(default=5000, env="SQLITE_BUSY_TIMEOUT_MS")
+    sqlite_cache_size_kib: int = Field(default=65536, env="SQLITE_CACHE_SIZE_KIB")
+    sqlite_mmap_size: int = Field(default=268435456, env="SQLITE_MMAP_SIZE")
+    # Funnel expense writes through one writer thread that commits them in batches
+    sqlite_single_writer: bool = Field(default=False, env="SQLITE_SINGLE_WRITER")
+    sqlite_write_batch_size: int = Field(default=64, env="SQLITE_WRITE_BATCH_SIZE")
+    # How long the writer waits for more jobs before committing a partial batch
+    sqlite_write_batch_window_ms: float = Field(default=2, env="SQLITE_WRITE_BATCH_WINDOW_MS")
+
+    # Rows validated and inserted per transaction by POST /expenses/bulk
+    bulk_chunk_size: int = Field(default=1000, env="BULK_CHUNK_SIZE")
+    # Per-row errors returned by a bulk import before further ones are only counted
+    bulk_max_reported_errors: int = Field(default=1000, env="BULK_MAX_REPORTED_ERRORS")
+    # Rows fetched per server-side cursor batch by GET /expenses/export
+    export_batch_size: int = Field(default=1000, env="EXPORT_BATCH_SIZE")
+    # Shared cache backend (e.g. redis://localhost:6379/0); in-process caches when unset
+    cache_url: Optional[str] = Field(default=None, env="CACHE_URL")
+    # Cached /expenses/range and /expenses/summary bodies (in-process budget in bytes; 0 disables)
+    response_cache_bytes: int = Field(default=64 * 1024 * 1024, env="RESPONSE_CACHE_BYTES")
+    response_cache_ttl_seconds: int = Field(default=300, env="RESPONSE_CACHE_TTL_SECONDS")
+    # Add a Server-Timing header with each request's SQL statement count and time
+    sql_server_timing: bool = Field(default=False, env="SQL_SERVER_TIMING")
+    # Log statements slower than this many milliseconds (0 disables)
+    slow_query_ms: float = Field(default=250, env="SLOW_QUERY_MS")
+    # Request profiler; the middleware is only installed when enabled
+    profiling_enabled: bool = Field(default=False, env="PROFILING_ENABLED")
+    # Fraction of requests profiled at random (0 profiles only requests asking for it)
+    profiling_sample_rate: float = Field(default=0.0, env="PROFILING_SAMPLE_RATE")
+    # Secret that requests send in X-Profile to be profiled; header requests are ignored when unset
+    profiling_token: Optional[str] = Field(default=None, env="PROFILING_TOKEN")
+    profiling_dir: str = Field(default="./profiles", env="PROFILING_DIR")
+    profiling_interval_ms: float = Field(default=1, env="PROFILING_INTERVAL_MS")
+    # Profiles kept in PROFILING_DIR; the oldest are deleted beyond this (0 keeps all)
+    profiling_max_files: int = Field(default=200, env="PROFILING_MAX_FILES")
+    # ISO 4217 code stored on expenses created without an explicit currency
+    default_currency: str = Field(default="EUR", env="DEFAULT_CURRENCY")
+    # Authenticated user identities cached by token subject
+    user_cache_size: int = Field(default=10000, env="USER_CACHE_SIZE")
+    user_cache_ttl_seconds: int = Field(default=60, env="USER_CACHE_TTL_SECONDS")
+    # Embed username/email in issued tokens and trust them on read-only routes
+    trust_token_claims: bool = Field(default=False, env="TRUST_TOKEN_CLAIMS")
+    # bcrypt cost; hashes made with fewer rounds are upgraded on the next login
+    bcrypt_rounds: int = Field(default=12, env="BCRYPT_ROUNDS")
+    # Dedicated password hashing pool ("thread" or "process") and its limits
+    password_hash_executor: str = Field(default="thread", env="PASSWORD_HASH_EXECUTOR")
+    password_hash_workers: int = Field(default=4, env="PASSWORD_HASH_WORKERS")
+    password_hash_max_pending: int = Field(default=64, env="PASSWORD_HASH_MAX_PENDING")
+
     class Config:
         # Read from environment variables only
         case_sensitive = False
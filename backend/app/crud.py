@@ -1,14 +1,62 @@
-from sqlalchemy.orm import Session
+import base64
+import json
+from sqlalchemy import Select, and_, func, insert, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, Query, selectinload
 from sqlalchemy.exc import IntegrityError
 from . import models, schemas
 from .auth import AuthService
-from datetime import datetime, date, time
-from typing import Optional, List
+from .config import settings
+from .money import from_minor, to_minor
+from .rollup import RollupEntry, RollupService
+from .search import SearchIndex
+from .versions import DataVersionService
+from datetime import datetime, date, time, timedelta
+from collections import defaultdict
+from typing import Optional, List, Tuple, Iterator, Union
+
+class DuplicateUserError(Exception):
+    """A username or email that another user already has; `field` names which."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field.capitalize()} already registered")
+        self.field = field
+
+
+def _duplicate_user_field(error: IntegrityError) -> Optional[str]:
+    """The users unique column `error` violated, from the SQLite or Postgres message."""
+    message = str(error.orig)
+    for field in ("username", "email"):
+        # SQLite: "UNIQUE constraint failed: users.email"; Postgres: "users_email_key"
+        if f"users.{field}" in message or f"users_{field}_key" in message:
+            return field
+    return None
+
 
 class UserCRUD:
     @staticmethod
-    def create_user(db: Session, user: schemas.UserCreate) -> models.User:
-        hashed_password = AuthService.get_password_hash(user.password)
+    def registration_conflict(db: Session, username: str, email: str) -> Optional[str]:
+        """
+        "username" or "email" when either is already taken, else None; one
+        indexed lookup, so duplicate signups are turned away before hashing.
+        """
+        taken = db.execute(
+            select(models.User.username, models.User.email)
+            .where(or_(models.User.username == username, models.User.email == email))
+            .limit(2)
+        ).all()
+        if any(row.username == username for row in taken):
+            return "username"
+        return "email" if taken else None
+
+    @staticmethod
+    def create_user(db: Session, user: schemas.UserCreate, password_hash: Optional[str] = None) -> models.User:
+        """
+        Create a user; pass `password_hash` when the password was already
+        hashed off-thread. The unique constraints decide races between
+        concurrent signups: the loser gets DuplicateUserError.
+        """
+        hashed_password = password_hash or AuthService.get_password_hash(user.password)
         db_user = models.User(
             username=user.username,
             email=user.email,
@@ -17,10 +65,12 @@ class UserCRUD:
         db.add(db_user)
         try:
             db.commit()
-            db.refresh(db_user)
             return db_user
-        except IntegrityError:
+        except IntegrityError as e:
             db.rollback()
+            field = _duplicate_user_field(e)
+            if field:
+                raise DuplicateUserError(field) from e
             raise
         except Exception:
             db.rollback()
@@ -42,22 +92,53 @@ class UserCRUD:
         return user
 
     @staticmethod
-    def update_user(db: Session, user_id: str, user_data: schemas.UserUpdate) -> Optional[models.User]:
-        user = db.query(models.User).filter(models.User.id == user_id).first()
-        if not user:
-            return None
-
+    def update_user(db: Session, user_id: str, user_data: schemas.UserUpdate,
+                    password_hash: Optional[str] = None) -> Optional[models.User]:
+        """
+        Apply the given fields. Where the backend supports UPDATE ... RETURNING
+        (SQLite >= 3.35, Postgres) this is a single statement that also yields
+        the updated row.
+        """
+        values = {}
         if user_data.username:
-            user.username = user_data.username
+            values["username"] = user_data.username
         if user_data.email:
-            user.email = user_data.email
+            values["email"] = user_data.email
         if user_data.password:
-            user.password_hash = AuthService.get_password_hash(user_data.password)
+            values["password_hash"] = password_hash or AuthService.get_password_hash(user_data.password)
 
         try:
+            if values and db.get_bind().dialect.update_returning:
+                user = db.scalars(
+                    update(models.User).where(models.User.id == user_id).values(values).returning(models.User)
+                ).first()
+            else:
+                user = db.get(models.User, user_id)
+                for name, value in values.items():
+                    setattr(user, name, value)
+            if not user:
+                db.rollback()
+                return None
             db.commit()
-            db.refresh(user)
+            AuthService.invalidate_user(user_id)
             return user
+        except IntegrityError as e:
+            db.rollback()
+            field = _duplicate_user_field(e)
+            if field:
+                raise DuplicateUserError(field) from e
+            raise
+        except Exception:
+            db.rollback()
+            raise
+
+    @staticmethod
+    def set_password_hash(db: Session, user_id: str, password_hash: str) -> None:
+        db.query(models.User).filter(models.User.id == user_id).update(
+            {models.User.password_hash: password_hash}, synchronize_session=False
+        )
+        try:
+            db.commit()
         except Exception:
             db.rollback()
             raise
@@ -65,7 +146,148 @@ class UserCRUD:
 class ExpenseCRUD:
     @staticmethod
     def get_expenses(db: Session, user_id: str) -> List[models.Expense]:
-        return db.query(models.Expense).filter(models.Expense.user_id == user_id).all()
+        return (
+            db.query(models.Expense)
+            .options(selectinload(models.Expense.tags))
+            .filter(models.Expense.user_id == user_id)
+            .all()
+        )
+
+    @staticmethod
+    def get_expenses_page(
+        db: Session,
+        user_id: str,
+        filters: Optional[schemas.ExpenseFilter] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        order: str = "desc",
+    ) -> Tuple[List[models.Expense], Optional[str]]:
+        """
+        Return one page of a user's expenses ordered by (timestamp, id) plus the
+        cursor for the next page, or None when this is the last page.
+        Raises ValueError for a malformed cursor.
+        """
+        stmt = ExpenseCRUD.page_statement(user_id, filters, limit, cursor, order)
+        return ExpenseCRUD.split_page(db.scalars(stmt).all(), limit)
+
+    @staticmethod
+    def get_expense_rows_page(
+        db: Session,
+        user_id: str,
+        filters: Optional[schemas.ExpenseFilter] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        order: str = "desc",
+    ) -> Tuple[List[dict], Optional[str]]:
+        """get_expenses_page returning plain rows (see expense_rows) instead of ORM objects."""
+        stmt = ExpenseCRUD.page_statement(user_id, filters, limit, cursor, order, columns=True)
+        rows, next_cursor = ExpenseCRUD.split_page(db.execute(stmt).all(), limit)
+        return ExpenseCRUD.expense_rows(db, rows), next_cursor
+
+    @staticmethod
+    def _select_expenses(columns: bool) -> Select:
+        if columns:
+            return select(
+                models.Expense.title, models.Expense.amount_minor, models.Expense.id,
+                models.Expense.timestamp, models.Expense.currency,
+            )
+        return select(models.Expense).options(selectinload(models.Expense.tags))
+
+    @staticmethod
+    def expense_rows(db: Session, rows: list) -> List[dict]:
+        """
+        Turn (title, amount_minor, id, timestamp, currency) rows into dicts with the keys, key
+        order and value types of schemas.Expense, so list endpoints can encode
+        them directly. Tags are loaded with one query per 500 expenses.
+        """
+        tags = defaultdict(list)
+        links = models.expense_tag_table.c
+        ids = [row.id for row in rows]
+        for start in range(0, len(ids), 500):
+            tag_rows = db.execute(
+                select(links.expense_id, models.Tag.name, models.Tag.id)
+                .join(models.Tag, models.Tag.id == links.tag_id)
+                .where(links.expense_id.in_(ids[start:start + 500]))
+            )
+            for expense_id, name, tag_id in tag_rows:
+                tags[expense_id].append({"name": name, "id": tag_id})
+        return [
+            {"title": row.title, "amount": from_minor(row.amount_minor), "tags": tags[row.id],
+             "id": row.id, "timestamp": row.timestamp, "currency": row.currency}
+            for row in rows
+        ]
+
+    @staticmethod
+    def page_statement(
+        user_id: str,
+        filters: Optional[schemas.ExpenseFilter] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        order: str = "desc",
+        columns: bool = False,
+    ) -> Select:
+        """
+        SELECT for get_expenses_page, shared with the async CRUD layer. With
+        columns=True it selects plain columns for get_expense_rows_page.
+        """
+        descending = order == "desc"
+        stmt = ExpenseCRUD._apply_filters(
+            ExpenseCRUD._select_expenses(columns).filter(models.Expense.user_id == user_id),
+            filters,
+        )
+
+        key = tuple_(models.Expense.timestamp, models.Expense.id)
+        if cursor:
+            after = ExpenseCRUD.decode_cursor(cursor)
+            stmt = stmt.filter(key < after if descending else key > after)
+
+        if descending:
+            stmt = stmt.order_by(models.Expense.timestamp.desc(), models.Expense.id.desc())
+        else:
+            stmt = stmt.order_by(models.Expense.timestamp.asc(), models.Expense.id.asc())
+
+        if limit is not None:
+            # Fetch one extra row to find out whether another page exists
+            stmt = stmt.limit(limit + 1)
+        return stmt
+
+    @staticmethod
+    def split_page(
+        rows: List[models.Expense], limit: Optional[int]
+    ) -> Tuple[List[models.Expense], Optional[str]]:
+        if limit is None or len(rows) <= limit:
+            return list(rows), None
+        rows = rows[:limit]
+        return rows, ExpenseCRUD.encode_cursor(rows[-1])
+
+    @staticmethod
+    def encode_cursor(expense: models.Expense) -> str:
+        raw = json.dumps([expense.timestamp.isoformat(), expense.id])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+        try:
+            timestamp, expense_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return datetime.fromisoformat(timestamp), str(expense_id)
+        except (ValueError, TypeError) as e:
+            raise ValueError("Invalid cursor") from e
+
+    @staticmethod
+    def _apply_filters(query: Union[Query, Select], filters: Optional[schemas.ExpenseFilter]):
+        if filters is None:
+            return query
+        if filters.type:
+            query = query.filter(models.Expense.type == filters.type)
+        if filters.tag:
+            query = query.filter(models.Expense.tags.any(models.Tag.name == filters.tag))
+        if filters.min_amount is not None:
+            query = query.filter(models.Expense.amount_minor >= to_minor(filters.min_amount))
+        if filters.max_amount is not None:
+            query = query.filter(models.Expense.amount_minor <= to_minor(filters.max_amount))
+        if filters.q:
+            query = query.filter(models.Expense.title.icontains(filters.q, autoescape=True))
+        return query
 
     @staticmethod
     def get_expense(db: Session, expense_id: str, user_id: str) -> Optional[models.Expense]:
@@ -75,13 +297,16 @@ class ExpenseCRUD:
         ).first()
 
     @staticmethod
-    def create_expense(db: Session, expense: schemas.ExpenseCreate, user_id: str) -> models.Expense:
+    def create_expense(db: Session, expense: schemas.ExpenseCreate, user_id: str,
+                       commit: bool = True) -> models.Expense:
+        """With commit=False the insert is only flushed and the caller owns the transaction."""
         tag_objects = TagCRUD._get_or_create_tags(db, expense.tags or [], user_id)
         timestamp = ExpenseCRUD._parse_timestamp(expense.timestamp)
 
         db_expense = models.Expense(
             title=expense.title,
             amount=expense.amount,
+            currency=expense.currency or settings.default_currency,
             timestamp=timestamp,
             type=expense.type,
             user_id=user_id,
@@ -90,21 +315,80 @@ class ExpenseCRUD:
 
         db.add(db_expense)
         try:
+            RollupService.apply(db, RollupService.deltas(added=[RollupService.entry_for(db_expense)]))
+            DataVersionService.touch(db, user_id, [db_expense.timestamp])
+            db.flush()
+            SearchIndex.sync(db, [db_expense.id])
+            if not commit:
+                db.flush()
+                return db_expense
+            # Every column default is computed client-side and the tags are
+            # already attached, so there is nothing to read back
             db.commit()
-            db.refresh(db_expense)
             return db_expense
         except Exception:
             db.rollback()
             raise
 
     @staticmethod
-    def update_expense(db: Session, expense_id: str, expense_data: schemas.ExpenseCreate, user_id: str) -> Optional[models.Expense]:
+    def bulk_create_expenses(db: Session, expenses: List[schemas.ExpenseCreate], user_id: str) -> int:
+        """
+        Insert a chunk of expenses in one transaction using executemany inserts.
+        Tags for the whole chunk are resolved together. Returns the number of
+        rows inserted; on failure the chunk is rolled back and the error re-raised.
+        """
+        if not expenses:
+            return 0
+
+        tag_names = [name for expense in expenses for name in (expense.tags or [])]
+        tag_ids = {tag.name: tag.id for tag in TagCRUD._get_or_create_tags(db, tag_names, user_id)}
+
+        expense_rows = []
+        link_rows = []
+        rollup_entries = []
+        for expense in expenses:
+            expense_id = models.new_id()
+            row = {
+                "id": expense_id,
+                "title": expense.title,
+                "amount_minor": to_minor(expense.amount),
+                "currency": expense.currency or settings.default_currency,
+                "timestamp": ExpenseCRUD._parse_timestamp(expense.timestamp),
+                "type": expense.type,
+                "user_id": user_id,
+            }
+            expense_tag_ids = [tag_ids[name] for name in dict.fromkeys(expense.tags or [])]
+            expense_rows.append(row)
+            link_rows.extend({"expense_id": expense_id, "tag_id": tag_id} for tag_id in expense_tag_ids)
+            rollup_entries.append(RollupEntry(
+                user_id, row["timestamp"], row["type"], row["amount_minor"], row["currency"], tuple(expense_tag_ids)
+            ))
+
+        try:
+            db.execute(insert(models.Expense), expense_rows)
+            if link_rows:
+                db.execute(insert(models.expense_tag_table), link_rows)
+            RollupService.apply(db, RollupService.deltas(added=rollup_entries))
+            DataVersionService.touch(db, user_id, [row["timestamp"] for row in expense_rows])
+            SearchIndex.sync(db, [row["id"] for row in expense_rows])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(expense_rows)
+
+    @staticmethod
+    def update_expense(db: Session, expense_id: str, expense_data: schemas.ExpenseCreate, user_id: str,
+                       commit: bool = True) -> Optional[models.Expense]:
         expense = ExpenseCRUD.get_expense(db, expense_id, user_id)
         if not expense:
             return None
+        previous = RollupService.entry_for(expense)
 
         expense.title = expense_data.title
         expense.amount = expense_data.amount
+        if expense_data.currency:
+            expense.currency = expense_data.currency
         expense.type = expense_data.type
 
         if expense_data.tags:
@@ -114,32 +398,240 @@ class ExpenseCRUD:
             expense.timestamp = ExpenseCRUD._parse_timestamp(expense_data.timestamp)
 
         try:
+            RollupService.apply(db, RollupService.deltas(
+                added=[RollupService.entry_for(expense)], removed=[previous]
+            ))
+            DataVersionService.touch(db, user_id, [previous.timestamp, expense.timestamp])
+            SearchIndex.sync(db, [expense.id])
+            if not commit:
+                db.flush()
+                return expense
             db.commit()
-            db.refresh(expense)
             return expense
         except Exception:
             db.rollback()
             raise
 
+    @staticmethod
+    def search_expense_rows(db: Session, user_id: str, q: str, limit: int, offset: int = 0) -> List[dict]:
+        """Ranked full-text matches as plain rows (see expense_rows), best first."""
+        return ExpenseCRUD.expense_rows(db, SearchIndex.search(db, user_id, q, limit, offset))
+
     @staticmethod
     def get_expenses_in_range(db: Session, start_date: date, end_date: date, user_id: str) -> List[models.Expense]:
+        return db.scalars(ExpenseCRUD.range_statement(start_date, end_date, user_id)).all()
+
+    @staticmethod
+    def get_expense_rows_in_range(db: Session, start_date: date, end_date: date, user_id: str) -> List[dict]:
+        """get_expenses_in_range returning plain rows (see expense_rows)."""
+        rows = db.execute(ExpenseCRUD.range_statement(start_date, end_date, user_id, columns=True)).all()
+        return ExpenseCRUD.expense_rows(db, rows)
+
+    @staticmethod
+    def range_statement(start_date: date, end_date: date, user_id: str, columns: bool = False) -> Select:
         start_dt = datetime.combine(start_date, time.min)
         end_dt = datetime.combine(end_date, time.max)
         return (
-            db.query(models.Expense)
+            ExpenseCRUD._select_expenses(columns)
             .filter(models.Expense.user_id == user_id)
             .filter(models.Expense.timestamp >= start_dt)
             .filter(models.Expense.timestamp <= end_dt)
-            .all()
         )
 
     @staticmethod
-    def delete_expense(db: Session, expense_id: str, user_id: str) -> Optional[models.Expense]:
+    def iter_expense_rows(
+        db: Session,
+        user_id: str,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        Stream a user's expenses as plain dicts from a server-side cursor,
+        oldest first. Tags are fetched per batch, so memory is bounded by
+        `batch_size` regardless of how many rows match.
+        """
+        stmt = select(
+            models.Expense.id,
+            models.Expense.title,
+            models.Expense.amount_minor,
+            models.Expense.timestamp,
+            models.Expense.type,
+            models.Expense.currency,
+        ).where(models.Expense.user_id == user_id)
+        if start_date is not None:
+            stmt = stmt.where(models.Expense.timestamp >= datetime.combine(start_date, time.min))
+        if end_date is not None:
+            stmt = stmt.where(models.Expense.timestamp <= datetime.combine(end_date, time.max))
+        stmt = stmt.order_by(models.Expense.timestamp, models.Expense.id)
+
+        result = db.execute(stmt.execution_options(yield_per=batch_size))
+        links = models.expense_tag_table.c
+        for batch in result.partitions():
+            tags = defaultdict(list)
+            tag_rows = db.execute(
+                select(links.expense_id, models.Tag.name)
+                .join(models.Tag, models.Tag.id == links.tag_id)
+                .where(links.expense_id.in_([row.id for row in batch]))
+            )
+            for expense_id, name in tag_rows:
+                tags[expense_id].append(name)
+            for row in batch:
+                yield {
+                    "id": row.id, "title": row.title, "amount": from_minor(row.amount_minor),
+                    "timestamp": row.timestamp, "type": row.type, "currency": row.currency,
+                    "tags": tags[row.id],
+                }
+
+    @staticmethod
+    def get_summary(
+        db: Session,
+        user_id: str,
+        group_by: str,
+        start_date: date,
+        end_date: date,
+        expense_type: Optional[str] = None,
+    ) -> List[schemas.SummaryBucket]:
+        """
+        Aggregate total/count/average of amounts per bucket and currency.
+        `group_by` is one of day, week, month, tag or type. When grouping by
+        tag an expense counts towards every tag it carries; untagged expenses
+        fall into the bucket with key None. Currencies are never added
+        together: a key with expenses in two currencies gives two buckets.
+
+        For month, type and tag grouping, closed months fully inside the range
+        are read from the rollup table and only the partial months at either
+        end are aggregated from expenses with a single GROUP BY.
+        """
+        # (key, currency) -> [total in minor units, count]; converted once so sums stay exact
+        buckets = defaultdict(lambda: [0, 0])
+        live_ranges = [(start_date, end_date)]
+
+        closed = ExpenseCRUD._closed_months(start_date, end_date) if group_by in ("month", "type", "tag") else None
+        if closed:
+            first_day, last_day = closed
+            rolled_up = RollupService.read(
+                db, user_id, group_by,
+                RollupService.month_key(first_day), RollupService.month_key(last_day), expense_type,
+            )
+            for key, (total, count) in rolled_up.items():
+                buckets[key][0] += total
+                buckets[key][1] += count
+            live_ranges = [
+                (low, high)
+                for low, high in ((start_date, first_day - timedelta(days=1)), (last_day + timedelta(days=1), end_date))
+                if low <= high
+            ]
+
+        if live_ranges:
+            for key, currency, total, count in ExpenseCRUD._aggregate(db, user_id, group_by, live_ranges, expense_type):
+                buckets[(key, currency)][0] += total
+                buckets[(key, currency)][1] += count
+
+        return [
+            schemas.SummaryBucket(key=key, currency=currency, total=from_minor(total), count=count,
+                                  average=from_minor(total) / count)
+            for (key, currency), (total, count) in sorted(
+                buckets.items(), key=lambda item: (item[0][0] is not None, item[0][0] or "", item[0][1])
+            )
+            if count
+        ]
+
+    @staticmethod
+    def _aggregate(
+        db: Session,
+        user_id: str,
+        group_by: str,
+        date_ranges: List[Tuple[date, date]],
+        expense_type: Optional[str] = None,
+    ):
+        """Single GROUP BY over the expenses table yielding (key, currency, total, count)."""
+        if group_by == "tag":
+            key = models.Tag.name
+        elif group_by == "type":
+            key = models.Expense.type
+        else:
+            key = ExpenseCRUD._time_bucket(db.get_bind().dialect.name, group_by)
+
+        stmt = select(
+            key.label("key"),
+            models.Expense.currency,
+            func.sum(models.Expense.amount_minor),
+            func.count(models.Expense.id),
+        ).where(
+            models.Expense.user_id == user_id,
+            or_(*(
+                and_(
+                    models.Expense.timestamp >= datetime.combine(low, time.min),
+                    models.Expense.timestamp <= datetime.combine(high, time.max),
+                )
+                for low, high in date_ranges
+            )),
+        )
+        if group_by == "tag":
+            links = models.expense_tag_table.c
+            stmt = stmt.outerjoin(
+                models.expense_tag_table, links.expense_id == models.Expense.id
+            ).outerjoin(models.Tag, models.Tag.id == links.tag_id)
+        if expense_type:
+            stmt = stmt.where(models.Expense.type == expense_type)
+        return db.execute(stmt.group_by(key, models.Expense.currency)).all()
+
+    @staticmethod
+    def _closed_months(start_date: date, end_date: date, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+        """
+        First and last day of the block of whole months inside the range that
+        ended before the current month, or None if there are none.
+        """
+        def month_after(day: date) -> date:
+            return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+        first_day = start_date if start_date.day == 1 else month_after(start_date)
+        if month_after(end_date) - timedelta(days=1) == end_date:
+            last_day = end_date
+        else:
+            last_day = end_date.replace(day=1) - timedelta(days=1)
+        current_month = (today or date.today()).replace(day=1)
+        last_day = min(last_day, current_month - timedelta(days=1))
+        if first_day > last_day:
+            return None
+        return first_day, last_day
+
+    @staticmethod
+    def _time_bucket(dialect: str, group_by: str):
+        """SQL expression rendering Expense.timestamp as a day/week/month key."""
+        ts = models.Expense.timestamp
+        if dialect == "sqlite":
+            if group_by == "day":
+                return func.strftime("%Y-%m-%d", ts)
+            if group_by == "week":
+                # Monday of the ISO week
+                return func.date(ts, "weekday 0", "-6 days")
+            if group_by == "month":
+                return func.strftime("%Y-%m", ts)
+        else:
+            if group_by == "day":
+                return func.to_char(func.date_trunc("day", ts), "YYYY-MM-DD")
+            if group_by == "week":
+                return func.to_char(func.date_trunc("week", ts), "YYYY-MM-DD")
+            if group_by == "month":
+                return func.to_char(func.date_trunc("month", ts), "YYYY-MM")
+        raise ValueError(f"Unsupported group_by: {group_by}")
+
+    @staticmethod
+    def delete_expense(db: Session, expense_id: str, user_id: str,
+                       commit: bool = True) -> Optional[models.Expense]:
         expense = ExpenseCRUD.get_expense(db, expense_id, user_id)
         if expense:
             try:
+                RollupService.apply(db, RollupService.deltas(removed=[RollupService.entry_for(expense)]))
+                DataVersionService.touch(db, user_id, [expense.timestamp])
+                SearchIndex.remove(db, [expense.id])
                 db.delete(expense)
-                db.commit()
+                if commit:
+                    db.commit()
+                else:
+                    db.flush()
             except Exception:
                 db.rollback()
                 raise
@@ -156,27 +648,101 @@ class ExpenseCRUD:
 class TagCRUD:
     @staticmethod
     def _get_or_create_tags(db: Session, tag_names: List[str], user_id: str) -> List[models.Tag]:
-        tag_objects = []
-        for tag_name in tag_names:
-            tag = db.query(models.Tag).filter(
-                models.Tag.name == tag_name,
-                models.Tag.user_id == user_id
-            ).first()
-            if not tag:
-                tag = models.Tag(name=tag_name, user_id=user_id)
-                db.add(tag)
-                # flush to populate relationships if necessary
-                try:
-                    db.flush()
-                except Exception:
-                    db.rollback()
-                    raise
-            tag_objects.append(tag)
-        return tag_objects
+        """
+        Resolve tag names to Tag rows in a constant number of round trips:
+        one SELECT for the existing names, one upsert for the missing ones and
+        one SELECT to pick up the rows inserted here or by a concurrent request.
+        """
+        names = list(dict.fromkeys(tag_names))
+        if not names:
+            return []
+
+        tags = TagCRUD._get_tags_by_name(db, names, user_id)
+        missing = [name for name in names if name not in tags]
+        if missing:
+            try:
+                db.execute(
+                    TagCRUD._insert_ignoring_duplicates(db),
+                    [{"name": name, "user_id": user_id} for name in missing],
+                )
+            except Exception:
+                db.rollback()
+                raise
+            tags.update(TagCRUD._get_tags_by_name(db, missing, user_id))
+        return [tags[name] for name in names]
+
+    @staticmethod
+    def _get_tags_by_name(db: Session, names: List[str], user_id: str) -> dict:
+        rows = db.query(models.Tag).filter(
+            models.Tag.user_id == user_id,
+            models.Tag.name.in_(names)
+        ).all()
+        return {tag.name: tag for tag in rows}
+
+    @staticmethod
+    def _insert_ignoring_duplicates(db: Session):
+        dialect = db.get_bind().dialect.name
+        if dialect == "postgresql":
+            stmt = postgresql.insert(models.Tag)
+        elif dialect == "sqlite":
+            stmt = sqlite.insert(models.Tag)
+        else:
+            return insert(models.Tag)
+        return stmt.on_conflict_do_nothing(index_elements=["user_id", "name"])
+
+    @staticmethod
+    def merge_duplicate_tags(db: Session) -> int:
+        """
+        Collapse tags duplicated per (user_id, name) onto the lowest id so the
+        unique index can be created on databases that predate it.
+        Returns the number of tags removed.
+        """
+        groups = (
+            db.query(models.Tag.user_id, models.Tag.name, func.min(models.Tag.id))
+            .group_by(models.Tag.user_id, models.Tag.name)
+            .having(func.count(models.Tag.id) > 1)
+            .all()
+        )
+        removed = 0
+        for user_id, name, keep_id in groups:
+            duplicate_ids = [
+                tag_id for (tag_id,) in db.query(models.Tag.id).filter(
+                    models.Tag.user_id == user_id,
+                    models.Tag.name == name,
+                    models.Tag.id != keep_id,
+                )
+            ]
+            links = models.expense_tag_table.c
+            expense_ids = {
+                expense_id for (expense_id,) in db.execute(
+                    select(links.expense_id)
+                    .where(links.tag_id.in_(duplicate_ids + [keep_id]))
+                    .distinct()
+                )
+            }
+            db.execute(
+                models.expense_tag_table.delete()
+                .where(links.tag_id.in_(duplicate_ids + [keep_id]))
+            )
+            if expense_ids:
+                db.execute(
+                    models.expense_tag_table.insert(),
+                    [{"expense_id": expense_id, "tag_id": keep_id} for expense_id in expense_ids],
+                )
+            removed += db.query(models.Tag).filter(
+                models.Tag.id.in_(duplicate_ids)
+            ).delete(synchronize_session=False)
+            # The relinked expenses now serialize with the surviving tag
+            DataVersionService.touch(db, user_id, db.scalars(
+                select(models.Expense.timestamp).where(models.Expense.id.in_(expense_ids))
+            ))
+            SearchIndex.sync(db, expense_ids)
+        db.commit()
+        return removed
 
 # Backward compatibility functions
-def create_user(db: Session, user: schemas.UserCreate):
-    return UserCRUD.create_user(db, user)
+def create_user(db: Session, user: schemas.UserCreate, password_hash: Optional[str] = None):
+    return UserCRUD.create_user(db, user, password_hash)
 
 def get_user_by_username(db: Session, username: str):
     return UserCRUD.get_user_by_username(db, username)
@@ -184,26 +750,57 @@ def get_user_by_username(db: Session, username: str):
 def get_user_by_email(db: Session, email: str):
     return UserCRUD.get_user_by_email(db, email)
 
+def registration_conflict(db: Session, username: str, email: str):
+    return UserCRUD.registration_conflict(db, username, email)
+
 def authenticate_user(db: Session, username: str, password: str):
     return UserCRUD.authenticate_user(db, username, password)
 
-def update_user(db: Session, user_id: str, user_data: schemas.UserUpdate):
-    return UserCRUD.update_user(db, user_id, user_data)
+def update_user(db: Session, user_id: str, user_data: schemas.UserUpdate, password_hash: Optional[str] = None):
+    return UserCRUD.update_user(db, user_id, user_data, password_hash)
+
+def set_password_hash(db: Session, user_id: str, password_hash: str):
+    return UserCRUD.set_password_hash(db, user_id, password_hash)
 
 def get_expenses(db: Session, user_id: str):
     return ExpenseCRUD.get_expenses(db, user_id)
 
+def get_expenses_page(db: Session, user_id: str, filters: Optional[schemas.ExpenseFilter] = None,
+                      limit: Optional[int] = None, cursor: Optional[str] = None, order: str = "desc"):
+    return ExpenseCRUD.get_expenses_page(db, user_id, filters, limit, cursor, order)
+
+def get_expense_rows_page(db: Session, user_id: str, filters: Optional[schemas.ExpenseFilter] = None,
+                          limit: Optional[int] = None, cursor: Optional[str] = None, order: str = "desc"):
+    return ExpenseCRUD.get_expense_rows_page(db, user_id, filters, limit, cursor, order)
+
 def get_expense(db: Session, expense_id: str, user_id: str):
     return ExpenseCRUD.get_expense(db, expense_id, user_id)
 
 def create_expense(db: Session, expense: schemas.ExpenseCreate, user_id: str):
     return ExpenseCRUD.create_expense(db, expense, user_id)
 
+def bulk_create_expenses(db: Session, expenses: List[schemas.ExpenseCreate], user_id: str):
+    return ExpenseCRUD.bulk_create_expenses(db, expenses, user_id)
+
 def update_expense(db: Session, expense_id: str, expense_data: schemas.ExpenseCreate, user_id: str):
     return ExpenseCRUD.update_expense(db, expense_id, expense_data, user_id)
 
 def get_expenses_in_range(db: Session, start_date: date, end_date: date, user_id: str):
     return ExpenseCRUD.get_expenses_in_range(db, start_date, end_date, user_id)
 
+def get_expense_rows_in_range(db: Session, start_date: date, end_date: date, user_id: str):
+    return ExpenseCRUD.get_expense_rows_in_range(db, start_date, end_date, user_id)
+
+def search_expense_rows(db: Session, user_id: str, q: str, limit: int, offset: int = 0):
+    return ExpenseCRUD.search_expense_rows(db, user_id, q, limit, offset)
+
+def iter_expense_rows(db: Session, user_id: str, start_date: Optional[date] = None,
+                      end_date: Optional[date] = None, batch_size: int = 1000):
+    return ExpenseCRUD.iter_expense_rows(db, user_id, start_date, end_date, batch_size)
+
+def get_summary(db: Session, user_id: str, group_by: str, start_date: date, end_date: date,
+                expense_type: Optional[str] = None):
+    return ExpenseCRUD.get_summary(db, user_id, group_by, start_date, end_date, expense_type)
+
 def delete_expense(db: Session, expense_id: str, user_id: str):
     return ExpenseCRUD.delete_expense(db, expense_id, user_id)
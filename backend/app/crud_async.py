@@ -0,0 +1,82 @@
+"""
+Async counterparts of the CRUD classes for AsyncSession.
+
+Single-row reads (a user, an expense with its tags) are native async
+queries. List reads and writes run the sync CRUD methods through
+AsyncSession.run_sync: lists reuse the plain-row fast path, and tag
+resolution, rollups and every other write-side invariant stay in one place.
+Write methods return pydantic schemas built inside run_sync, because ORM
+objects cannot lazy-load once control is back on the event loop.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models, schemas
+from .crud import ExpenseCRUD, UserCRUD
+
+
+class AsyncUserCRUD:
+    @staticmethod
+    async def get_user_by_id(db: AsyncSession, user_id: str) -> Optional[models.User]:
+        return await db.scalar(select(models.User).where(models.User.id == user_id))
+
+    @staticmethod
+    async def update_user(db: AsyncSession, user_id: str, user_data: schemas.UserUpdate,
+                          password_hash: Optional[str] = None) -> Optional[schemas.User]:
+        def update(session):
+            user = UserCRUD.update_user(session, user_id, user_data, password_hash)
+            return schemas.User.model_validate(user) if user else None
+        return await db.run_sync(update)
+
+
+class AsyncExpenseCRUD:
+    @staticmethod
+    async def get_expense_rows_page(
+        db: AsyncSession,
+        user_id: str,
+        filters: Optional[schemas.ExpenseFilter] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        order: str = "desc",
+    ) -> Tuple[List[dict], Optional[str]]:
+        return await db.run_sync(
+            lambda session: ExpenseCRUD.get_expense_rows_page(session, user_id, filters, limit, cursor, order)
+        )
+
+    @staticmethod
+    async def get_expense(db: AsyncSession, expense_id: str, user_id: str) -> Optional[models.Expense]:
+        return await db.scalar(
+            select(models.Expense)
+            .options(selectinload(models.Expense.tags))
+            .where(models.Expense.id == expense_id, models.Expense.user_id == user_id)
+        )
+
+    @staticmethod
+    async def create_expense(db: AsyncSession, expense: schemas.ExpenseCreate, user_id: str) -> schemas.Expense:
+        return await db.run_sync(
+            lambda session: schemas.Expense.model_validate(ExpenseCRUD.create_expense(session, expense, user_id))
+        )
+
+    @staticmethod
+    async def update_expense(db: AsyncSession, expense_id: str, expense_data: schemas.ExpenseCreate,
+                             user_id: str) -> Optional[schemas.Expense]:
+        def update(session):
+            expense = ExpenseCRUD.update_expense(session, expense_id, expense_data, user_id)
+            return schemas.Expense.model_validate(expense) if expense else None
+        return await db.run_sync(update)
+
+    @staticmethod
+    async def delete_expense(db: AsyncSession, expense_id: str, user_id: str) -> Optional[schemas.Expense]:
+        def delete(session):
+            expense = ExpenseCRUD.get_expense(session, expense_id, user_id)
+            if expense is None:
+                return None
+            # Serialize before the row (and its tag links) is gone
+            deleted = schemas.Expense.model_validate(expense)
+            ExpenseCRUD.delete_expense(session, expense_id, user_id)
+            return deleted
+        return await db.run_sync(delete)
+
@@ -1,25 +1,253 @@
+import contextvars
+import itertools
 import logging
-from typing import Generator
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import AsyncGenerator, Generator, List, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from app.models import Base
-from app.config import settings
+from app.cache import build_cache
+from app.config import Settings, settings
+from app.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_POOL_OVERFLOW,
+    DB_POOL_TIMEOUTS,
+    DB_POOL_WAITING,
+    DB_REQUEST_QUERIES,
+    DB_REQUEST_SECONDS,
+    DB_REQUEST_SLOWEST_SECONDS,
+    DB_SLOW_QUERIES,
+)
 
 logger = logging.getLogger(__name__)
 
-DATABASE_URL = settings.database_url
 
-connect_args = {}
-if "sqlite" in DATABASE_URL:
-    connect_args = {"check_same_thread": False}
+def build_database_url(config: Settings = settings) -> str:
+    """
+    An explicit DATABASE_URL always wins. Otherwise, with DB_TYPE=postgresql
+    the URL is assembled from the db_host/db_port/db_name/db_user/db_password
+    settings.
+    """
+    if "database_url" in config.model_fields_set or config.db_type not in ("postgresql", "postgres"):
+        return config.database_url
+    return URL.create(
+        "postgresql",
+        username=config.db_user,
+        password=config.db_password or None,
+        host=config.db_host,
+        port=int(config.db_port) if config.db_port else None,
+        database=config.db_name,
+    ).render_as_string(hide_password=False)
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    echo=False
-)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+class _InstrumentedPool:
+    """
+    Pool mixin publishing checkout latency, occupancy, overflow and blocked
+    checkouts under the `pool` label given to instrumented_pool().
+    """
+
+    metrics_label = "primary"
+
+    def _publish(self) -> None:
+        DB_POOL_CHECKED_OUT.labels(self.metrics_label).set(self.checkedout())
+        DB_POOL_OVERFLOW.labels(self.metrics_label).set(max(0, self.overflow()))
+
+    def _do_get(self):
+        # No idle connection and no overflow headroom: this checkout has to wait
+        exhausted = self._max_overflow > -1 and self.checkedout() >= self.size() + self._max_overflow
+        if exhausted:
+            DB_POOL_WAITING.labels(self.metrics_label).inc()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.metrics_label).inc()
+            raise
+        finally:
+            if exhausted:
+                DB_POOL_WAITING.labels(self.metrics_label).dec()
+            DB_POOL_CHECKOUT_SECONDS.labels(self.metrics_label).observe(time.perf_counter() - started)
+            self._publish()
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._publish()
+
+
+def instrumented_pool(base: type, label: str) -> type:
+    """Subclass of `base` (a QueuePool) reporting its metrics as `label`."""
+    return type(f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"metrics_label": label})
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    )
+
+
+def engine_options(url: str, label: str, is_async: bool = False) -> dict:
+    """create_engine/create_async_engine keyword arguments for `url` from the pool settings."""
+    parsed = make_url(url)
+    options = {"echo": False}
+    connect_args = {}
+    if parsed.get_backend_name() == "sqlite" and not is_async:
+        connect_args["check_same_thread"] = False
+    if parsed.get_backend_name() == "postgresql" and settings.db_statement_timeout_ms:
+        if parsed.get_driver_name() == "asyncpg":
+            connect_args["server_settings"] = {"statement_timeout": str(settings.db_statement_timeout_ms)}
+        else:
+            connect_args["options"] = f"-c statement_timeout={settings.db_statement_timeout_ms}"
+    if connect_args:
+        options["connect_args"] = connect_args
+
+    # In-memory SQLite lives in a single connection; keep SQLAlchemy's default pool
+    if not _is_memory_sqlite(parsed):
+        options.update(
+            poolclass=instrumented_pool(AsyncAdaptedQueuePool if is_async else QueuePool, label),
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    return options
+
+
+def sqlite_pragmas(memory: bool = False) -> list:
+    """PRAGMA statements of the SQLite tuning profile; journal and mmap only apply to files."""
+    pragmas = [
+        f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"PRAGMA synchronous={settings.sqlite_synchronous}",
+        f"PRAGMA cache_size=-{settings.sqlite_cache_size_kib}",
+    ]
+    if not memory:
+        pragmas = [
+            f"PRAGMA journal_mode={settings.sqlite_journal_mode}",
+            f"PRAGMA mmap_size={settings.sqlite_mmap_size}",
+        ] + pragmas
+    return pragmas
+
+
+def install_sqlite_pragmas(sync_engine) -> None:
+    """Run the tuning profile on every connection `sync_engine` opens."""
+    pragmas = sqlite_pragmas(memory=_is_memory_sqlite(sync_engine.url))
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+class QueryStats:
+    """SQL statements executed on behalf of one request."""
+
+    __slots__ = ("scope", "count", "seconds", "slowest")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+    @property
+    def route(self) -> str:
+        """Path template of the matched route; the router fills it in before the handler runs."""
+        return getattr(self.scope.get("route"), "path", "unmatched")
+
+
+_query_stats: contextvars.ContextVar = contextvars.ContextVar("query_stats", default=None)
+
+
+def install_query_instrumentation(sync_engine) -> None:
+    """
+    Time every statement `sync_engine` executes: add it to the current
+    request's QueryStats, if any, and log it when slower than SLOW_QUERY_MS.
+    """
+
+    # The start time lives on the execution context, which is discarded with
+    # the statement, so one that raises leaves nothing behind on the connection
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _started(conn, cursor, statement, parameters, context, executemany):
+        context.query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finished(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.query_started
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+            stats.slowest = max(stats.slowest, elapsed)
+        if settings.slow_query_ms and elapsed * 1000 >= settings.slow_query_ms:
+            route = stats.route if stats is not None else "-"
+            DB_SLOW_QUERIES.labels(route).inc()
+            logger.warning(
+                "Slow query (%.1f ms, route %s): %s", elapsed * 1000, route, " ".join(statement.split())[:1000]
+            )
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware collecting the SQL statements of each HTTP request into
+    the db_request_* histograms under its route template, and with
+    SQL_SERVER_TIMING enabled adding them as a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = QueryStats(scope)
+        # Threadpool handlers run in a copy of this context and update the same object
+        token = _query_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.sql_server_timing:
+                timing = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _query_stats.reset(token)
+            route = stats.route
+            DB_REQUEST_QUERIES.labels(route).observe(stats.count)
+            DB_REQUEST_SECONDS.labels(route).observe(stats.seconds)
+            DB_REQUEST_SLOWEST_SECONDS.labels(route).observe(stats.slowest)
+
+
+def make_engine(url: str, label: str):
+    """
+    Sync engine for `url` with the pool settings, query instrumentation and,
+    for SQLite, the tuning profile.
+    """
+    new_engine = create_engine(url, **engine_options(url, label))
+    if new_engine.url.get_backend_name() == "sqlite" and settings.sqlite_pragmas:
+        install_sqlite_pragmas(new_engine)
+    install_query_instrumentation(new_engine)
+    return new_engine
+
+
+DATABASE_URL = build_database_url()
+
+engine = make_engine(DATABASE_URL, "primary")
+
+# Sessions live for one request: objects stay loaded after commit so responses
+# are built from memory instead of re-SELECTing what was just written
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -29,3 +257,132 @@ def get_db() -> Generator[Session, None, None]:
         yield db
     finally:
         db.close()
+
+
+class ReadRouter:
+    """
+    Chooses where a read-only request runs: a replica (round robin) unless the
+    user committed a write within the read-your-writes window, no replica is
+    configured, or every replica is failing. A replica that cannot be reached,
+    or whose query fails (say, a table its schema does not have yet), is
+    skipped for `retry_after` seconds; a failed query is retried on the
+    primary, as is the rest of that session's work.
+    """
+
+    def __init__(self, replica_urls: List[str], window: float, retry_after: float = 30):
+        self.replicas = [
+            sessionmaker(autocommit=False, autoflush=False, bind=make_engine(url, f"replica{i}"))
+            for i, url in enumerate(replica_urls)
+        ]
+        for index, factory in enumerate(self.replicas):
+            event.listen(factory, "do_orm_execute", self._primary_fallback(index))
+        self.retry_after = retry_after
+        self.recent_writes = build_cache("recent-writes", settings.user_cache_size, window)
+        self._down_until = [0.0] * len(self.replicas)
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def mark_write(self, user_id: str) -> None:
+        self.recent_writes.set(user_id, True)
+
+    def _mark_down(self, index: int, error: DBAPIError) -> None:
+        self._down_until[index] = time.monotonic() + self.retry_after
+        logger.warning("Read replica %d unavailable, using the primary: %s", index, error)
+
+    def _primary_fallback(self, index: int):
+        def execute(state):
+            if state.session.info.get("replica_failed"):
+                return state.invoke_statement(bind_arguments={"bind": engine})
+            try:
+                return state.invoke_statement()
+            except DBAPIError as e:
+                state.session.info["replica_failed"] = True
+                self._mark_down(index, e)
+                return state.invoke_statement(bind_arguments={"bind": engine})
+        return execute
+
+    def replica_session(self, user_id: Optional[str]) -> Optional[Session]:
+        """A session on a healthy replica, or None when the read belongs on the primary."""
+        if not self.replicas or user_id is None or self.recent_writes.get(user_id):
+            return None
+
+        with self._lock:
+            start = next(self._turn)
+        for offset in range(len(self.replicas)):
+            index = (start + offset) % len(self.replicas)
+            if self._down_until[index] > time.monotonic():
+                continue
+            db = self.replicas[index]()
+            try:
+                db.connection()
+                return db
+            except DBAPIError as e:
+                db.close()
+                self._mark_down(index, e)
+        return None
+
+
+read_router = ReadRouter(
+    [url.strip() for url in (settings.db_replica_urls or "").split(",") if url.strip()],
+    settings.read_your_writes_seconds,
+    settings.replica_retry_seconds,
+)
+
+
+def note_writer(db: Session, user_id: str) -> None:
+    """Route `user_id`'s reads to the primary once `db` commits."""
+    db.info.setdefault("writers", set()).add(user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_recent_writes(db: Session) -> None:
+    for user_id in db.info.pop("writers", ()):
+        read_router.mark_write(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_writers(db: Session) -> None:
+    db.info.pop("writers", None)
+
+
+# Async drivers used for the async engine, keyed by backend name
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+_async_engine: Optional[AsyncEngine] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+
+
+def to_async_url(url: str) -> str:
+    """Swap the driver of a sync database URL for its async counterpart."""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Lazily create the async engine (aiosqlite for SQLite, asyncpg for Postgres)
+    so the async drivers are only required when ASYNC_ROUTES is enabled.
+    """
+    global _async_engine, _async_session_factory
+    if _async_engine is None:
+        url = settings.async_database_url or to_async_url(DATABASE_URL)
+        _async_engine = create_async_engine(url, **engine_options(url, "async", is_async=True))
+        if _async_engine.url.get_backend_name() == "sqlite" and settings.sqlite_pragmas:
+            install_sqlite_pragmas(_async_engine.sync_engine)
+        install_query_instrumentation(_async_engine.sync_engine)
+        # Objects stay usable after commit; expired attributes cannot lazy-load under asyncio
+        _async_session_factory = async_sessionmaker(_async_engine, expire_on_commit=False)
+    return _async_engine
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Async counterpart of get_db yielding an AsyncSession."""
+    get_async_engine()
+    async with _async_session_factory() as db:
+        yield db
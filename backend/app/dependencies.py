@@ -0,0 +1,125 @@
+"""FastAPI dependencies shared by the sync routes in main.py and the async routes."""
+from typing import Generator, Optional
+
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import auth, schemas
+from app.config import settings
+from app.money import MAX_AMOUNT
+from app.crud import ExpenseCRUD
+from app.crud_async import AsyncUserCRUD
+from app.database import get_async_db, get_db, note_writer, read_router
+
+
+def get_read_db(
+        credentials=Depends(auth.security),
+        primary: Session = Depends(get_db)
+) -> Generator[Session, None, None]:
+    """
+    Session for read-only routes: a read replica when configured, or the
+    primary session while the caller is inside their read-your-writes window.
+    """
+    replica = read_router.replica_session(auth.AuthService.verify_token(credentials.credentials))
+    if replica is None:
+        yield primary
+        return
+    try:
+        yield replica
+    finally:
+        replica.close()
+
+
+def get_current_user_with_db(
+        credentials=Depends(auth.security),
+        db: Session = Depends(get_db)
+) -> schemas.User:
+    """
+    Dependency that returns the authenticated user's identity, cached per subject.
+    Anything this request commits counts as the user's own write for read routing.
+    """
+    identity = auth.AuthService.get_authenticated_identity(db, credentials.credentials)
+    note_writer(db, identity.id)
+    return identity
+
+
+def get_current_user_with_read_db(
+        credentials=Depends(auth.security),
+        db: Session = Depends(get_read_db)
+) -> schemas.User:
+    """get_current_user_with_db for read-only routes, looked up on the read session."""
+    return auth.AuthService.get_authenticated_identity(db, credentials.credentials)
+
+
+def get_current_user_readonly(
+        credentials=Depends(auth.security),
+        db: Session = Depends(get_read_db)
+) -> schemas.User:
+    """
+    Dependency for read-only routes. With TRUST_TOKEN_CLAIMS enabled the identity
+    comes straight from the verified token; otherwise it is looked up like
+    get_current_user_with_db.
+    """
+    if settings.trust_token_claims:
+        identity = auth.AuthService.get_identity_from_claims(credentials.credentials)
+        if identity is not None:
+            return identity
+    return auth.AuthService.get_authenticated_identity(db, credentials.credentials)
+
+
+def get_expense_filters(
+        expense_type: Optional[str] = Query(None, alias="type", description="Only this expense type"),
+        tag: Optional[str] = Query(None, description="Only expenses carrying this tag"),
+        min_amount: Optional[float] = Query(None, allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT,
+                                            description="Minimum amount (inclusive)"),
+        max_amount: Optional[float] = Query(None, allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT,
+                                            description="Maximum amount (inclusive)"),
+        q: Optional[str] = Query(None, description="Case-insensitive title substring"),
+) -> schemas.ExpenseFilter:
+    """Dependency collecting the shared expense filter query parameters."""
+    return schemas.ExpenseFilter(
+        type=expense_type, tag=tag, min_amount=min_amount, max_amount=max_amount, q=q
+    )
+
+
+def get_page_cursor(
+        cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+) -> Optional[str]:
+    """Dependency rejecting a malformed keyset cursor with 400 before any query runs."""
+    if cursor:
+        try:
+            ExpenseCRUD.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return cursor
+
+
+async def get_current_user_async(
+        credentials=Depends(auth.security),
+        db: AsyncSession = Depends(get_async_db)
+) -> schemas.User:
+    """Async counterpart of get_current_user_with_db for the async routes."""
+    user_id = auth.AuthService.verify_token(credentials.credentials)
+    if user_id is None:
+        raise auth.AuthService.credentials_exception()
+    note_writer(db.sync_session, user_id)
+    identity = auth.AuthService.get_cached_identity(user_id)
+    if identity is not None:
+        return identity
+    user = await AsyncUserCRUD.get_user_by_id(db, user_id)
+    if user is None:
+        raise auth.AuthService.credentials_exception()
+    return auth.AuthService.cache_identity(user)
+
+
+async def get_current_user_readonly_async(
+        credentials=Depends(auth.security),
+        db: AsyncSession = Depends(get_async_db)
+) -> schemas.User:
+    """Async counterpart of get_current_user_readonly."""
+    if settings.trust_token_claims:
+        identity = auth.AuthService.get_identity_from_claims(credentials.credentials)
+        if identity is not None:
+            return identity
+    return await get_current_user_async(credentials, db)
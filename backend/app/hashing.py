@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+
+from .auth import pwd_context
+from .config import settings
+from .metrics import (
+    PASSWORD_HASH_PENDING,
+    PASSWORD_HASH_QUEUE_DEPTH,
+    PASSWORD_HASH_REJECTED,
+    PASSWORD_HASH_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class HashingOverloaded(Exception):
+    """Raised when more password jobs are pending than the configured cap."""
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a dedicated bounded pool so login and registration bursts
+    cannot starve the threadpool that serves every other sync route.
+
+    At most `workers` jobs run at once. Once `max_pending` jobs are queued or
+    running, new ones are rejected with HashingOverloaded instead of piling up.
+    """
+
+    def __init__(self, workers: int, max_pending: int, executor: str = "thread"):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    def _set_pending(self, pending: int) -> None:
+        self._pending = pending
+        PASSWORD_HASH_PENDING.set(pending)
+        PASSWORD_HASH_QUEUE_DEPTH.set(max(0, pending - self.workers))
+
+    async def _run(self, operation: str, fn, *args):
+        if self._pending >= self.max_pending:
+            PASSWORD_HASH_REJECTED.inc()
+            raise HashingOverloaded(f"{self._pending} password jobs pending")
+
+        self._set_pending(self._pending + 1)
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._set_pending(self._pending - 1)
+            PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", _hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run("verify", _verify, password, hashed)
+
+    @staticmethod
+    def needs_rehash(hashed: str) -> bool:
+        """True when `hashed` was made with weaker parameters than pwd_context now uses."""
+        return pwd_context.needs_update(hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+    executor=settings.password_hash_executor,
+)
@@ -1,14 +1,28 @@
 import logging
+import math
 from datetime import date, timedelta, datetime
 from typing import Optional
 import os
 
-from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from app import models, schemas, crud, auth
-from app.database import get_db
+from app import models, schemas, crud, auth, bulk, hashing, serialization, versions, writer
+from app.response_cache import cached_json, summary_list
+from app.database import QueryStatsMiddleware, get_db, read_router
+from app.dependencies import (
+    get_current_user_readonly,
+    get_current_user_with_db,
+    get_current_user_with_read_db,
+    get_expense_filters,
+    get_page_cursor,
+    get_read_db,
+)
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -30,7 +44,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+app.add_middleware(QueryStatsMiddleware)
+if settings.profiling_enabled:
+    from app.profiling import ProfilingMiddleware
+
+    app.add_middleware(ProfilingMiddleware)
 
 # ✅ Initialize Prometheus BEFORE startup event (fixes middleware timing error)
 try:
@@ -43,86 +63,172 @@ except Exception as e:
     logger.warning(f"⚠️ Prometheus setup failed: {e}")
 
 
+@app.exception_handler(hashing.HashingOverloaded)
+def password_hashing_overloaded(request: Request, exc: hashing.HashingOverloaded):
+    logger.warning("Rejected %s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many concurrent authentication requests, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
+
+
+def _json_safe(value):
+    """`value` with non-finite floats as strings; JSON has no Infinity or NaN."""
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    return value
+
+
+@app.exception_handler(RequestValidationError)
+def request_validation_error(request: Request, exc: RequestValidationError):
+    """FastAPI's 422 response, which echoes the rejected input, made safe for inputs like Infinity."""
+    return JSONResponse(
+        status_code=422,
+        content={"detail": jsonable_encoder(_json_safe(exc.errors()))},
+    )
+
+
 @app.on_event("startup")
 def startup_event():
     """Initialize database on startup"""
     from app.database import engine
     from app.models import Base
 
-    logger.info(f"Initializing database at {settings.database_url}")
+    # str(URL) masks the password of an assembled Postgres URL
+    logger.info(f"Initializing database at {engine.url}")
 
     # Ensure directory exists (critical for Azure)
-    db_path = settings.database_url.replace("sqlite:///", "")
-    db_dir = os.path.dirname(db_path)
+    db_path = engine.url.database if engine.url.get_backend_name() == "sqlite" else None
+    db_dir = os.path.dirname(db_path) if db_path else None
     if db_dir and not os.path.exists(db_dir):
         os.makedirs(db_dir, exist_ok=True)
         logger.info(f"Created database directory: {db_dir}")
 
     try:
+        from sqlalchemy import inspect
+        from app.migrations import drop_outdated_rollups, drop_outdated_search_index, migrate_amounts, migrate_ids
+        from app.rollup import RollupService
+        from app.search import TABLE as SEARCH_TABLE, SearchIndex
+
+        converted = migrate_amounts(engine)
+        if converted:
+            logger.info(f"Converted {converted} expense amounts to minor units")
+        # Before migrate_ids, which would otherwise copy the old rollup rows
+        if drop_outdated_rollups(engine):
+            logger.info("Dropped outdated expense rollups for rebuilding")
+        if drop_outdated_search_index(engine):
+            logger.info("Dropped outdated search index for rebuilding")
+        converted = migrate_ids(engine)
+        if converted:
+            logger.info(f"Converted ids of {converted} tables to compact UUIDs")
+        inspector = inspect(engine)
+        rollups_missing = not inspector.has_table(models.ExpenseRollup.__tablename__)
+        search_missing = not inspector.has_table(SEARCH_TABLE)
         Base.metadata.create_all(bind=engine)
+        with Session(engine) as db:
+            merged = crud.TagCRUD.merge_duplicate_tags(db)
+            if merged:
+                logger.info(f"Merged {merged} duplicate tags")
+            if rollups_missing or merged:
+                rows = RollupService.rebuild(db)
+                logger.info(f"Rebuilt {rows} expense rollup rows")
+            if search_missing:
+                logger.info(f"Indexed {SearchIndex.rebuild(db)} expenses for search")
+        # create_all skips indexes on tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Failed to initialize database: {e}")
         raise
 
+    if settings.sqlite_single_writer and engine.url.get_backend_name() == "sqlite":
+        from app.database import SessionLocal
+        writer.start(SessionLocal)
+        logger.info("Expense writes go through the single SQLite writer")
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    writer.stop()
+    hashing.password_hasher.shutdown()
 
-def get_current_user_with_db(
-        credentials=Depends(auth.security),
-        db: Session = Depends(get_db)
-) -> models.User:
-    """Dependency that returns authenticated user with database session."""
-    user = auth.AuthService.get_authenticated_user(db, credentials.credentials)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+
+def not_modified(request: Request, response: Response, db: Session, user_id: str) -> Optional[Response]:
+    """
+    Put the user's data-version ETag on `response`, or return a bare 304 when
+    If-None-Match already names it so the caller can skip its query.
+    """
+    headers = versions.conditional_headers(user_id, versions.DataVersionService.get(db, user_id))
+    if versions.etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
 
 
 # --- Auth Routes ---
 @app.post("/register", response_model=schemas.User)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    if crud.get_user_by_username(db, user.username):
-        raise HTTPException(status_code=400, detail="Username already registered")
-    if crud.get_user_by_email(db, user.email):
-        raise HTTPException(status_code=400, detail="Email already registered")
+async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    # Cheap pre-check so duplicate signups never reach bcrypt; the insert's
+    # unique constraints still settle races between concurrent requests
+    conflict = await run_in_threadpool(crud.registration_conflict, db, user.username, user.email)
+    if conflict:
+        raise HTTPException(status_code=400, detail=str(crud.DuplicateUserError(conflict)))
+    password_hash = await hashing.password_hasher.hash(user.password)
     try:
-        return crud.create_user(db, user)
+        created = await run_in_threadpool(crud.create_user, db, user, password_hash)
+    except crud.DuplicateUserError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.exception("Failed to create user: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create user")
+    # The first authenticated reads must not hit a replica that has not seen the user yet
+    read_router.mark_write(created.id)
+    return created
 
 
 @app.post("/login", response_model=schemas.Token)
-def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, user_credentials.username, user_credentials.password)
-    if not user:
+async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(crud.get_user_by_username, db, user_credentials.username)
+    if not user or not await hashing.password_hasher.verify(user_credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if hashing.password_hasher.needs_rehash(user.password_hash):
+        # Upgrade hashes made with an older bcrypt cost while we have the plain password
+        password_hash = await hashing.password_hasher.hash(user_credentials.password)
+        await run_in_threadpool(crud.set_password_hash, db, user.id, password_hash)
     access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
-    access_token = auth.create_access_token(
-        data={"sub": user.id}, expires_delta=access_token_expires
-    )
+    access_token = auth.AuthService.create_user_token(user, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.get("/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(get_current_user_with_db)):
+def read_users_me(current_user: schemas.User = Depends(get_current_user_with_read_db)):
     return current_user
 
 
 @app.put("/me", response_model=schemas.User)
-def update_user_profile(
+async def update_user_profile(
         user_data: schemas.UserUpdate,
-        current_user: models.User = Depends(get_current_user_with_db),
+        current_user: schemas.User = Depends(get_current_user_with_db),
         db: Session = Depends(get_db)
 ):
-    updated_user = crud.update_user(db, current_user.id, user_data)
+    password_hash = None
+    if user_data.password:
+        password_hash = await hashing.password_hasher.hash(user_data.password)
+    try:
+        updated_user = await run_in_threadpool(crud.update_user, db, current_user.id, user_data, password_hash)
+    except crud.DuplicateUserError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
     return updated_user
@@ -131,40 +237,164 @@ def update_user_profile(
 # --- Expense Routes ---
 @app.get("/expenses", response_model=list[schemas.Expense])
 def list_expenses(
-        current_user: models.User = Depends(get_current_user_with_db),
-        db: Session = Depends(get_db)
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit to return everything"),
+        cursor: Optional[str] = Depends(get_page_cursor),
+        order: str = Query("desc", pattern="^(asc|desc)$", description="Sort by timestamp"),
+        filters: schemas.ExpenseFilter = Depends(get_expense_filters),
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
 ):
-    return crud.get_expenses(db, current_user.id)
+    cached = not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
+    expenses, next_cursor = crud.get_expense_rows_page(
+        db, current_user.id, filters, limit=limit, cursor=cursor, order=order
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    # Plain rows encoded directly; same wire format as response_model without per-row validation
+    return Response(serialization.dumps(expenses), media_type="application/json", headers=dict(response.headers))
 
 
 @app.post("/expenses", response_model=schemas.Expense)
 def add_expense(
         expense: schemas.ExpenseCreate,
-        current_user: models.User = Depends(get_current_user_with_db),
+        current_user: schemas.User = Depends(get_current_user_with_db),
         db: Session = Depends(get_db)
 ):
+    if writer.write_queue is not None:
+        return writer.write_queue.run(writer.create_expense_job(expense, current_user.id))
     return crud.create_expense(db, expense, current_user.id)
 
 
+@app.post("/expenses/bulk", response_model=schemas.BulkImportResult)
+async def bulk_add_expenses(
+        request: Request,
+        format: Optional[str] = Query(
+            None, pattern="^(ndjson|csv)$", description="Body format; defaults from Content-Type"
+        ),
+        current_user: schemas.User = Depends(get_current_user_with_db),
+        db: Session = Depends(get_db)
+):
+    """
+    Import expenses from a streamed NDJSON or CSV body. Rows are validated and
+    inserted in chunks; invalid rows are reported without aborting the import.
+    """
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    if format == "csv":
+        rows = bulk.iter_csv_rows(request.stream())
+    else:
+        rows = bulk.iter_ndjson_rows(request.stream())
+    return await bulk.BulkImporter(db, current_user.id).run(rows)
+
+
+@app.get("/expenses/export")
+def export_expenses(
+        format: str = Query("csv", pattern="^(csv|ndjson)$"),
+        start_date: Optional[date] = Query(None, description="Start date YYYY-MM-DD"),
+        end_date: Optional[date] = Query(None, description="End date YYYY-MM-DD"),
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
+):
+    """Stream the user's expenses as CSV or NDJSON without materializing the full list."""
+    rows = crud.iter_expense_rows(
+        db, current_user.id, start_date, end_date, batch_size=settings.export_batch_size
+    )
+    if format == "csv":
+        body, media_type = bulk.iter_csv(rows), "text/csv"
+    else:
+        body, media_type = bulk.iter_ndjson(rows), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="expenses.{format}"'},
+    )
+
+
+@app.get("/expenses/summary", response_model=list[schemas.SummaryBucket])
+def summarize_expenses(
+        response: Response,
+        group_by: str = Query(..., pattern="^(day|week|month|tag|type)$"),
+        start_date: date = Query(..., description="Start date YYYY-MM-DD"),
+        end_date: date = Query(..., description="End date YYYY-MM-DD"),
+        expense_type: Optional[str] = Query(None, alias="type", description="Only this expense type"),
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
+):
+    """Totals, counts and averages per time bucket, tag or type, computed in SQL."""
+    return cached_json(
+        "summary", response, db, current_user.id,
+        {"group_by": group_by, "start": start_date, "end": end_date, "type": expense_type},
+        start_date, end_date,
+        lambda: summary_list.dump_json(
+            crud.get_summary(db, current_user.id, group_by, start_date, end_date, expense_type)
+        ).decode(),
+    )
+
+
+@app.get("/expenses/search", response_model=list[schemas.Expense])
+def search_expenses(
+        response: Response,
+        q: str = Query(..., min_length=1, description="Words to find in titles and tag names; prefixes match"),
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = Query(None, description="Value of X-Next-Cursor from the previous page"),
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
+):
+    """Expenses matching every word of `q`, best match first."""
+    try:
+        offset = int(cursor) if cursor else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Fetch one extra row to find out whether another page exists
+    rows = crud.search_expense_rows(db, current_user.id, q, limit + 1, offset)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(offset + limit)
+    return Response(serialization.dumps(rows), media_type="application/json", headers=dict(response.headers))
+
+
 @app.get("/expenses/range", response_model=list[schemas.Expense])
 def list_expenses_in_range(
+        request: Request,
+        response: Response,
         start_date: date = Query(..., description="Start date YYYY-MM-DD"),
         end_date: date = Query(..., description="End date YYYY-MM-DD"),
-        current_user: models.User = Depends(get_current_user_with_db),
-        db: Session = Depends(get_db)
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
 ):
-    return crud.get_expenses_in_range(db, start_date, end_date, current_user.id)
+    cached = not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
+    return cached_json(
+        "range", response, db, current_user.id, {"start": start_date, "end": end_date},
+        start_date, end_date,
+        lambda: serialization.dumps(
+            crud.get_expense_rows_in_range(db, start_date, end_date, current_user.id)
+        ).decode(),
+    )
 
 
 @app.get("/expenses/{expense_id}", response_model=schemas.Expense)
 def get_expense(
         expense_id: str,
-        current_user: models.User = Depends(get_current_user_with_db),
-        db: Session = Depends(get_db)
+        request: Request,
+        response: Response,
+        current_user: schemas.User = Depends(get_current_user_readonly),
+        db: Session = Depends(get_read_db)
 ):
+    # Existence first: the ETag covers all of the user's data, so it would also match a missing id
     expense = crud.get_expense(db, expense_id, current_user.id)
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
+    cached = not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
     return expense
 
 
@@ -172,10 +402,13 @@ def get_expense(
 def update_expense(
         expense_id: str,
         expense: schemas.ExpenseCreate,
-        current_user: models.User = Depends(get_current_user_with_db),
+        current_user: schemas.User = Depends(get_current_user_with_db),
         db: Session = Depends(get_db)
 ):
-    updated = crud.update_expense(db, expense_id, expense, current_user.id)
+    if writer.write_queue is not None:
+        updated = writer.write_queue.run(writer.update_expense_job(expense_id, expense, current_user.id))
+    else:
+        updated = crud.update_expense(db, expense_id, expense, current_user.id)
     if not updated:
         raise HTTPException(status_code=404, detail="Expense not found")
     return updated
@@ -184,15 +417,24 @@ def update_expense(
 @app.delete("/expenses/{expense_id}", response_model=schemas.Expense)
 def delete_expense(
         expense_id: str,
-        current_user: models.User = Depends(get_current_user_with_db),
+        current_user: schemas.User = Depends(get_current_user_with_db),
         db: Session = Depends(get_db)
 ):
-    deleted = crud.delete_expense(db, expense_id, current_user.id)
+    if writer.write_queue is not None:
+        deleted = writer.write_queue.run(writer.delete_expense_job(expense_id, current_user.id))
+    else:
+        deleted = crud.delete_expense(db, expense_id, current_user.id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Expense not found")
     return deleted
 
 
+if settings.async_routes:
+    from app import routes_async
+    routes_async.install(app)
+    logger.info("Serving core user and expense routes from async handlers")
+
+
 # --- Health check ---
 @app.get("/health", tags=["Health"])
 def health(db: Session = Depends(get_db), full: Optional[bool] = Query(False)):
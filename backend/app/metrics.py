@@ -0,0 +1,108 @@
+"""
+Application metrics registered with prometheus_client, which the existing
+/metrics endpoint exposes. prometheus_client is optional, so when it is not
+installed every metric is a no-op stand-in with the same interface.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    Counter = Gauge = Histogram = None
+    logger.info("prometheus_client not installed, application metrics disabled")
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs) -> "_NoopMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+
+def counter(name: str, documentation: str, labelnames=()):
+    return Counter(name, documentation, labelnames) if Counter else _NoopMetric()
+
+
+def gauge(name: str, documentation: str, labelnames=()):
+    return Gauge(name, documentation, labelnames) if Gauge else _NoopMetric()
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=None):
+    if Histogram is None:
+        return _NoopMetric()
+    if buckets is None:
+        return Histogram(name, documentation, labelnames)
+    return Histogram(name, documentation, labelnames, buckets=buckets)
+
+
+# Password hashing pool (app.hashing)
+PASSWORD_HASH_PENDING = gauge(
+    "password_hash_pending", "Password hash/verify jobs queued or running"
+)
+PASSWORD_HASH_QUEUE_DEPTH = gauge(
+    "password_hash_queue_depth", "Password hash/verify jobs waiting for a free worker"
+)
+PASSWORD_HASH_REJECTED = counter(
+    "password_hash_rejected_total", "Password hash/verify jobs rejected because the queue was full"
+)
+PASSWORD_HASH_SECONDS = histogram(
+    "password_hash_seconds", "Time from submitting a password job to its result", ["operation"]
+)
+
+# Database connection pools (app.database), labelled by pool
+DB_POOL_CHECKED_OUT = gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool", ["pool"]
+)
+DB_POOL_OVERFLOW = gauge(
+    "db_pool_overflow", "Checked-out connections beyond pool_size", ["pool"]
+)
+DB_POOL_WAITING = gauge(
+    "db_pool_waiting", "Checkouts blocked because every connection is in use", ["pool"]
+)
+DB_POOL_TIMEOUTS = counter(
+    "db_pool_timeouts_total", "Checkouts that gave up after pool_timeout", ["pool"]
+)
+DB_POOL_CHECKOUT_SECONDS = histogram(
+    "db_pool_checkout_seconds", "Time to obtain a connection from the pool", ["pool"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+# Response cache for range and summary reads (app.response_cache)
+RESPONSE_CACHE_REQUESTS = counter(
+    "response_cache_requests_total", "Response cache lookups by route and result (hit/miss)", ["route", "result"]
+)
+RESPONSE_CACHE_EVICTIONS = counter(
+    "response_cache_evictions_total", "Responses evicted from the in-process cache to stay under its byte budget"
+)
+RESPONSE_CACHE_BYTES = gauge(
+    "response_cache_bytes", "Bytes held by the in-process response cache"
+)
+
+# SQL executed per HTTP request (app.database), labelled by route template
+DB_REQUEST_QUERIES = histogram(
+    "db_request_queries", "SQL statements executed while handling a request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 200, 500),
+)
+DB_REQUEST_SECONDS = histogram(
+    "db_request_seconds", "Total time spent executing SQL while handling a request", ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_REQUEST_SLOWEST_SECONDS = histogram(
+    "db_request_slowest_query_seconds", "Slowest single SQL statement of a request", ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_SLOW_QUERIES = counter(
+    "db_slow_queries_total", "SQL statements slower than SLOW_QUERY_MS", ["route"]
+)
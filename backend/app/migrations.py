@@ -0,0 +1,299 @@
+"""
+In-place schema migrations for databases created by older releases.
+
+migrate_amounts moves expenses from the float `amount` column to integer
+minor units (`amount_minor`) plus a `currency` code:
+
+1. add `amount_minor` (nullable while it fills) and `currency` columns;
+2. convert rows in primary-key order, `batch_size` at a time, committing each
+   batch so memory and lock time stay bounded and an interrupted run resumes
+   where it stopped. Amounts that have no fixed-point value (NaN, infinity,
+   NULL, beyond BIGINT) are stored as 0 and logged with their id;
+3. drop `amount` and make `amount_minor` NOT NULL. Postgres alters the
+   columns; SQLite, which cannot, rebuilds the table without `amount` and
+   copies the rows over in one transaction;
+4. drop an `expense_rollups` table that still has float totals, so startup
+   recreates and rebuilds it in minor units.
+
+migrate_ids moves the users/expenses/tags keys and every column referencing
+them from 36-character text to models.CompactUUID (16 bytes, native UUID on
+Postgres). Existing ids keep their value, so tokens and links stay valid;
+rollup tag keys, which are stored as text, need no change. The search index
+is dropped and rebuilt by startup.
+
+* SQLite cannot change a column type, so each table is renamed aside,
+  recreated and copied `batch_size` rows at a time, all in one transaction:
+  an interrupted run leaves the old schema untouched.
+* Postgres converts in place with ALTER COLUMN ... TYPE uuid, dropping and
+  re-adding the foreign keys around it.
+
+drop_outdated_rollups drops an `expense_rollups` table without the
+`currency` key column, and drop_outdated_search_index an SQLite search index
+whose documents are keyed by an `expense_id` column rather than by rowid;
+both are derived data, so startup simply rebuilds them.
+
+All four run at startup before create_all and do nothing on an up-to-date schema.
+Run them by hand with `python -m app.migrations`.
+"""
+import argparse
+import logging
+import math
+import re
+import sys
+from typing import List, Optional
+
+from sqlalchemy import (
+    Column, ForeignKey, Index, MetaData, String, Table, insert, inspect, literal_column, select, text,
+)
+from sqlalchemy.engine import Connection, Engine
+
+from . import models
+from .config import settings
+from .money import MAX_MINOR, to_minor
+from .search import KEYS_TABLE as SEARCH_KEYS_TABLE, TABLE as SEARCH_TABLE
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(engine: Engine, table: str) -> set:
+    return {column["name"] for column in inspect(engine).get_columns(table)}
+
+
+def _amount_minor(expense_id: str, amount) -> int:
+    """to_minor(amount), or 0 (logged) for amounts that have no fixed-point value."""
+    if amount is not None and math.isfinite(amount):
+        minor = to_minor(amount)
+        if abs(minor) <= MAX_MINOR:
+            return minor
+    logger.warning("Expense %s has amount %r, which cannot be stored in minor units; storing 0", expense_id, amount)
+    return 0
+
+
+def migrate_amounts(engine: Engine, batch_size: int = 1000) -> int:
+    """Convert float amounts to minor units. Returns the number of expenses converted."""
+    if not inspect(engine).has_table("expenses") or "amount" not in _columns(engine, "expenses"):
+        return 0
+    if not re.fullmatch(r"[A-Z]{3}", settings.default_currency):
+        raise ValueError(f"DEFAULT_CURRENCY must be an ISO 4217 code, got {settings.default_currency!r}")
+
+    columns = _columns(engine, "expenses")
+    with engine.begin() as conn:
+        if "amount_minor" not in columns:
+            conn.execute(text("ALTER TABLE expenses ADD COLUMN amount_minor BIGINT"))
+        if "currency" not in columns:
+            conn.execute(text(
+                f"ALTER TABLE expenses ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT '{settings.default_currency}'"
+            ))
+
+    converted = 0
+    last_id = ""
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text("SELECT id, amount FROM expenses WHERE id > :last_id AND amount_minor IS NULL "
+                     "ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size},
+            ).all()
+            if not rows:
+                break
+            conn.execute(
+                text("UPDATE expenses SET amount_minor = :amount_minor WHERE id = :id"),
+                [{"id": row.id, "amount_minor": _amount_minor(row.id, row.amount)} for row in rows],
+            )
+        converted += len(rows)
+        last_id = rows[-1].id
+        logger.info("Converted %d expense amounts to minor units", converted)
+
+    if engine.dialect.name == "sqlite":
+        _rebuild_expenses_without_amount(engine)
+    with engine.begin() as conn:
+        if engine.dialect.name != "sqlite":
+            conn.execute(text("ALTER TABLE expenses ALTER COLUMN amount_minor SET NOT NULL"))
+            conn.execute(text("ALTER TABLE expenses DROP COLUMN amount"))
+    drop_outdated_rollups(engine)
+    return converted
+
+
+def drop_outdated_rollups(engine: Engine) -> bool:
+    """
+    Drop an `expense_rollups` table that predates the current one (float
+    totals, or no currency column) so startup recreates and rebuilds it.
+    Returns whether it was dropped.
+    """
+    if not inspect(engine).has_table("expense_rollups"):
+        return False
+    columns = _columns(engine, "expense_rollups")
+    if "total_minor" in columns and "currency" in columns:
+        return False
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE expense_rollups"))
+    return True
+
+
+def drop_outdated_search_index(engine: Engine) -> bool:
+    """
+    Drop an SQLite `expense_search` index that stores expense ids in the FTS5
+    table itself, which makes every re-index scan it, so startup recreates and
+    rebuilds it. Returns whether it was dropped.
+    """
+    if engine.dialect.name != "sqlite" or not inspect(engine).has_table(SEARCH_TABLE):
+        return False
+    if "expense_id" not in _columns(engine, SEARCH_TABLE):
+        return False
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE {SEARCH_TABLE}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_KEYS_TABLE}"))
+    return True
+
+
+def _rebuild_expenses_without_amount(engine: Engine) -> None:
+    """
+    Recreate the SQLite expenses table as it is minus `amount` and with
+    `amount_minor` NOT NULL, keeping every other column, foreign key and index.
+    """
+    with engine.connect() as conn:
+        # Dropping a referenced table with foreign keys enforced would count its
+        # rows as violations even though the rebuilt table takes its place, and
+        # the setting cannot change inside a transaction
+        foreign_keys = conn.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        conn.exec_driver_sql("PRAGMA foreign_keys = OFF")
+        conn.commit()
+        try:
+            with conn.begin():
+                # pysqlite only opens a transaction before DML; the DDL must be part of it too
+                conn.exec_driver_sql("BEGIN")
+                _copy_expenses_without_amount(conn)
+        finally:
+            conn.exec_driver_sql(f"PRAGMA foreign_keys = {int(foreign_keys)}")
+            conn.commit()
+
+
+def _copy_expenses_without_amount(conn: Connection) -> None:
+    metadata = MetaData()
+    old = Table("expenses", metadata, autoload_with=conn)
+    columns = [column for column in old.columns if column.name != "amount"]
+    new = Table("expenses_new", metadata, *(
+        Column(
+            column.name, column.type, *(ForeignKey(fk.target_fullname) for fk in column.foreign_keys),
+            primary_key=column.primary_key,
+            nullable=column.nullable and column.name != "amount_minor",
+            server_default=column.server_default.arg if column.server_default is not None else None,
+        )
+        for column in columns
+    ))
+    new.create(conn)
+    conn.execute(insert(new).from_select([column.name for column in columns], select(*columns)))
+    # Index names are database-wide, so the old ones go before the copies are made
+    for index in old.indexes:
+        conn.execute(text(f'DROP INDEX "{index.name}"'))
+        names = [column.name for column in index.columns]
+        if "amount" not in names:
+            Index(index.name, *(new.c[name] for name in names), unique=index.unique).create(conn)
+    conn.execute(text("DROP TABLE expenses"))
+    conn.execute(text("ALTER TABLE expenses_new RENAME TO expenses"))
+
+
+def _id_tables(names: set) -> List[Table]:
+    """Existing tables with CompactUUID columns, parents first."""
+    return [
+        table for table in models.Base.metadata.sorted_tables
+        if table.name in names and any(isinstance(column.type, models.CompactUUID) for column in table.columns)
+    ]
+
+
+def migrate_ids(engine: Engine, batch_size: int = 1000) -> int:
+    """Convert text UUID keys to compact ones. Returns the number of tables converted."""
+    inspector = inspect(engine)
+    if not inspector.has_table("users"):
+        return 0
+    id_type = next(column["type"] for column in inspector.get_columns("users") if column["name"] == "id")
+    if not isinstance(id_type, String):
+        return 0
+
+    tables = _id_tables(set(inspector.get_table_names()))
+    with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # pysqlite only opens a transaction before DML; the DDL must be part of it too
+            conn.exec_driver_sql("BEGIN")
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {SEARCH_KEYS_TABLE}"))
+        if engine.dialect.name == "postgresql":
+            _alter_id_columns(conn, tables)
+        else:
+            _copy_id_tables(conn, tables, batch_size)
+    return len(tables)
+
+
+def _alter_id_columns(conn: Connection, tables: List[Table]) -> None:
+    inspector = inspect(conn)
+    foreign_keys = [(table.name, fk) for table in tables for fk in inspector.get_foreign_keys(table.name)]
+    for table_name, fk in foreign_keys:
+        conn.execute(text(f'ALTER TABLE "{table_name}" DROP CONSTRAINT "{fk["name"]}"'))
+    for table in tables:
+        for column in table.columns:
+            if isinstance(column.type, models.CompactUUID):
+                conn.execute(text(
+                    f'ALTER TABLE "{table.name}" ALTER COLUMN "{column.name}" TYPE UUID USING "{column.name}"::uuid'
+                ))
+    for table_name, fk in foreign_keys:
+        columns = ", ".join(f'"{name}"' for name in fk["constrained_columns"])
+        referred = ", ".join(f'"{name}"' for name in fk["referred_columns"])
+        conn.execute(text(
+            f'ALTER TABLE "{table_name}" ADD CONSTRAINT "{fk["name"]}" '
+            f'FOREIGN KEY ({columns}) REFERENCES "{fk["referred_table"]}" ({referred})'
+        ))
+
+
+def _copy_id_tables(conn: Connection, tables: List[Table], batch_size: int) -> None:
+    inspector = inspect(conn)
+    old_tables = []
+    for table in tables:
+        # Index names are database-wide; the recreated table brings its own
+        for index in inspector.get_indexes(table.name):
+            conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{table.name}_old"'))
+        # The old rows read with the new column types, except ids which are still text
+        old_tables.append(Table(f"{table.name}_old", MetaData(), *(
+            Column(column.name, String if isinstance(column.type, models.CompactUUID) else column.type)
+            for column in table.columns if column.name in existing
+        )))
+
+    rowid = literal_column("rowid")
+    for table, old in zip(tables, old_tables):
+        table.create(conn)
+        last_rowid = 0
+        while True:
+            rows = conn.execute(
+                select(rowid, *old.columns).where(rowid > last_rowid).order_by(rowid).limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            conn.execute(insert(table), [{column.name: row._mapping[column.name] for column in old.columns}
+                                         for row in rows])
+            last_rowid = rows[-1].rowid
+        logger.info("Copied %s with compact ids", table.name)
+    for old in reversed(old_tables):
+        conn.execute(text(f'DROP TABLE "{old.name}"'))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Migrate the database schema in place")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows converted per transaction")
+    args = parser.parse_args(argv)
+
+    from .database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    converted = migrate_amounts(engine, args.batch_size)
+    logger.info("Migrated %d expenses", converted)
+    if drop_outdated_rollups(engine):
+        logger.info("Dropped outdated expense rollups; they are rebuilt at startup")
+    if drop_outdated_search_index(engine):
+        logger.info("Dropped outdated search index; it is rebuilt at startup")
+    logger.info("Converted ids of %d tables", migrate_ids(engine, args.batch_size))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,59 @@
-from sqlalchemy import Column, String, Float, DateTime, Table, ForeignKey
+from sqlalchemy import BigInteger, Column, LargeBinary, String, Integer, DateTime, Table, ForeignKey, Index
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, DeclarativeBase
+from sqlalchemy.types import TypeDecorator
+import os
+import time
 import uuid
 from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.money import MINOR_PER_UNIT, from_minor, to_minor
+
+
+def new_id() -> str:
+    """
+    Primary key generator shared by the models and bulk inserts: a UUIDv7,
+    whose leading 48 bits are the Unix time in milliseconds, so new rows land
+    at the right-hand edge of primary-key and foreign-key indexes.
+    """
+    value = (time.time_ns() // 1_000_000) << 80 | int.from_bytes(os.urandom(10), "big")
+    # Version 7 in bits 76-79, RFC 4122 variant in bits 62-63
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return str(uuid.UUID(int=value))
+
+
+class CompactUUID(TypeDecorator):
+    """
+    UUID key stored as native UUID on Postgres and as 16 raw bytes elsewhere,
+    instead of 36 characters of text. Python code keeps seeing canonical
+    strings. Strings that are not UUIDs bind as NULL, which matches no row, so
+    looking up a malformed id behaves like looking up a missing one.
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return dialect.type_descriptor(postgresql.UUID(as_uuid=False))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect) -> Optional[object]:
+        if value is None:
+            return None
+        try:
+            parsed = value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+        except ValueError:
+            return None
+        return str(parsed) if dialect.name == "postgresql" else parsed.bytes
+
+    def process_result_value(self, value, dialect) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+        return str(uuid.UUID(bytes=bytes(value)))
 
 
 class Base(DeclarativeBase):
@@ -12,14 +64,14 @@ class Base(DeclarativeBase):
 expense_tag_table = Table(
     "expense_tags",
     Base.metadata,
-    Column("expense_id", String, ForeignKey("expenses.id")),
-    Column("tag_id", String, ForeignKey("tags.id"))
+    Column("expense_id", CompactUUID, ForeignKey("expenses.id"), index=True),
+    Column("tag_id", CompactUUID, ForeignKey("tags.id"), index=True)
 )
 
 
 class User(Base):
     __tablename__ = "users"
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(CompactUUID, primary_key=True, default=new_id)
     username = Column(String, unique=True, nullable=False)
     email = Column(String, unique=True, nullable=False)
     password_hash = Column(String, nullable=False)
@@ -29,19 +81,83 @@ class User(Base):
 
 class Expense(Base):
     __tablename__ = "expenses"
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(CompactUUID, primary_key=True, default=new_id)
     title = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    # Fixed-point amount in minor units (cents); `amount` is the float view the API uses
+    amount_minor = Column(BigInteger, nullable=False)
+    currency = Column(String(3), nullable=False, default=lambda: settings.default_currency)
     timestamp = Column(DateTime, default=datetime.utcnow)
     type = Column(String, default="expense")
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    user_id = Column(CompactUUID, ForeignKey("users.id"), nullable=False)
     user = relationship("User", back_populates="expenses")
     tags = relationship("Tag", secondary=expense_tag_table, back_populates="expenses")
 
+    @hybrid_property
+    def amount(self) -> float:
+        return from_minor(self.amount_minor)
+
+    @amount.inplace.setter
+    def _amount_setter(self, value) -> None:
+        self.amount_minor = to_minor(value)
+
+    @amount.inplace.expression
+    @classmethod
+    def _amount_expression(cls):
+        return cls.amount_minor / MINOR_PER_UNIT
+
+    __table_args__ = (
+        # Keyset pages, date ranges, export and summaries walk one user's rows in (timestamp, id) order
+        Index("ix_expenses_user_ts_id", "user_id", "timestamp", "id"),
+        # Amount range filters (min_amount/max_amount) within one user's expenses
+        Index("ix_expenses_user_amount", "user_id", "amount_minor"),
+    )
+
 
 class Tag(Base):
     __tablename__ = "tags"
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(CompactUUID, primary_key=True, default=new_id)
     name = Column(String, nullable=False)
-    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    user_id = Column(CompactUUID, ForeignKey("users.id"), nullable=False)
     expenses = relationship("Expense", secondary=expense_tag_table, back_populates="tags")
+
+    __table_args__ = (
+        # Lets TagCRUD upsert tags by name without racing into duplicates
+        Index("uq_tags_user_name", "user_id", "name", unique=True),
+    )
+
+
+class ExpenseRollup(Base):
+    """
+    Pre-aggregated totals per user, month and type, maintained by ExpenseCRUD.
+    `tag_key` is a tag id, or one of the sentinels in app.rollup for the
+    all-tags total and for untagged expenses. Each currency has its own rows.
+    """
+    __tablename__ = "expense_rollups"
+    user_id = Column(CompactUUID, ForeignKey("users.id"), primary_key=True)
+    month = Column(String, primary_key=True)
+    type = Column(String, primary_key=True)
+    tag_key = Column(String, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    total_minor = Column(BigInteger, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class UserDataVersion(Base):
+    """
+    Counter bumped in the same transaction as every change to a user's
+    expenses; used as the validator for conditional GETs.
+    """
+    __tablename__ = "user_data_versions"
+    user_id = Column(CompactUUID, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class ExpenseMonthVersion(Base):
+    """
+    Counter per user and calendar month ("YYYY-MM"), bumped whenever an
+    expense in that month changes; keys cached range and summary responses.
+    """
+    __tablename__ = "expense_month_versions"
+    user_id = Column(CompactUUID, ForeignKey("users.id"), primary_key=True)
+    month = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
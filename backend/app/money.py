@@ -0,0 +1,28 @@
+"""
+Fixed-point money helpers.
+
+Amounts are stored as integers of minor units (cents), so sums and range
+filters are exact. The API keeps exchanging amounts as JSON numbers; inputs
+are rounded half-up to the nearest cent via their decimal representation,
+so 0.1 + 0.2 style float noise never reaches the database.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Union
+
+# Minor units per major unit; every supported currency uses two decimals
+MINOR_PER_UNIT = 100
+# Range of the BIGINT column minor units are stored in, and the (exclusive)
+# bound on major-unit amounts that fit it
+MAX_MINOR = 2 ** 63 - 1
+MAX_AMOUNT = MAX_MINOR / MINOR_PER_UNIT
+_CENT = Decimal("0.01")
+
+
+def to_minor(amount: Union[float, int, str, Decimal]) -> int:
+    """Major-unit amount (e.g. 12.5) to minor units (1250)."""
+    return int(Decimal(str(amount)).quantize(_CENT, rounding=ROUND_HALF_UP) * MINOR_PER_UNIT)
+
+
+def from_minor(minor: int) -> float:
+    """Minor units back to the float the API returns; exact to the cent."""
+    return int(minor) / MINOR_PER_UNIT
@@ -0,0 +1,148 @@
+"""
+Opt-in request profiler for production.
+
+With PROFILING_ENABLED, ProfilingMiddleware profiles a random
+PROFILING_SAMPLE_RATE fraction of requests, plus every request whose
+X-Profile header matches PROFILING_TOKEN. Such a request is told where its
+profile went in an X-Profile-File response header. When profiling is
+disabled the middleware is not installed at all.
+
+Profiles come from a stdlib sampling profiler: while the request runs, a
+background thread records the stack of every other thread each
+PROFILING_INTERVAL_MS. That covers the event loop as well as the threadpool
+running sync handlers, but also whatever else the process is doing
+concurrently; each stack is rooted at its thread name so they can be told
+apart. Output is one "frame;frame;frame count" line per distinct stack
+(folded format) in PROFILING_DIR, which flamegraph.pl, speedscope and
+inferno read directly. Only one request is profiled at a time, and only the
+newest PROFILING_MAX_FILES profiles are kept.
+"""
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = b"x-profile"
+_UNSAFE = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def fold(frame, root: str) -> str:
+    """One folded stack, outermost frame first, rooted at `root`."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(root)
+    return ";".join(reversed(frames))
+
+
+class StackSampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.samples[fold(frame, names.get(thread_id, str(thread_id)))] += 1
+
+
+def write_folded(samples: Counter, path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as out:
+        for stack, count in samples.most_common():
+            out.write(f"{stack} {count}\n")
+
+
+def prune(directory: str, max_files: int) -> int:
+    """Delete all but the newest `max_files` profiles in `directory`. Returns the number deleted."""
+    if max_files <= 0:
+        return 0
+    with os.scandir(directory) as entries:
+        profiles = [entry for entry in entries if entry.is_file() and entry.name.endswith(".folded")]
+    profiles.sort(key=lambda entry: (entry.stat().st_mtime, entry.name))
+    deleted = 0
+    for entry in profiles[:-max_files]:
+        try:
+            os.remove(entry.path)
+            deleted += 1
+        except FileNotFoundError:
+            pass  # another worker pruned it first
+    return deleted
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, directory: Optional[str] = None, sample_rate: Optional[float] = None,
+                 token: Optional[str] = None, interval_ms: Optional[float] = None,
+                 max_files: Optional[int] = None):
+        self.app = app
+        self.directory = directory or settings.profiling_dir
+        self.sample_rate = settings.profiling_sample_rate if sample_rate is None else sample_rate
+        self.token = (token or settings.profiling_token or "").encode()
+        self.interval = (interval_ms or settings.profiling_interval_ms) / 1000
+        self.max_files = settings.profiling_max_files if max_files is None else max_files
+        self._busy = threading.Lock()
+
+    def _requested(self, scope) -> bool:
+        if not self.token:
+            return False
+        value = next((value for name, value in scope["headers"] if name == HEADER), None)
+        return value is not None and hmac.compare_digest(value, self.token)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        requested = self._requested(scope)
+        if not (requested or random.random() < self.sample_rate) or not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        name = _UNSAFE.sub("_", f"{int(time.time() * 1000)}-{scope['method']}-{scope['path']}").strip("_")
+        path = os.path.join(self.directory, f"{name}.folded")
+
+        async def send_with_file(message):
+            if requested and message["type"] == "http.response.start":
+                header = (b"x-profile-file", os.path.basename(path).encode())
+                message["headers"] = [*message.get("headers", []), header]
+            await send(message)
+
+        sampler = StackSampler(self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_file)
+        finally:
+            samples = sampler.stop()
+            self._busy.release()
+            await run_in_threadpool(self._save, samples, path)
+            logger.info("Profiled %s %s (%.1f ms, %d samples) to %s", scope["method"], scope["path"],
+                        (time.perf_counter() - started) * 1000, sum(samples.values()), path)
+
+    def _save(self, samples: Counter, path: str) -> None:
+        write_folded(samples, path)
+        prune(self.directory, self.max_files)
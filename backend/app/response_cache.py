@@ -0,0 +1,87 @@
+"""
+Cache of serialized GET /expenses/range and /expenses/summary responses.
+
+Keys combine the user, the route, its normalized query parameters and the
+versions of every month the requested range covers (see app.versions). A
+write bumps only the months it touches, so it changes the keys of exactly the
+cached responses that could include it while every other entry keeps hitting.
+Superseded entries are never read again and age out through the LRU or TTL.
+
+Entries live in a byte-bounded in-process LRU, or in Redis when CACHE_URL is
+set so that all workers share them.
+"""
+import hashlib
+import logging
+from datetime import date
+from typing import Callable, Dict, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from . import schemas, versions
+from .cache import RedisCache, SizedLRUCache
+from .config import settings
+from .metrics import RESPONSE_CACHE_BYTES, RESPONSE_CACHE_EVICTIONS, RESPONSE_CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+summary_list = TypeAdapter(list[schemas.SummaryBucket])
+
+
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def key(route: str, user_id: str, params: dict, month_versions: Dict[str, int]) -> str:
+        normalized = "&".join(f"{name}={value}" for name, value in sorted(params.items()) if value is not None)
+        versions = ",".join(f"{month}:{version}" for month, version in sorted(month_versions.items()))
+        digest = hashlib.sha256(f"{normalized}|{versions}".encode()).hexdigest()[:32]
+        return f"{route}:{user_id}:{digest}"
+
+    def get(self, route: str, key: str) -> Optional[str]:
+        if self.backend is None:
+            return None
+        body = self.backend.get(key)
+        RESPONSE_CACHE_REQUESTS.labels(route, "miss" if body is None else "hit").inc()
+        return body
+
+    def set(self, key: str, body: str) -> None:
+        if self.backend is None:
+            return
+        self.backend.set(key, body)
+
+
+def build_response_cache() -> ResponseCache:
+    if settings.response_cache_bytes <= 0:
+        return ResponseCache(None)
+    ttl = settings.response_cache_ttl_seconds
+    if settings.cache_url:
+        try:
+            return ResponseCache(RedisCache(settings.cache_url, "responses", ttl))
+        except ImportError:
+            logger.warning("CACHE_URL is set but redis is not installed, using in-process response cache")
+    return ResponseCache(SizedLRUCache(
+        settings.response_cache_bytes, ttl, on_evict=RESPONSE_CACHE_EVICTIONS.inc, on_resize=RESPONSE_CACHE_BYTES.set
+    ))
+
+
+response_cache = build_response_cache()
+
+
+def cached_json(route: str, response: Response, db: Session, user_id: str, params: dict,
+                start_date: date, end_date: date, compute: Callable[[], str]) -> Response:
+    """
+    Serve the JSON body produced by `compute()` from the response cache, keyed
+    by the versions of the months between the two dates. Headers already set
+    on `response` are carried over. Shared by the sync and async routes; the
+    async ones call it inside AsyncSession.run_sync.
+    """
+    month_versions = versions.DataVersionService.month_versions(db, user_id, start_date, end_date)
+    key = response_cache.key(route, user_id, params, month_versions)
+    body = response_cache.get(route, key)
+    if body is None:
+        body = compute()
+        response_cache.set(key, body)
+    return Response(content=body, media_type="application/json", headers=dict(response.headers))
@@ -0,0 +1,261 @@
+"""
+Incrementally maintained monthly rollups of expenses.
+
+Every expense contributes its amount to two kinds of `expense_rollups` rows
+for its (user, month, type, currency): the ALL_TAGS row, and either one row
+per tag or the UNTAGGED row. Month and type totals therefore read only
+ALL_TAGS rows, and tag totals read everything else, without double counting
+multi-tag expenses. Amounts in different currencies are never added together.
+
+Run `python -m app.rollup rebuild` to recompute the table from scratch or
+`python -m app.rollup verify` to compare it against the expenses table.
+"""
+import argparse
+import logging
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+ALL_TAGS = "*"
+UNTAGGED = ""
+
+# (user_id, month, type, tag_key, currency)
+RollupKey = Tuple[str, str, str, str, str]
+
+
+class RollupEntry(NamedTuple):
+    """The parts of an expense that determine its rollup contributions."""
+    user_id: str
+    timestamp: datetime
+    type: Optional[str]
+    amount_minor: int
+    currency: str
+    tag_ids: Tuple[str, ...]
+
+
+class RollupService:
+    @staticmethod
+    def month_key(timestamp: datetime) -> str:
+        return timestamp.strftime("%Y-%m")
+
+    @staticmethod
+    def entry_for(expense: models.Expense) -> RollupEntry:
+        return RollupEntry(
+            user_id=expense.user_id,
+            timestamp=expense.timestamp,
+            type=expense.type,
+            amount_minor=expense.amount_minor,
+            currency=expense.currency,
+            tag_ids=tuple(tag.id for tag in expense.tags),
+        )
+
+    @staticmethod
+    def deltas(added: Iterable[RollupEntry] = (), removed: Iterable[RollupEntry] = ()) -> Dict[RollupKey, List]:
+        """Fold expense entries into per-row [total_minor, count] deltas."""
+        result: Dict[RollupKey, List] = defaultdict(lambda: [0, 0])
+        for sign, entries in ((1, added), (-1, removed)):
+            for entry in entries:
+                month = RollupService.month_key(entry.timestamp)
+                entry_type = entry.type or ""
+                for tag_key in (ALL_TAGS,) + (tuple(dict.fromkeys(entry.tag_ids)) or (UNTAGGED,)):
+                    delta = result[(entry.user_id, month, entry_type, tag_key, entry.currency)]
+                    delta[0] += sign * entry.amount_minor
+                    delta[1] += sign
+        return {key: delta for key, delta in result.items() if delta[1] or delta[0]}
+
+    @staticmethod
+    def apply(db: Session, deltas: Dict[RollupKey, List]) -> None:
+        """
+        Add deltas to the rollup rows in the caller's transaction, creating
+        rows as needed. Does not commit.
+        """
+        if not deltas:
+            return
+        rows = [
+            {"user_id": user_id, "month": month, "type": entry_type, "tag_key": tag_key, "currency": currency,
+             "total_minor": total, "count": count}
+            for (user_id, month, entry_type, tag_key, currency), (total, count) in deltas.items()
+        ]
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            stmt = insert(models.ExpenseRollup)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "month", "type", "tag_key", "currency"],
+                set_={
+                    "total_minor": models.ExpenseRollup.total_minor + stmt.excluded.total_minor,
+                    "count": models.ExpenseRollup.count + stmt.excluded.count,
+                },
+            )
+            db.execute(stmt, rows)
+            return
+
+        for row in rows:
+            existing = db.get(
+                models.ExpenseRollup, (row["user_id"], row["month"], row["type"], row["tag_key"], row["currency"])
+            )
+            if existing is None:
+                db.add(models.ExpenseRollup(**row))
+            else:
+                existing.total_minor += row["total_minor"]
+                existing.count += row["count"]
+        db.flush()
+
+    @staticmethod
+    def compute(db: Session, user_id: Optional[str] = None, batch_size: int = 1000) -> Dict[RollupKey, List]:
+        """Recompute rollup values from the expenses table in bounded memory."""
+        stmt = select(
+            models.Expense.id,
+            models.Expense.user_id,
+            models.Expense.timestamp,
+            models.Expense.type,
+            models.Expense.amount_minor,
+            models.Expense.currency,
+        )
+        if user_id is not None:
+            stmt = stmt.where(models.Expense.user_id == user_id)
+
+        totals: Dict[RollupKey, List] = defaultdict(lambda: [0, 0])
+        links = models.expense_tag_table.c
+        result = db.execute(stmt.execution_options(yield_per=batch_size))
+        for batch in result.partitions():
+            tag_ids = defaultdict(list)
+            for expense_id, tag_id in db.execute(
+                select(links.expense_id, links.tag_id).where(links.expense_id.in_([row.id for row in batch]))
+            ):
+                tag_ids[expense_id].append(tag_id)
+            entries = [
+                RollupEntry(row.user_id, row.timestamp, row.type, row.amount_minor, row.currency,
+                            tuple(tag_ids[row.id]))
+                for row in batch
+            ]
+            for key, (total, count) in RollupService.deltas(added=entries).items():
+                totals[key][0] += total
+                totals[key][1] += count
+        return dict(totals)
+
+    @staticmethod
+    def rebuild(db: Session, user_id: Optional[str] = None) -> int:
+        """Replace stored rollups (for one user or everyone) with recomputed values."""
+        totals = RollupService.compute(db, user_id)
+        stmt = delete(models.ExpenseRollup)
+        if user_id is not None:
+            stmt = stmt.where(models.ExpenseRollup.user_id == user_id)
+        try:
+            db.execute(stmt)
+            RollupService.apply(db, totals)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(totals)
+
+    @staticmethod
+    def verify(db: Session, user_id: Optional[str] = None) -> List[str]:
+        """Return a description of every stored rollup row that disagrees with the expenses."""
+        expected = RollupService.compute(db, user_id)
+        rollup = models.ExpenseRollup
+        # Plain rows rather than entities: the counters change through Core
+        # upserts, which never refresh objects already in the session
+        stmt = select(
+            rollup.user_id, rollup.month, rollup.type, rollup.tag_key, rollup.currency, rollup.total_minor, rollup.count
+        ).where(rollup.count != 0)
+        if user_id is not None:
+            stmt = stmt.where(rollup.user_id == user_id)
+        stored = {
+            (row.user_id, row.month, row.type, row.tag_key, row.currency): (row.total_minor, row.count)
+            for row in db.execute(stmt)
+        }
+
+        problems = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key, (0, 0))
+            have = stored.get(key, (0, 0))
+            if tuple(want) != tuple(have):
+                problems.append(f"{key}: expected total={want[0]} count={want[1]}, "
+                                f"stored total={have[0]} count={have[1]}")
+        return problems
+
+    @staticmethod
+    def read(
+        db: Session,
+        user_id: str,
+        group_by: str,
+        first_month: str,
+        last_month: str,
+        expense_type: Optional[str] = None,
+    ) -> Dict[Tuple[Optional[str], str], List]:
+        """
+        Read pre-aggregated [total_minor, count] per (month, type or tag name;
+        currency) for the inclusive month range. Untagged expenses are keyed
+        None for tags.
+        """
+        rollup = models.ExpenseRollup
+        stmt = select(
+            rollup.month, rollup.type, rollup.tag_key, rollup.currency, rollup.total_minor, rollup.count
+        ).where(
+            rollup.user_id == user_id,
+            rollup.month >= first_month,
+            rollup.month <= last_month,
+            rollup.count != 0,
+        )
+        if group_by == "tag":
+            stmt = stmt.where(rollup.tag_key != ALL_TAGS)
+        else:
+            stmt = stmt.where(rollup.tag_key == ALL_TAGS)
+        if expense_type:
+            stmt = stmt.where(rollup.type == expense_type)
+
+        rows = db.execute(stmt).all()
+        if group_by == "tag":
+            tag_ids = {row.tag_key for row in rows if row.tag_key != UNTAGGED}
+            names = dict(db.execute(
+                select(models.Tag.id, models.Tag.name).where(models.Tag.id.in_(tag_ids))
+            ).all()) if tag_ids else {}
+
+        buckets: Dict[Tuple[Optional[str], str], List] = defaultdict(lambda: [0, 0])
+        for row in rows:
+            if group_by == "month":
+                key = row.month
+            elif group_by == "type":
+                key = row.type or None
+            else:
+                key = names.get(row.tag_key)
+            buckets[(key, row.currency)][0] += row.total_minor
+            buckets[(key, row.currency)][1] += row.count
+        return dict(buckets)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the expense_rollups table")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--user", dest="user_id", help="Limit to a single user id")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as db:
+        if args.command == "rebuild":
+            count = RollupService.rebuild(db, args.user_id)
+            logger.info("Rebuilt %d rollup rows", count)
+        problems = RollupService.verify(db, args.user_id)
+    for problem in problems:
+        logger.error("Rollup mismatch %s", problem)
+    if problems:
+        return 1
+    logger.info("Rollups verified")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Async handlers for the core user and expense routes, backed by AsyncSession.
+
+With ASYNC_ROUTES enabled, main.py calls install() to swap these in for the
+sync handlers of the same path and method, keeping their position in the
+route table. Everything else (bulk import, export, summary, auth) keeps its
+existing handler.
+"""
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, hashing, schemas, serialization, versions, writer
+from app.crud import ExpenseCRUD
+from app.crud_async import AsyncExpenseCRUD, AsyncUserCRUD
+from app.database import get_async_db
+from app.response_cache import cached_json
+from app.dependencies import (
+    get_current_user_async, get_current_user_readonly_async, get_expense_filters, get_page_cursor,
+)
+
+router = APIRouter()
+
+
+async def not_modified(request: Request, response: Response, db: AsyncSession, user_id: str) -> Optional[Response]:
+    """Async counterpart of main.not_modified."""
+    version = await db.scalar(versions.DataVersionService.statement(user_id)) or 0
+    headers = versions.conditional_headers(user_id, version)
+    if versions.etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+@router.get("/me", response_model=schemas.User)
+async def read_users_me(current_user: schemas.User = Depends(get_current_user_async)):
+    return current_user
+
+
+@router.put("/me", response_model=schemas.User)
+async def update_user_profile(
+        user_data: schemas.UserUpdate,
+        current_user: schemas.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    password_hash = None
+    if user_data.password:
+        password_hash = await hashing.password_hasher.hash(user_data.password)
+    try:
+        updated_user = await AsyncUserCRUD.update_user(db, current_user.id, user_data, password_hash)
+    except crud.DuplicateUserError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not updated_user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return updated_user
+
+
+@router.get("/expenses", response_model=list[schemas.Expense])
+async def list_expenses(
+        request: Request,
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit to return everything"),
+        cursor: Optional[str] = Depends(get_page_cursor),
+        order: str = Query("desc", pattern="^(asc|desc)$", description="Sort by timestamp"),
+        filters: schemas.ExpenseFilter = Depends(get_expense_filters),
+        current_user: schemas.User = Depends(get_current_user_readonly_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    cached = await not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
+    expenses, next_cursor = await AsyncExpenseCRUD.get_expense_rows_page(
+        db, current_user.id, filters, limit=limit, cursor=cursor, order=order
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return Response(serialization.dumps(expenses), media_type="application/json", headers=dict(response.headers))
+
+
+@router.post("/expenses", response_model=schemas.Expense)
+async def add_expense(
+        expense: schemas.ExpenseCreate,
+        current_user: schemas.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if writer.write_queue is not None:
+        return await writer.write_queue.run_async(writer.create_expense_job(expense, current_user.id))
+    return await AsyncExpenseCRUD.create_expense(db, expense, current_user.id)
+
+
+@router.get("/expenses/range", response_model=list[schemas.Expense])
+async def list_expenses_in_range(
+        request: Request,
+        response: Response,
+        start_date: date = Query(..., description="Start date YYYY-MM-DD"),
+        end_date: date = Query(..., description="End date YYYY-MM-DD"),
+        current_user: schemas.User = Depends(get_current_user_readonly_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    cached = await not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
+    return await db.run_sync(lambda session: cached_json(
+        "range", response, session, current_user.id, {"start": start_date, "end": end_date},
+        start_date, end_date,
+        lambda: serialization.dumps(
+            ExpenseCRUD.get_expense_rows_in_range(session, start_date, end_date, current_user.id)
+        ).decode(),
+    ))
+
+
+@router.get("/expenses/{expense_id}", response_model=schemas.Expense)
+async def get_expense(
+        expense_id: str,
+        request: Request,
+        response: Response,
+        current_user: schemas.User = Depends(get_current_user_readonly_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    # Existence first: the ETag covers all of the user's data, so it would also match a missing id
+    expense = await AsyncExpenseCRUD.get_expense(db, expense_id, current_user.id)
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    cached = await not_modified(request, response, db, current_user.id)
+    if cached:
+        return cached
+    return expense
+
+
+@router.put("/expenses/{expense_id}", response_model=schemas.Expense)
+async def update_expense(
+        expense_id: str,
+        expense: schemas.ExpenseCreate,
+        current_user: schemas.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if writer.write_queue is not None:
+        updated = await writer.write_queue.run_async(writer.update_expense_job(expense_id, expense, current_user.id))
+    else:
+        updated = await AsyncExpenseCRUD.update_expense(db, expense_id, expense, current_user.id)
+    if not updated:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return updated
+
+
+@router.delete("/expenses/{expense_id}", response_model=schemas.Expense)
+async def delete_expense(
+        expense_id: str,
+        current_user: schemas.User = Depends(get_current_user_async),
+        db: AsyncSession = Depends(get_async_db)
+):
+    if writer.write_queue is not None:
+        deleted = await writer.write_queue.run_async(writer.delete_expense_job(expense_id, current_user.id))
+    else:
+        deleted = await AsyncExpenseCRUD.delete_expense(db, expense_id, current_user.id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    return deleted
+
+
+def install(app: FastAPI) -> None:
+    """Replace the app's sync handlers with the async ones above, in place."""
+    replacements = {
+        (route.path, method): route
+        for route in router.routes
+        if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    for index, route in enumerate(app.router.routes):
+        if not isinstance(route, APIRoute):
+            continue
+        for method in route.methods:
+            replacement = replacements.get((route.path, method))
+            if replacement is not None:
+                app.router.routes[index] = replacement
+                break
@@ -1,7 +1,9 @@
-from pydantic import BaseModel, EmailStr, ConfigDict
+from pydantic import BaseModel, EmailStr, ConfigDict, Field
 from typing import List, Optional
 from datetime import datetime
 
+from app.money import MAX_AMOUNT
+
 
 class UserBase(BaseModel):
     username: str
@@ -51,18 +53,49 @@ class Tag(TagBase):
 
 class ExpenseBase(BaseModel):
     title: str
-    amount: float
+    # Finite and within what amount_minor can hold, so bad input is a 422 rather than a failed write
+    amount: float = Field(allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT)
     tags: Optional[List[str]] = []
 
 
 class ExpenseCreate(ExpenseBase):
     timestamp: Optional[datetime] = None
     type: Optional[str] = "expense"
+    # ISO 4217 code; defaults to settings.default_currency on create
+    currency: Optional[str] = Field(default=None, pattern=r"^[A-Z]{3}$")
 
 
 class Expense(ExpenseBase):
     id: str
     timestamp: datetime
+    currency: str
     tags: List[Tag]
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class ExpenseFilter(BaseModel):
+    type: Optional[str] = None
+    tag: Optional[str] = None
+    min_amount: Optional[float] = Field(default=None, allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT)
+    max_amount: Optional[float] = Field(default=None, allow_inf_nan=False, gt=-MAX_AMOUNT, lt=MAX_AMOUNT)
+    q: Optional[str] = None
+
+
+class BulkImportError(BaseModel):
+    row: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    inserted: int = 0
+    failed: int = 0
+    errors: List[BulkImportError] = []
+
+
+class SummaryBucket(BaseModel):
+    key: Optional[str]
+    currency: str
+    total: float
+    count: int
+    average: float
@@ -0,0 +1,246 @@
+"""
+Full-text and prefix search over expense titles and tag names.
+
+The `expense_search` index holds one document per expense (title plus the
+names of its tags) and is kept current by ExpenseCRUD in the same transaction
+as each write. Its shape depends on the database:
+
+* SQLite: an FTS5 virtual table ranked with bm25(), titles weighted above tags.
+  Documents are keyed by integer rowid, which `expense_search_keys` maps to
+  expense ids, so re-indexing or removing an expense is a rowid lookup
+  rather than a scan of the whole index.
+* Postgres: a tsvector column with a GIN index ranked with ts_rank(), using
+  the same weights.
+* Anything else, or SQLite built without FTS5: no index; search falls back
+  to case-insensitive substring matching, newest first.
+
+Every word of the query must match as a prefix of a word in the title or in
+a tag name, so "coff sta" finds "Coffee at Starbucks".
+
+The index is created together with the other tables by metadata.create_all.
+Run `SearchIndex.rebuild` (done at startup when the table is new) to fill it
+from existing data.
+"""
+import logging
+import re
+import sqlite3
+from contextlib import closing
+from typing import Iterable, List, Optional
+
+from sqlalchemy import DateTime, bindparam, event, or_, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+TABLE = "expense_search"
+KEYS_TABLE = "expense_search_keys"
+
+with closing(sqlite3.connect(":memory:")) as _probe:
+    FTS5_AVAILABLE = any(option == "ENABLE_FTS5" for (option,) in _probe.execute("PRAGMA compile_options"))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_CREATE = {
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5("
+        "user_id UNINDEXED, title, tags, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+        f"CREATE TABLE IF NOT EXISTS {KEYS_TABLE} ("
+        "docid INTEGER PRIMARY KEY, expense_id BLOB NOT NULL UNIQUE)",
+    ],
+    "postgresql": [
+        f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+        "expense_id UUID PRIMARY KEY REFERENCES expenses (id) ON DELETE CASCADE, "
+        "user_id UUID NOT NULL, document TSVECTOR NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_document ON {TABLE} USING GIN (document)",
+        f"CREATE INDEX IF NOT EXISTS ix_{TABLE}_user_id ON {TABLE} (user_id)",
+    ],
+}
+
+# Title and space-joined tag names per expense, for the ids bound to :ids (or all)
+_DOCUMENTS = {
+    "sqlite": (
+        "SELECT k.docid, e.user_id, e.title, COALESCE(GROUP_CONCAT(t.name, ' '), '') "
+        f"FROM expenses e JOIN {KEYS_TABLE} k ON k.expense_id = e.id "
+        "LEFT JOIN expense_tags et ON et.expense_id = e.id "
+        "LEFT JOIN tags t ON t.id = et.tag_id {where} GROUP BY e.id"
+    ),
+    "postgresql": (
+        "SELECT e.id, e.user_id, "
+        "setweight(to_tsvector('simple', e.title), 'A') || "
+        "setweight(to_tsvector('simple', COALESCE(string_agg(t.name, ' '), '')), 'B') "
+        "FROM expenses e LEFT JOIN expense_tags et ON et.expense_id = e.id "
+        "LEFT JOIN tags t ON t.id = et.tag_id {where} GROUP BY e.id"
+    ),
+}
+
+_INSERT = {
+    "sqlite": f"INSERT INTO {TABLE} (rowid, user_id, title, tags) ",
+    "postgresql": f"INSERT INTO {TABLE} (expense_id, user_id, document) ",
+}
+
+# Drop the documents (and rowids) of the expenses bound to :ids, in order
+_DELETE = {
+    "sqlite": [
+        f"DELETE FROM {TABLE} WHERE rowid IN (SELECT docid FROM {KEYS_TABLE} WHERE expense_id IN :ids)",
+        f"DELETE FROM {KEYS_TABLE} WHERE expense_id IN :ids",
+    ],
+    "postgresql": [f"DELETE FROM {TABLE} WHERE expense_id IN :ids"],
+}
+
+# Rowids for the expenses bound to :ids (or all), allocated before their documents are inserted
+_KEYS = {
+    "sqlite": f"INSERT INTO {KEYS_TABLE} (expense_id) SELECT e.id FROM expenses e {{where}}",
+}
+
+_UPSERT_SUFFIX = {
+    "sqlite": "",
+    "postgresql": " ON CONFLICT (expense_id) DO UPDATE SET document = excluded.document",
+}
+
+_SEARCH = {
+    # bm25 is lower for better matches; weights follow the column order
+    "sqlite": (
+        "SELECT e.title, e.amount_minor, e.id, e.timestamp, e.currency "
+        f"FROM {TABLE} s JOIN {KEYS_TABLE} k ON k.docid = s.rowid JOIN expenses e ON e.id = k.expense_id "
+        f"WHERE {TABLE} MATCH :query AND s.user_id = :user_id "
+        f"ORDER BY bm25({TABLE}, 0, 10.0, 5.0), e.timestamp DESC, e.id LIMIT :limit OFFSET :offset"
+    ),
+    "postgresql": (
+        "SELECT e.title, e.amount_minor, e.id, e.timestamp, e.currency "
+        f"FROM {TABLE} s JOIN expenses e ON e.id = s.expense_id "
+        "WHERE s.user_id = :user_id AND s.document @@ to_tsquery('simple', :query) "
+        "ORDER BY ts_rank(s.document, to_tsquery('simple', :query)) DESC, e.timestamp DESC, e.id "
+        "LIMIT :limit OFFSET :offset"
+    ),
+}
+
+
+def backend(dialect: str) -> Optional[str]:
+    """The index flavour for `dialect`, or None when searches fall back to LIKE."""
+    if dialect == "sqlite":
+        return "sqlite" if FTS5_AVAILABLE else None
+    return "postgresql" if dialect == "postgresql" else None
+
+
+@event.listens_for(models.Base.metadata, "after_create")
+def _create_index(target, connection, **kw) -> None:
+    flavour = backend(connection.dialect.name)
+    for statement in _CREATE.get(flavour, ()):
+        connection.execute(text(statement))
+
+
+@event.listens_for(models.Base.metadata, "after_drop")
+def _drop_index(target, connection, **kw) -> None:
+    if backend(connection.dialect.name):
+        connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {KEYS_TABLE}"))
+
+
+def match_expression(flavour: str, q: str) -> Optional[str]:
+    """
+    Prefix query for the index built from the words of `q`, or None when `q`
+    has no words. Words are re-quoted so user input cannot inject query syntax.
+    """
+    words = _WORD.findall(q.lower())
+    if not words:
+        return None
+    if flavour == "sqlite":
+        return " ".join(f'"{word}"*' for word in words)
+    return " & ".join(f"{word}:*" for word in words)
+
+
+class SearchIndex:
+    @staticmethod
+    def sync(db: Session, expense_ids: Iterable[str]) -> None:
+        """
+        Re-index `expense_ids` from their current rows in the caller's
+        transaction; ids that no longer exist are dropped. Does not commit.
+        """
+        ids = list(dict.fromkeys(expense_ids))
+        flavour = backend(db.get_bind().dialect.name)
+        if not ids or flavour is None:
+            return
+        # Pending ORM changes (new titles, tag links) must be visible to the SELECT
+        db.flush()
+        SearchIndex._delete(db, flavour, ids)
+        statements = [_INSERT[flavour] + _DOCUMENTS[flavour] + _UPSERT_SUFFIX[flavour]]
+        if flavour in _KEYS:
+            statements.insert(0, _KEYS[flavour])
+        for statement in statements:
+            db.execute(
+                text(statement.format(where="WHERE e.id IN :ids")).bindparams(
+                    bindparam("ids", expanding=True, type_=models.CompactUUID)
+                ),
+                {"ids": ids},
+            )
+
+    @staticmethod
+    def remove(db: Session, expense_ids: Iterable[str]) -> None:
+        ids = list(expense_ids)
+        flavour = backend(db.get_bind().dialect.name)
+        if ids and flavour:
+            SearchIndex._delete(db, flavour, ids)
+
+    @staticmethod
+    def _delete(db: Session, flavour: str, ids: List[str]) -> None:
+        for statement in _DELETE[flavour]:
+            db.execute(
+                text(statement).bindparams(
+                    bindparam("ids", expanding=True, type_=models.CompactUUID)
+                ),
+                {"ids": ids},
+            )
+
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Recreate every document from the expenses table. Returns the number indexed and commits."""
+        flavour = backend(db.get_bind().dialect.name)
+        if flavour is None:
+            return 0
+        db.execute(text(f"DELETE FROM {TABLE}"))
+        if flavour in _KEYS:
+            db.execute(text(f"DELETE FROM {KEYS_TABLE}"))
+            db.execute(text(_KEYS[flavour].format(where="")))
+        db.execute(text(_INSERT[flavour] + _DOCUMENTS[flavour].format(where="")))
+        count = db.scalar(text(f"SELECT COUNT(*) FROM {TABLE}"))
+        db.commit()
+        return count
+
+    @staticmethod
+    def search(db: Session, user_id: str, q: str, limit: int, offset: int = 0) -> list:
+        """
+        Up to `limit` (title, amount_minor, id, timestamp, currency) rows of `user_id`'s
+        expenses matching every word of `q`, best match first.
+        """
+        flavour = backend(db.get_bind().dialect.name)
+        if flavour is None:
+            return SearchIndex._search_like(db, user_id, q, limit, offset)
+        query = match_expression(flavour, q)
+        if query is None:
+            return []
+        return db.execute(
+            text(_SEARCH[flavour])
+            .bindparams(bindparam("user_id", type_=models.CompactUUID))
+            .columns(id=models.CompactUUID, timestamp=DateTime),
+            {"query": query, "user_id": user_id, "limit": limit, "offset": offset},
+        ).all()
+
+    @staticmethod
+    def _search_like(db: Session, user_id: str, q: str, limit: int, offset: int) -> list:
+        words = _WORD.findall(q)
+        if not words:
+            return []
+        expense = models.Expense
+        stmt = select(
+            expense.title, expense.amount_minor, expense.id, expense.timestamp, expense.currency
+        ).where(expense.user_id == user_id)
+        for word in words:
+            stmt = stmt.where(or_(
+                expense.title.icontains(word, autoescape=True),
+                expense.tags.any(models.Tag.name.icontains(word, autoescape=True)),
+            ))
+        stmt = stmt.order_by(expense.timestamp.desc(), expense.id).limit(limit).offset(offset)
+        return db.execute(stmt).all()
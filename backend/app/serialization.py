@@ -0,0 +1,34 @@
+"""
+Direct JSON encoding for the list fast path (ExpenseCRUD.expense_rows).
+
+Bytes match what pydantic produces for schemas.Expense: compact separators,
+UTF-8 rather than \\u escapes, ISO 8601 datetimes with "Z" for UTC. orjson
+is used when installed; the standard library fallback yields the same output.
+"""
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.info("orjson not installed, list responses use the json module")
+
+
+def _default(value: Any) -> str:
+    if isinstance(value, datetime):
+        text = value.isoformat()
+        if value.utcoffset() == timedelta(0):
+            text = text[:-len("+00:00")] + "Z"
+        return text
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_UTC_Z)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":"), allow_nan=False).encode()
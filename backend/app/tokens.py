@@ -0,0 +1,149 @@
+"""
+Pluggable JWT signing backends selected by settings.algorithm.
+
+HS*/RS*/ES* tokens go through python-jose. EdDSA (Ed25519) is not supported by
+python-jose, so it is implemented directly on top of `cryptography`. Every
+backend raises jose's ExpiredSignatureError/JWTError so callers handle
+failures the same way.
+"""
+import base64
+import calendar
+import json
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Optional
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from jose import jwk, jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+from .config import settings
+
+
+class TokenBackend(ABC):
+    algorithm: str
+
+    @abstractmethod
+    def encode(self, claims: dict) -> str:
+        ...
+
+    @abstractmethod
+    def decode(self, token: str) -> dict:
+        ...
+
+
+class JoseBackend(TokenBackend):
+    """HMAC, RSA and ECDSA algorithms via python-jose."""
+
+    def __init__(self, algorithm: str, signing_key: Optional[str], verifying_key: str):
+        self.algorithm = algorithm
+        # Parse keys once; handing jose raw PEM strings re-parses them on every call
+        self.signing_key = jwk.construct(signing_key, algorithm) if signing_key else None
+        self.verifying_key = jwk.construct(verifying_key, algorithm)
+
+    def encode(self, claims: dict) -> str:
+        if self.signing_key is None:
+            raise JWTError("No private key configured for signing")
+        return jwt.encode(claims, self.signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        return jwt.decode(token, self.verifying_key, algorithms=[self.algorithm])
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class Ed25519Backend(TokenBackend):
+    """EdDSA over Ed25519 in JWS compact serialization."""
+
+    algorithm = "EdDSA"
+
+    def __init__(self, private_key: Optional[Ed25519PrivateKey], public_key: Ed25519PublicKey):
+        self.private_key = private_key
+        self.public_key = public_key
+        self._header = _b64encode(json.dumps({"alg": self.algorithm, "typ": "JWT"}, separators=(",", ":")).encode())
+
+    def encode(self, claims: dict) -> str:
+        if self.private_key is None:
+            raise JWTError("No private key configured for signing")
+        payload = {
+            key: calendar.timegm(value.utctimetuple()) if isinstance(value, datetime) else value
+            for key, value in claims.items()
+        }
+        signing_input = f"{self._header}.{_b64encode(json.dumps(payload, separators=(',', ':')).encode())}"
+        return f"{signing_input}.{_b64encode(self.private_key.sign(signing_input.encode()))}"
+
+    def decode(self, token: str) -> dict:
+        try:
+            header_b64, payload_b64, signature_b64 = token.split(".")
+            header = json.loads(_b64decode(header_b64))
+            if header.get("alg") != self.algorithm:
+                raise JWTError("The specified alg value is not allowed")
+            self.public_key.verify(_b64decode(signature_b64), f"{header_b64}.{payload_b64}".encode())
+            claims = json.loads(_b64decode(payload_b64))
+        except InvalidSignature:
+            raise JWTError("Signature verification failed.")
+        except (ValueError, TypeError) as e:
+            raise JWTError(f"Invalid token: {e}")
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload")
+        if "exp" in claims and claims["exp"] <= time.time():
+            raise ExpiredSignatureError("Signature has expired.")
+        return claims
+
+
+def build_backend(
+    algorithm: str,
+    secret_key: str,
+    private_key_pem: Optional[str] = None,
+    public_key_pem: Optional[str] = None,
+) -> TokenBackend:
+    """
+    Create the backend for `algorithm`. HMAC algorithms use `secret_key`;
+    asymmetric ones need a private key PEM to sign and/or a public key PEM to
+    verify (derived from the private key when omitted).
+    """
+    if algorithm.startswith("HS"):
+        return JoseBackend(algorithm, secret_key, secret_key)
+
+    private_key = None
+    if private_key_pem:
+        private_key = serialization.load_pem_private_key(private_key_pem.encode(), password=None)
+    if public_key_pem:
+        public_key = serialization.load_pem_public_key(public_key_pem.encode())
+    elif private_key is not None:
+        public_key = private_key.public_key()
+    else:
+        raise ValueError(f"{algorithm} requires JWT_PRIVATE_KEY_PATH or JWT_PUBLIC_KEY_PATH")
+
+    if algorithm == "EdDSA":
+        return Ed25519Backend(private_key, public_key)
+
+    public_pem = public_key.public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return JoseBackend(algorithm, private_key_pem, public_pem)
+
+
+def _read_key(path: Optional[str]) -> Optional[str]:
+    if not path:
+        return None
+    with open(path) as key_file:
+        return key_file.read()
+
+
+def load_backend() -> TokenBackend:
+    return build_backend(
+        settings.algorithm,
+        settings.secret_key,
+        _read_key(settings.jwt_private_key_path),
+        _read_key(settings.jwt_public_key_path),
+    )
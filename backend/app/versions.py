@@ -0,0 +1,111 @@
+"""
+Per-user data versions and the weak ETags derived from them.
+
+ExpenseCRUD bumps a user's version inside every transaction that changes
+their expenses, so a matching If-None-Match lets a GET answer 304 after a
+single primary-key lookup instead of running its query and serialization.
+It also bumps a version per (user, month) touched, which app.response_cache
+folds into its keys so a write only invalidates responses covering that month.
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from . import models
+
+
+class DataVersionService:
+    @staticmethod
+    def bump(db: Session, user_ids: Iterable[str]) -> None:
+        """Increment the versions of `user_ids` in the caller's transaction. Does not commit."""
+        rows = [{"user_id": user_id, "version": 1} for user_id in dict.fromkeys(user_ids)]
+        if not rows:
+            return
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            stmt = insert(models.UserDataVersion)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id"],
+                set_={"version": models.UserDataVersion.version + 1},
+            )
+            db.execute(stmt, rows)
+            return
+
+        for row in rows:
+            existing = db.get(models.UserDataVersion, row["user_id"])
+            if existing is None:
+                db.add(models.UserDataVersion(**row))
+            else:
+                existing.version += 1
+        db.flush()
+
+    @staticmethod
+    def touch(db: Session, user_id: str, timestamps: Iterable[datetime]) -> None:
+        """Bump `user_id`'s version and those of the months of `timestamps`. Does not commit."""
+        DataVersionService.bump(db, [user_id])
+        months = dict.fromkeys(timestamp.strftime("%Y-%m") for timestamp in timestamps)
+        rows = [{"user_id": user_id, "month": month, "version": 1} for month in months]
+        if not rows:
+            return
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            stmt = insert(models.ExpenseMonthVersion)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["user_id", "month"],
+                set_={"version": models.ExpenseMonthVersion.version + 1},
+            )
+            db.execute(stmt, rows)
+            return
+
+        for row in rows:
+            existing = db.get(models.ExpenseMonthVersion, (row["user_id"], row["month"]))
+            if existing is None:
+                db.add(models.ExpenseMonthVersion(**row))
+            else:
+                existing.version += 1
+        db.flush()
+
+    @staticmethod
+    def month_versions(db: Session, user_id: str, start_date: date, end_date: date) -> Dict[str, int]:
+        """Versions of the months between the two dates that have ever changed."""
+        versions = models.ExpenseMonthVersion
+        rows = db.execute(
+            select(versions.month, versions.version).where(
+                versions.user_id == user_id,
+                versions.month >= start_date.strftime("%Y-%m"),
+                versions.month <= end_date.strftime("%Y-%m"),
+            )
+        )
+        return {month: version for month, version in rows}
+
+    @staticmethod
+    def get(db: Session, user_id: str) -> int:
+        return db.scalar(DataVersionService.statement(user_id)) or 0
+
+    @staticmethod
+    def statement(user_id: str) -> Select:
+        return select(models.UserDataVersion.version).where(models.UserDataVersion.user_id == user_id)
+
+
+def etag_for(user_id: str, version: int) -> str:
+    return f'W/"{user_id}.{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of `etag` against an If-None-Match header value."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def conditional_headers(user_id: str, version: int) -> dict:
+    # no-cache: browsers may store the response but must revalidate it each time
+    return {"ETag": etag_for(user_id, version), "Cache-Control": "private, no-cache"}
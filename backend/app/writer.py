@@ -0,0 +1,161 @@
+"""
+Single-writer queue for SQLite.
+
+SQLite allows one writer at a time, so concurrent requests that each open a
+write transaction mostly wait on the database lock and then pay for their own
+commit. With SQLITE_SINGLE_WRITER enabled, expense writes are handed to one
+thread instead. It drains whatever jobs are queued (up to
+sqlite_write_batch_size, waiting at most sqlite_write_batch_window_ms for
+more) and commits them together. Readers keep their own pooled connections
+and, under WAL, are not blocked by the writer.
+
+If anything in a batch fails, the batch is rolled back and its jobs are
+replayed one transaction each, so a bad request only fails itself.
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import schemas
+from .config import settings
+from .crud import ExpenseCRUD
+from .database import note_writer
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+Job = Callable[[Session], T]
+
+_STOP = object()
+
+
+class WriteQueue:
+    def __init__(self, session_factory: sessionmaker, batch_size: int = 64, batch_window: float = 0.002):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sqlite-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Finish the queued jobs, then stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, job: Job) -> Future:
+        """
+        Queue `job`, which receives the writer's Session and must not commit.
+        Its return value is delivered once the batch containing it commits, so
+        it should not be an ORM object bound to that session.
+        """
+        if self._thread is None:
+            raise RuntimeError("Write queue is not running")
+        future: Future = Future()
+        self._queue.put((job, future))
+        return future
+
+    def run(self, job: Job) -> T:
+        return self.submit(job).result()
+
+    async def run_async(self, job: Job) -> T:
+        return await asyncio.wrap_future(self.submit(job))
+
+    def _next_batch(self) -> Tuple[List[tuple], bool]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        stop = any(item is _STOP for item in batch)
+        return [item for item in batch if item is not _STOP], stop
+
+    def _loop(self) -> None:
+        # This session outlives many batches, so let commits expire what it
+        # loaded and the next batch sees rows other sessions changed
+        with self.session_factory(expire_on_commit=True) as session:
+            while True:
+                batch, stop = self._next_batch()
+                if batch:
+                    self._commit_batch(session, batch)
+                if stop:
+                    return
+
+    def _commit_batch(self, session: Session, batch: List[tuple]) -> None:
+        try:
+            results = [job(session) for job, _ in batch]
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            logger.warning("Write batch of %d failed, retrying its jobs one by one: %s", len(batch), e)
+            for item in batch:
+                self._commit_batch(session, [item])
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+def create_expense_job(expense: schemas.ExpenseCreate, user_id: str) -> Job:
+    def job(db: Session) -> schemas.Expense:
+        note_writer(db, user_id)
+        return schemas.Expense.model_validate(ExpenseCRUD.create_expense(db, expense, user_id, commit=False))
+    return job
+
+
+def update_expense_job(expense_id: str, expense: schemas.ExpenseCreate, user_id: str) -> Job:
+    def job(db: Session) -> Optional[schemas.Expense]:
+        note_writer(db, user_id)
+        updated = ExpenseCRUD.update_expense(db, expense_id, expense, user_id, commit=False)
+        return schemas.Expense.model_validate(updated) if updated else None
+    return job
+
+
+def delete_expense_job(expense_id: str, user_id: str) -> Job:
+    def job(db: Session) -> Optional[schemas.Expense]:
+        note_writer(db, user_id)
+        expense = ExpenseCRUD.get_expense(db, expense_id, user_id)
+        if expense is None:
+            return None
+        # Serialize before the row (and its tag links) is gone
+        deleted = schemas.Expense.model_validate(expense)
+        ExpenseCRUD.delete_expense(db, expense_id, user_id, commit=False)
+        return deleted
+    return job
+
+
+write_queue: Optional[WriteQueue] = None
+
+
+def start(session_factory: sessionmaker) -> WriteQueue:
+    global write_queue
+    write_queue = WriteQueue(
+        session_factory,
+        batch_size=settings.sqlite_write_batch_size,
+        batch_window=settings.sqlite_write_batch_window_ms / 1000,
+    )
+    write_queue.start()
+    return write_queue
+
+
+def stop() -> None:
+    global write_queue
+    if write_queue is not None:
+        write_queue.stop()
+        write_queue = None
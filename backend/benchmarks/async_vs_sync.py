@@ -0,0 +1,146 @@
+"""
+Load test comparing the sync route handlers with the async ones (ASYNC_ROUTES).
+
+    cd backend
+    python -m benchmarks.async_vs_sync --concurrency 64 --requests 2000 [--json results.json]
+
+For each mode a uvicorn worker is started on a fresh SQLite file, a user is
+seeded with expenses, and the same mix of list/get/range requests is driven
+through httpx with the given concurrency. Reports requests per second and
+p50/p95/p99 latency in milliseconds.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+SEED_EXPENSES = 500
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(async_routes: bool, db_path: str, port: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        ASYNC_ROUTES="1" if async_routes else "0",
+        SECRET_KEY=os.environ.get("SECRET_KEY", "benchmark-secret-key-at-least-32-characters"),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+def _seed(base_url: str) -> tuple:
+    with httpx.Client(base_url=base_url) as client:
+        client.post("/register", json={"username": "bench", "email": "bench@example.com", "password": "bench"})
+        token = client.post("/login", json={"username": "bench", "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        ids = []
+        for i in range(SEED_EXPENSES):
+            response = client.post("/expenses", headers=headers, json={
+                "title": f"Expense {i}", "amount": random.uniform(1, 200),
+                "timestamp": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00",
+                "tags": [random.choice(["food", "travel", "rent"])],
+            })
+            ids.append(response.json()["id"])
+    return headers, ids
+
+
+def _request_mix(ids: list) -> list:
+    return [
+        "/expenses?limit=50",
+        f"/expenses/{random.choice(ids)}",
+        "/expenses/range?start_date=2024-03-01&end_date=2024-03-31",
+        "/me",
+    ]
+
+
+async def _drive(base_url: str, headers: dict, ids: list, total: int, concurrency: int) -> dict:
+    latencies = []
+    paths = _request_mix(ids)
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(paths[i % len(paths)])
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            path = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": cuts[49],
+        "p95_ms": cuts[94],
+        "p99_ms": cuts[98],
+    }
+
+
+def run(total: int, concurrency: int) -> dict:
+    results = {}
+    for mode, async_routes in (("sync", False), ("async", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            port = _free_port()
+            server = _start_server(async_routes, os.path.join(tmp, "bench.db"), port)
+            try:
+                base_url = f"http://127.0.0.1:{port}"
+                headers, ids = _seed(base_url)
+                results[mode] = asyncio.run(_drive(base_url, headers, ids, total, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.requests, args.concurrency)
+    print(f"{'mode':<6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode, row in results.items():
+        print(f"{mode:<6} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+    if args.json_path:
+        with open(args.json_path, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
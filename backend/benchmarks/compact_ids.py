@@ -0,0 +1,114 @@
+"""
+Compare text UUIDv4 keys (the previous schema) with compact UUIDv7 keys
+(models.CompactUUID + models.new_id) on SQLite: insert throughput of
+expenses with two tag links each, and the on-disk size of every table and
+index afterwards (from the dbstat virtual table).
+
+    cd backend
+    python -m benchmarks.compact_ids --rows 200000 --batch 1000 [--json results.json]
+
+Each scheme gets a fresh database file in a temporary directory with the
+application's SQLite pragmas.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-at-least-32-characters")
+
+from sqlalchemy import MetaData, String, insert, text  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import make_engine  # noqa: E402
+
+TABLES = ("users", "tags", "expenses", "expense_tags")
+
+
+def text_metadata() -> MetaData:
+    """The current tables with every CompactUUID column declared as text, as before."""
+    metadata = MetaData()
+    for table in models.Base.metadata.sorted_tables:
+        if table.name in TABLES:
+            copy = table.to_metadata(metadata)
+            for column in copy.columns:
+                if isinstance(column.type, models.CompactUUID):
+                    column.type = String()
+    return metadata
+
+
+def run_scheme(metadata: MetaData, new_id, path: str, rows: int, batch: int) -> dict:
+    engine = make_engine(f"sqlite:///{path}", "benchmark")
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in TABLES])
+    tables = metadata.tables
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        user_id = new_id()
+        conn.execute(insert(tables["users"]), {
+            "id": user_id, "username": "bench", "email": "bench@example.com", "password_hash": "x",
+        })
+        tag_ids = [new_id() for _ in range(8)]
+        conn.execute(insert(tables["tags"]), [
+            {"id": tag_id, "name": f"tag{i}", "user_id": user_id} for i, tag_id in enumerate(tag_ids)
+        ])
+
+    started = time.perf_counter()
+    for offset in range(0, rows, batch):
+        expenses, links = [], []
+        for i in range(offset, min(offset + batch, rows)):
+            expense_id = new_id()
+            expenses.append({
+                "id": expense_id, "title": f"Expense {i}", "amount_minor": i, "currency": "EUR",
+                "timestamp": start + timedelta(seconds=i), "type": "expense", "user_id": user_id,
+            })
+            links += [{"expense_id": expense_id, "tag_id": tag_ids[i % 8]},
+                      {"expense_id": expense_id, "tag_id": tag_ids[(i + 3) % 8]}]
+        with engine.begin() as conn:
+            conn.execute(insert(tables["expenses"]), expenses)
+            conn.execute(insert(tables["expense_tags"]), links)
+    elapsed = time.perf_counter() - started
+
+    with engine.connect() as conn:
+        sizes = dict(conn.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all())
+    engine.dispose()
+    return {
+        "inserts_per_second": rows / elapsed,
+        "file_bytes": os.path.getsize(path),
+        "bytes_by_object": dict(sorted(sizes.items())),
+    }
+
+
+def run(rows: int, batch: int) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        before = run_scheme(text_metadata(), lambda: str(uuid.uuid4()),
+                            os.path.join(directory, "text.db"), rows, batch)
+        after = run_scheme(models.Base.metadata, models.new_id,
+                           os.path.join(directory, "compact.db"), rows, batch)
+    return {"rows": rows, "batch": batch, "text_uuid4": before, "compact_uuid7": after}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.batch)
+    before, after = results["text_uuid4"], results["compact_uuid7"]
+    print(f"{results['rows']} expenses, 2 tag links each, {results['batch']} per transaction")
+    print(f"{'':32} {'text uuid4':>14} {'compact uuid7':>14}")
+    print(f"{'inserts/s':32} {before['inserts_per_second']:14.0f} {after['inserts_per_second']:14.0f}")
+    print(f"{'file bytes':32} {before['file_bytes']:14d} {after['file_bytes']:14d}")
+    for name in sorted(set(before["bytes_by_object"]) | set(after["bytes_by_object"])):
+        print(f"{name:32} {before['bytes_by_object'].get(name, 0):14d} {after['bytes_by_object'].get(name, 0):14d}")
+    if args.json_path:
+        with open(args.json_path, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark of token signing and verification cost per backend.
+
+    cd backend
+    python -m benchmarks.jwt_backends --iterations 5000 [--json results.json]
+
+Reports microseconds per encode, per full verify and per cached verify
+(AuthService.verify_token hitting the token cache).
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-at-least-32-characters")
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa  # noqa: E402
+
+from app.auth import AuthService  # noqa: E402
+from app.tokens import build_backend  # noqa: E402
+
+
+def _pem(key) -> str:
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+
+
+BACKENDS = {
+    "HS256": lambda: build_backend("HS256", os.environ["SECRET_KEY"]),
+    "ES256": lambda: build_backend("ES256", "", _pem(ec.generate_private_key(ec.SECP256R1()))),
+    "EdDSA": lambda: build_backend("EdDSA", "", _pem(ed25519.Ed25519PrivateKey.generate())),
+    "RS256": lambda: build_backend("RS256", "", _pem(rsa.generate_private_key(65537, 2048))),
+}
+
+
+def _per_call_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def run(iterations: int) -> dict:
+    claims = {"sub": "3f1c9a52-6f6e-4a0e-9d38-1c1f2b7d9e10",
+              "exp": datetime.utcnow() + timedelta(minutes=30), "iat": datetime.utcnow()}
+    results = {}
+    for name, factory in BACKENDS.items():
+        backend = factory()
+        token = backend.encode(claims)
+        results[name] = {
+            "encode_us": _per_call_us(lambda: backend.encode(claims), iterations),
+            "verify_us": _per_call_us(lambda: backend.decode(token), iterations),
+            "token_bytes": len(token),
+        }
+
+    token = AuthService.create_access_token({"sub": claims["sub"]})
+    AuthService.verify_token(token)
+    results["cached"] = {
+        "verify_us": _per_call_us(lambda: AuthService.verify_token(token), iterations),
+    }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    print(f"{'backend':<8} {'encode us':>10} {'verify us':>10} {'bytes':>6}")
+    for name, row in results.items():
+        encode = f"{row['encode_us']:.1f}" if "encode_us" in row else "-"
+        size = str(row.get("token_bytes", "-"))
+        print(f"{name:<8} {encode:>10} {row['verify_us']:>10.1f} {size:>6}")
+    if args.json_path:
+        with open(args.json_path, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Compare the ORM + pydantic path of the list endpoints with the plain-row
+fast path (ExpenseCRUD.get_expense_rows_page + app.serialization).
+
+    cd backend
+    python -m benchmarks.list_serialization --rows 5000 --repeat 20 [--json results.json]
+
+The ORM path mirrors what FastAPI does for response_model=list[Expense]:
+validate every row from attributes, dump to JSON-compatible Python, then
+json.dumps. Both paths include the database queries. Reports milliseconds per
+full listing and checks that the two produce the same document.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-at-least-32-characters")
+
+from pydantic import TypeAdapter  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from app import models, schemas, serialization  # noqa: E402
+from app.crud import ExpenseCRUD  # noqa: E402
+
+expense_list = TypeAdapter(list[schemas.Expense])
+
+
+def seed(db: Session, rows: int) -> str:
+    user = models.User(username="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    tags = [models.Tag(name=name, user_id=user.id) for name in ("food", "rent", "travel", "fun")]
+    db.add_all(tags)
+    start = datetime(2024, 1, 1)
+    db.add_all(
+        models.Expense(
+            title=f"Expense {i}", amount=i * 1.25, type="expense", user_id=user.id,
+            timestamp=start + timedelta(minutes=i), tags=[tags[i % 4], tags[(i + 1) % 4]],
+        )
+        for i in range(rows)
+    )
+    db.commit()
+    return user.id
+
+
+def orm_path(db: Session, user_id: str, limit: int) -> bytes:
+    expenses, _ = ExpenseCRUD.get_expenses_page(db, user_id, limit=limit)
+    content = expense_list.dump_python(expense_list.validate_python(expenses, from_attributes=True), mode="json")
+    body = json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+    db.expunge_all()
+    return body
+
+
+def fast_path(db: Session, user_id: str, limit: int) -> bytes:
+    rows, _ = ExpenseCRUD.get_expense_rows_page(db, user_id, limit=limit)
+    return serialization.dumps(rows)
+
+
+def _ms_per_call(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def run(rows: int, repeat: int) -> dict:
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine)
+    with Session(engine) as db:
+        user_id = seed(db, rows)
+        if json.loads(orm_path(db, user_id, rows)) != json.loads(fast_path(db, user_id, rows)):
+            raise AssertionError("fast path output differs from the schema output")
+        orm_ms = _ms_per_call(lambda: orm_path(db, user_id, rows), repeat)
+        fast_ms = _ms_per_call(lambda: fast_path(db, user_id, rows), repeat)
+    return {
+        "rows": rows,
+        "encoder": "orjson" if serialization.orjson is not None else "json",
+        "orm_pydantic_ms": orm_ms,
+        "fast_path_ms": fast_ms,
+        "speedup": orm_ms / fast_ms,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.repeat)
+    print(f"{results['rows']} rows, encoder {results['encoder']}")
+    print(f"orm + pydantic  {results['orm_pydantic_ms']:8.1f} ms")
+    print(f"fast path       {results['fast_path_ms']:8.1f} ms  ({results['speedup']:.1f}x)")
+    if args.json_path:
+        with open(args.json_path, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
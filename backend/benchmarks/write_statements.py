@@ -0,0 +1,148 @@
+"""
+Count the SQL statements (and time) each write endpoint spends in the
+database, from the CRUD call through building its response schema.
+
+    cd backend
+    python -m benchmarks.write_statements --repeat 200 [--json results.json]
+
+"refresh" replays the previous pattern: sessions expire every object on
+commit and each write calls db.refresh() afterwards, so the response reloads
+the row and lazy-loads its tags. "in memory" is the current path: objects
+survive the commit and users are updated with UPDATE ... RETURNING.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-at-least-32-characters")
+
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import Session, sessionmaker  # noqa: E402
+
+from app import models, schemas  # noqa: E402
+from app.crud import ExpenseCRUD, UserCRUD  # noqa: E402
+from app.database import make_engine  # noqa: E402
+
+
+def refresh_create_user(db: Session, i: int) -> schemas.User:
+    user = UserCRUD.create_user(db, schemas.UserCreate(
+        username=f"user{i}", email=f"user{i}@example.com", password="x"), password_hash="x")
+    db.refresh(user)
+    return schemas.User.model_validate(user)
+
+
+def refresh_update_user(db: Session, user_id: str, i: int) -> schemas.User:
+    user = db.get(models.User, user_id)
+    user.username = f"renamed{i}"
+    db.commit()
+    db.refresh(user)
+    return schemas.User.model_validate(user)
+
+
+def refresh_create_expense(db: Session, user_id: str, i: int) -> schemas.Expense:
+    expense = ExpenseCRUD.create_expense(db, schemas.ExpenseCreate(title=f"E{i}", amount=i, tags=["a", "b"]), user_id)
+    db.refresh(expense)
+    return schemas.Expense.model_validate(expense)
+
+
+def refresh_update_expense(db: Session, expense_id: str, user_id: str, i: int) -> schemas.Expense:
+    expense = ExpenseCRUD.update_expense(
+        db, expense_id, schemas.ExpenseCreate(title=f"U{i}", amount=i, tags=["b"]), user_id)
+    db.refresh(expense)
+    return schemas.Expense.model_validate(expense)
+
+
+def memory_create_user(db: Session, i: int) -> schemas.User:
+    return schemas.User.model_validate(UserCRUD.create_user(db, schemas.UserCreate(
+        username=f"user{i}", email=f"user{i}@example.com", password="x"), password_hash="x"))
+
+
+def memory_update_user(db: Session, user_id: str, i: int) -> schemas.User:
+    return schemas.User.model_validate(
+        UserCRUD.update_user(db, user_id, schemas.UserUpdate(username=f"renamed{i}")))
+
+
+def memory_create_expense(db: Session, user_id: str, i: int) -> schemas.Expense:
+    return schemas.Expense.model_validate(ExpenseCRUD.create_expense(
+        db, schemas.ExpenseCreate(title=f"E{i}", amount=i, tags=["a", "b"]), user_id))
+
+
+def memory_update_expense(db: Session, expense_id: str, user_id: str, i: int) -> schemas.Expense:
+    return schemas.Expense.model_validate(ExpenseCRUD.update_expense(
+        db, expense_id, schemas.ExpenseCreate(title=f"U{i}", amount=i, tags=["b"]), user_id))
+
+
+PATTERNS = {
+    "refresh": (True, refresh_create_user, refresh_update_user, refresh_create_expense, refresh_update_expense),
+    "in memory": (False, memory_create_user, memory_update_user, memory_create_expense, memory_update_expense),
+}
+
+
+def run_pattern(path: str, pattern: str, repeat: int) -> dict:
+    expire, create_user, update_user, create_expense, update_expense = PATTERNS[pattern]
+    engine = make_engine(f"sqlite:///{path}", "benchmark")
+    models.Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine, autoflush=False, expire_on_commit=expire)
+    counts = {"statements": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*args):
+        counts["statements"] += 1
+
+    results = {}
+    with factory() as db:
+        user_id = create_user(db, -1).id
+        expense_id = create_expense(db, user_id, -1).id
+        db.expunge_all()
+        for name, write in (
+            ("create_user", lambda i: create_user(db, i)),
+            ("update_user", lambda i: update_user(db, user_id, i)),
+            ("create_expense", lambda i: create_expense(db, user_id, i)),
+            ("update_expense", lambda i: update_expense(db, expense_id, user_id, i)),
+        ):
+            counts["statements"] = 0
+            started = time.perf_counter()
+            for i in range(repeat):
+                write(i)
+                # Each request starts with an empty identity map
+                db.expunge_all()
+            results[name] = {
+                "statements_per_write": counts["statements"] / repeat,
+                "ms_per_write": (time.perf_counter() - started) / repeat * 1000,
+            }
+    engine.dispose()
+    return results
+
+
+def run(repeat: int, directory: str) -> dict:
+    results = {}
+    for pattern in PATTERNS:
+        path = os.path.join(directory, f"{pattern.replace(' ', '_')}.db")
+        if os.path.exists(path):
+            os.remove(path)
+        results[pattern] = run_pattern(path, pattern, repeat)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", dest="json_path", help="Also write results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = run(args.repeat, directory)
+    print(f"{'':16} {'refresh':>20} {'in memory':>20}")
+    for name in results["refresh"]:
+        before, after = results["refresh"][name], results["in memory"][name]
+        print(f"{name:16} {before['statements_per_write']:5.1f} stmts {before['ms_per_write']:6.2f} ms "
+              f"{after['statements_per_write']:5.1f} stmts {after['ms_per_write']:6.2f} ms")
+    if args.json_path:
+        with open(args.json_path, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
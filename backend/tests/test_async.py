@@ -0,0 +1,105 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from datetime import date
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app import crud, routes_async, schemas
+from app.crud_async import AsyncExpenseCRUD, AsyncUserCRUD
+from app.database import to_async_url
+from app.models import Base
+from app.rollup import RollupService
+
+
+@pytest_asyncio.fixture
+async def async_db():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+async def _create_user(async_db, username):
+    user = schemas.UserCreate(username=username, email=f"{username}@example.com", password="pass")
+    return await async_db.run_sync(
+        lambda session: schemas.User.model_validate(crud.UserCRUD.create_user(session, user))
+    )
+
+
+def test_to_async_url():
+    assert to_async_url("sqlite:////app/data/expenses.db") == "sqlite+aiosqlite:////app/data/expenses.db"
+    assert to_async_url("postgresql://u:p@db:5432/expenses") == "postgresql+asyncpg://u:p@db:5432/expenses"
+
+
+@pytest.mark.asyncio
+async def test_async_expense_crud(async_db):
+    user = await _create_user(async_db, "kim")
+    assert (await AsyncUserCRUD.get_user_by_id(async_db, user.id)).username == "kim"
+
+    created = await AsyncExpenseCRUD.create_expense(async_db, schemas.ExpenseCreate(
+        title="Taxi", amount=18, tags=["travel"], timestamp="2024-06-01T10:00:00"), user.id)
+    await AsyncExpenseCRUD.create_expense(async_db, schemas.ExpenseCreate(
+        title="Hotel", amount=120, tags=["travel"], timestamp="2024-06-02T10:00:00"), user.id)
+
+    page, cursor = await AsyncExpenseCRUD.get_expense_rows_page(async_db, user.id, limit=1)
+    assert [e["title"] for e in page] == ["Hotel"] and cursor
+    page, cursor = await AsyncExpenseCRUD.get_expense_rows_page(async_db, user.id, limit=1, cursor=cursor)
+    assert [e["tags"][0]["name"] for e in page] == ["travel"]
+    assert cursor is None
+
+    updated = await AsyncExpenseCRUD.update_expense(async_db, created.id, schemas.ExpenseCreate(
+        title="Taxi home", amount=20, tags=["travel"]), user.id)
+    assert updated.title == "Taxi home"
+    fetched = await AsyncExpenseCRUD.get_expense(async_db, created.id, user.id)
+    assert [tag.name for tag in fetched.tags] == ["travel"]
+
+    deleted = await AsyncExpenseCRUD.delete_expense(async_db, created.id, user.id)
+    assert deleted.id == created.id
+    assert await AsyncExpenseCRUD.get_expense(async_db, created.id, user.id) is None
+    assert await async_db.run_sync(lambda session: RollupService.verify(session, user.id)) == []
+
+
+@pytest.mark.asyncio
+async def test_async_update_profile_rejects_taken_username(async_db):
+    await _create_user(async_db, "ann")
+    bob = await _create_user(async_db, "bob")
+
+    with pytest.raises(HTTPException) as error:
+        await routes_async.update_user_profile(schemas.UserUpdate(username="ann"), bob, async_db)
+    assert error.value.status_code == 400
+    assert (await AsyncUserCRUD.get_user_by_id(async_db, bob.id)).username == "bob"
+
+
+@pytest.mark.asyncio
+async def test_async_range_route_serves_cached_json(async_db):
+    import json
+    from fastapi import Request, Response
+    user = await _create_user(async_db, "lee")
+    await AsyncExpenseCRUD.create_expense(async_db, schemas.ExpenseCreate(
+        title="Taxi", amount=18, tags=["travel"], timestamp="2024-06-01T10:00:00"), user.id)
+
+    response = await routes_async.list_expenses_in_range(
+        Request({"type": "http", "headers": []}), Response(), date(2024, 6, 1), date(2024, 6, 30), user, async_db)
+    assert [e["title"] for e in json.loads(response.body)] == ["Taxi"]
+    assert response.headers["etag"]
+
+
+def test_install_replaces_sync_handlers_in_place():
+    app = FastAPI()
+
+    @app.get("/expenses/summary")
+    def summary():
+        return []
+
+    @app.get("/expenses/{expense_id}")
+    def get_expense(expense_id: str):
+        return {}
+
+    routes_async.install(app)
+    paths = [(route.path, route.endpoint) for route in app.router.routes if hasattr(route, "endpoint")]
+    assert ("/expenses/summary", summary) in paths
+    assert ("/expenses/{expense_id}", routes_async.get_expense) in paths
+    assert paths.index(("/expenses/summary", summary)) < paths.index(("/expenses/{expense_id}", routes_async.get_expense))
@@ -26,3 +26,124 @@ def test_register_duplicate_user(client, test_user):
     response = client.post("/register", json=test_user)
     assert response.status_code == 400
     assert "already registered" in response.json()["detail"]
+
+def test_authenticated_identity_is_cached_until_user_update(db_session, test_user):
+    from app import schemas
+    user = crud.create_user(db_session, schemas.UserCreate(**test_user))
+    token = auth.AuthService.create_user_token(user)
+
+    identity = auth.AuthService.get_authenticated_identity(db_session, token)
+    assert identity.username == test_user["username"]
+    # Served from the cache, so no session is needed
+    assert auth.AuthService.get_authenticated_identity(None, token).id == user.id
+
+    crud.update_user(db_session, user.id, schemas.UserUpdate(username="renamed"))
+    assert auth.AuthService.get_authenticated_identity(db_session, token).username == "renamed"
+
+def test_trusted_token_claims(db_session, test_user, monkeypatch):
+    from app import schemas
+    user = crud.create_user(db_session, schemas.UserCreate(**test_user))
+    assert auth.AuthService.get_identity_from_claims(auth.AuthService.create_user_token(user)) is None
+
+    monkeypatch.setattr(auth.settings, "trust_token_claims", True)
+    identity = auth.AuthService.get_identity_from_claims(auth.AuthService.create_user_token(user))
+    assert identity.id == user.id
+    assert identity.email == test_user["email"]
+
+def test_login_rehashes_weaker_password_hash(client, db_session, test_user):
+    from app import models, schemas
+    weak_hash = auth.pwd_context.hash(test_user["password"], rounds=4)
+    user = crud.create_user(db_session, schemas.UserCreate(**test_user), password_hash=weak_hash)
+
+    response = client.post("/login", json={"username": test_user["username"], "password": test_user["password"]})
+    assert response.status_code == 200
+    db_session.expire_all()
+    upgraded = db_session.get(models.User, user.id).password_hash
+    assert upgraded != weak_hash
+    assert not auth.pwd_context.needs_update(upgraded)
+    assert auth.verify_password(test_user["password"], upgraded)
+
+def test_password_hasher_rejects_when_queue_full():
+    import asyncio
+    from app.hashing import HashingOverloaded, PasswordHasher
+
+    hasher = PasswordHasher(workers=1, max_pending=1)
+
+    async def burst():
+        return await asyncio.gather(hasher.hash("a"), hasher.hash("b"), return_exceptions=True)
+
+    try:
+        first, second = asyncio.run(burst())
+    finally:
+        hasher.shutdown()
+    assert auth.verify_password("a", first)
+    assert isinstance(second, HashingOverloaded)
+
+def test_verified_tokens_are_cached(monkeypatch):
+    token = auth.create_access_token({"sub": "user-1"})
+    assert auth.AuthService.verify_token(token) == "user-1"
+
+    def fail(token):
+        raise AssertionError("cached token decoded again")
+
+    monkeypatch.setattr(auth.token_backend, "decode", fail)
+    assert auth.AuthService.verify_token(token) == "user-1"
+
+@pytest.mark.parametrize("algorithm", ["ES256", "EdDSA"])
+def test_asymmetric_token_backends(algorithm):
+    from datetime import datetime, timedelta
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    from jose.exceptions import ExpiredSignatureError, JWTError
+    from app.tokens import build_backend
+
+    if algorithm == "EdDSA":
+        key = ed25519.Ed25519PrivateKey.generate()
+    else:
+        key = ec.generate_private_key(ec.SECP256R1())
+    pem = key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    backend = build_backend(algorithm, "unused", private_key_pem=pem)
+
+    now = datetime.utcnow()
+    token = backend.encode({"sub": "abc", "exp": now + timedelta(minutes=5)})
+    assert backend.decode(token)["sub"] == "abc"
+
+    with pytest.raises(JWTError):
+        backend.decode(token[:-4] + ("AAAA" if not token.endswith("AAAA") else "BBBB"))
+    with pytest.raises(ExpiredSignatureError):
+        backend.decode(backend.encode({"sub": "abc", "exp": now - timedelta(minutes=5)}))
+
+def test_register_race_maps_unique_violation_to_400(client, db_session, test_user, monkeypatch):
+    from app import hashing
+    from app.database import get_db
+    from app.main import app
+    from tests.conftest import TestingSessionLocal
+
+    # Requests run in savepoints, so a failed insert rolls back only its own work
+    # and leaves the fixture's outer transaction (and the first user) in place
+    request_session = TestingSessionLocal(bind=db_session.connection(), join_transaction_mode="create_savepoint")
+    app.dependency_overrides[get_db] = lambda: request_session
+
+    client.post("/register", json=test_user)
+    hashed = []
+    original_hash = hashing.password_hasher.hash
+
+    async def counting_hash(password):
+        hashed.append(password)
+        return await original_hash(password)
+
+    monkeypatch.setattr(hashing.password_hasher, "hash", counting_hash)
+    response = client.post("/register", json={**test_user, "username": "other"})
+    assert (response.status_code, response.json()["detail"]) == (400, "Email already registered")
+    assert hashed == []
+
+    # A concurrent signup that passed the pre-check loses at the unique constraint
+    monkeypatch.setattr(crud, "registration_conflict", lambda *args: None)
+    response = client.post("/register", json={**test_user, "email": "other@example.com"})
+    assert (response.status_code, response.json()["detail"]) == (400, "Username already registered")
+    response = client.post("/register", json={**test_user, "username": "other"})
+    assert (response.status_code, response.json()["detail"]) == (400, "Email already registered")
+    assert crud.get_user_by_username(request_session, test_user["username"]) is not None
+    request_session.close()
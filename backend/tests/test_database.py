@@ -1,7 +1,8 @@
 import pytest
-from sqlalchemy import create_engine
+from datetime import date
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from app import crud, models, schemas
+from app import crud, models, schemas, search
 from app.models import Base
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -9,7 +10,7 @@ SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
 )
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 
 @pytest.fixture(scope="function")
@@ -101,3 +102,498 @@ def test_delete_expense(db):
     assert deleted.id == expense.id
     expenses = crud.get_expenses(db, user.id)
     assert all(e.id != expense.id for e in expenses)
+
+
+def _count_list_statements(db, user_id):
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    db.expunge_all()
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for expenses in (
+            crud.get_expenses(db, user_id),
+            crud.get_expenses_page(db, user_id, limit=50)[0],
+            crud.get_expenses_in_range(db, date(2000, 1, 1), date(2100, 1, 1), user_id),
+        ):
+            [schemas.Expense.model_validate(e) for e in expenses]
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def test_list_statement_count_independent_of_rows(db):
+    user = crud.create_user(db, schemas.UserCreate(username="henry", email="henry@example.com", password="pass"))
+    crud.create_expense(db, schemas.ExpenseCreate(title="First", amount=1, tags=["a", "b"]), user.id)
+    baseline = _count_list_statements(db, user.id)
+
+    for i in range(10):
+        crud.create_expense(db, schemas.ExpenseCreate(title=f"More {i}", amount=i, tags=[f"t{i}", "a"]), user.id)
+    assert _count_list_statements(db, user.id) == baseline
+
+
+def test_get_or_create_tags_batches_round_trips(db):
+    user = crud.create_user(db, schemas.UserCreate(username="ivy", email="ivy@example.com", password="pass"))
+    names = [f"tag{i}" for i in range(10)]
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        created = crud.TagCRUD._get_or_create_tags(db, names + ["tag0"], user.id)
+        assert len(statements) == 3
+        statements.clear()
+        reused = crud.TagCRUD._get_or_create_tags(db, names, user.id)
+        assert len(statements) == 1
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert [t.name for t in created] == names
+    assert [t.id for t in reused] == [t.id for t in created]
+    assert db.query(models.Tag).filter(models.Tag.user_id == user.id).count() == 10
+
+
+def test_writes_build_responses_without_reading_back(db):
+    user = crud.create_user(db, schemas.UserCreate(username="noor", email="noor@example.com", password="pass"))
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        expense = crud.create_expense(db, schemas.ExpenseCreate(title="Tea", amount=2, tags=["drinks"]), user.id)
+        statements.clear()
+        assert schemas.Expense.model_validate(expense).tags[0].name == "drinks"
+        assert statements == []
+
+        updated = crud.update_user(db, user.id, schemas.UserUpdate(username="noor2"))
+        assert len(statements) == 1 and "RETURNING" in statements[0]
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    assert updated is user and user.username == "noor2"
+    assert crud.update_user(db, "missing", schemas.UserUpdate(username="x")) is None
+
+
+def test_rollups_follow_expense_writes(db):
+    from app.rollup import ALL_TAGS, RollupService
+
+    user = crud.create_user(db, schemas.UserCreate(username="jack", email="jack@example.com", password="pass"))
+    lunch = crud.create_expense(db, schemas.ExpenseCreate(
+        title="Lunch", amount=12, tags=["food", "work"], timestamp="2024-01-10T12:00:00"), user.id)
+    crud.create_expense(db, schemas.ExpenseCreate(
+        title="Bus", amount=3, timestamp="2024-01-11T08:00:00"), user.id)
+    crud.bulk_create_expenses(db, [
+        schemas.ExpenseCreate(title="Salary", amount=1000, type="income", timestamp="2024-01-31T09:00:00"),
+        schemas.ExpenseCreate(title="Dinner", amount=20, tags=["food"], timestamp="2024-02-02T19:00:00"),
+    ], user.id)
+    assert RollupService.verify(db, user.id) == []
+
+    crud.update_expense(db, lunch.id, schemas.ExpenseCreate(
+        title="Lunch", amount=15, tags=["food"], timestamp="2024-02-01T12:00:00"), user.id)
+    assert RollupService.verify(db, user.id) == []
+    february = db.get(models.ExpenseRollup, (user.id, "2024-02", "expense", ALL_TAGS, "EUR"))
+    assert (february.total_minor, february.count) == (3500, 2)
+
+    crud.delete_expense(db, lunch.id, user.id)
+    assert RollupService.verify(db, user.id) == []
+
+    db.query(models.ExpenseRollup).delete()
+    db.commit()
+    assert RollupService.verify(db, user.id) != []
+    RollupService.rebuild(db, user.id)
+    assert RollupService.verify(db, user.id) == []
+
+    summary = crud.get_summary(db, user.id, "type", date(2024, 1, 1), date(2024, 2, 29))
+    assert [(b.key, b.total, b.count) for b in summary] == [("expense", 23.0, 2), ("income", 1000.0, 1)]
+
+    summary = crud.get_summary(db, user.id, "month", date(2024, 1, 15), date(2024, 2, 29))
+    assert [(b.key, b.total, b.count) for b in summary] == [("2024-01", 1000.0, 1), ("2024-02", 20.0, 1)]
+
+
+def test_database_url_assembled_from_db_settings():
+    from app.config import Settings
+    from app.database import build_database_url
+
+    config = Settings(secret_key="x" * 32, db_type="postgresql", db_host="db", db_port="6432",
+                      db_name="ledger", db_user="app", db_password="s3cret")
+    config.model_fields_set.discard("database_url")
+    assert build_database_url(config) == "postgresql://app:s3cret@db:6432/ledger"
+
+    config = Settings(secret_key="x" * 32, db_type="postgresql", database_url="sqlite:///explicit.db")
+    assert build_database_url(config) == "sqlite:///explicit.db"
+
+
+def test_instrumented_pool_reports_checkouts_and_timeouts(tmp_path):
+    from prometheus_client import REGISTRY
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+    from sqlalchemy.pool import QueuePool
+    from app.database import instrumented_pool
+
+    pool_engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=instrumented_pool(QueuePool, "test"),
+        pool_size=1, max_overflow=0, pool_timeout=0.05,
+    )
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"pool": "test"}) or 0
+
+    held = pool_engine.connect()
+    assert sample("db_pool_checked_out") == 1
+    with pytest.raises(PoolTimeoutError):
+        pool_engine.connect()
+    assert sample("db_pool_timeouts_total") == 1
+    assert sample("db_pool_waiting") == 0
+    held.close()
+    assert sample("db_pool_checked_out") == 0
+    assert sample("db_pool_checkout_seconds_count") == 2
+    pool_engine.dispose()
+
+
+def test_query_stats_per_route_server_timing_and_slow_log(tmp_path, monkeypatch, caplog):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from prometheus_client import REGISTRY
+    from sqlalchemy import text
+    from app.config import settings
+    from app.database import QueryStatsMiddleware, make_engine
+
+    query_engine = make_engine(f"sqlite:///{tmp_path / 'queries.db'}", "queries")
+    stats_app = FastAPI()
+    stats_app.add_middleware(QueryStatsMiddleware)
+
+    @stats_app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        with query_engine.connect() as conn:
+            # A failing statement is not counted and leaves no state on the pooled connection
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+            conn.rollback()
+            return [conn.scalar(text("SELECT :n"), {"n": n}) for n in range(item_id)]
+
+    monkeypatch.setattr(settings, "sql_server_timing", True)
+    monkeypatch.setattr(settings, "slow_query_ms", 0.000001)
+    with TestClient(stats_app) as client, caplog.at_level("WARNING", logger="app.database"):
+        response = client.get("/items/3")
+
+    assert response.json() == [0, 1, 2]
+    assert response.headers["server-timing"].endswith('desc="3 queries"')
+    labels = {"route": "/items/{item_id}"}
+    assert REGISTRY.get_sample_value("db_request_queries_sum", labels) == 3
+    assert REGISTRY.get_sample_value("db_request_seconds_count", labels) == 1
+    assert REGISTRY.get_sample_value("db_slow_queries_total", labels) == 3
+    assert "route /items/{item_id}): SELECT ?" in caplog.text
+
+
+def test_sqlite_pragmas_applied_on_connect(tmp_path):
+    from sqlalchemy import text
+    from app.database import install_sqlite_pragmas
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    install_sqlite_pragmas(file_engine)
+    with file_engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    file_engine.dispose()
+
+
+def test_write_queue_batches_commits_and_isolates_failures(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from app.writer import WriteQueue, create_expense_job
+
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'writer.db'}")
+    Base.metadata.create_all(bind=file_engine)
+    Session = sessionmaker(bind=file_engine)
+    with Session() as session:
+        user = crud.create_user(session, schemas.UserCreate(username="w", email="w@example.com", password="p"))
+        user_id = user.id
+
+    commits = []
+    event.listen(file_engine, "commit", lambda conn: commits.append(1))
+
+    def failing_job(db):
+        raise RuntimeError("bad row")
+
+    queue = WriteQueue(Session, batch_size=50, batch_window=0.05)
+    queue.start()
+
+    def run_concurrently(jobs):
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(queue.run, job) for job in jobs]
+        return [f.exception() or f.result() for f in futures]
+
+    def expense_jobs(prefix):
+        return [create_expense_job(schemas.ExpenseCreate(title=f"{prefix}{i}", amount=i, tags=["t"]), user_id)
+                for i in range(10)]
+
+    results = run_concurrently(expense_jobs("a"))
+    assert all(isinstance(r, schemas.Expense) for r in results)
+    assert len(commits) < 10
+
+    results = run_concurrently(expense_jobs("b")[:5] + [failing_job] + expense_jobs("b")[5:])
+    queue.stop()
+    assert str(results[5]) == "bad row"
+    assert sorted(r.title for r in results if isinstance(r, schemas.Expense)) == [f"b{i}" for i in range(10)]
+    with Session() as session:
+        assert len(crud.get_expenses(session, user_id)) == 20
+    file_engine.dispose()
+
+
+def test_read_router_replica_window_and_fallback(tmp_path):
+    from app.database import ReadRouter, note_writer, read_router
+
+    router = ReadRouter([f"sqlite:///{tmp_path / 'missing' / 'replica.db'}", f"sqlite:///{tmp_path / 'replica.db'}"],
+                        window=60, retry_after=60)
+    # The unreachable replica is skipped and then left alone until retry_after passes
+    for _ in range(3):
+        replica = router.replica_session("u1")
+        assert replica.get_bind().url.database == str(tmp_path / "replica.db")
+        replica.close()
+    assert router.replica_session(None) is None
+
+    router.mark_write("u1")
+    assert router.replica_session("u1") is None
+    assert router.replica_session("u2") is not None
+    assert ReadRouter([], window=60).replica_session("u2") is None
+
+    # Commits attributed with note_writer open the window on the app's router
+    session = TestingSessionLocal()
+    note_writer(session, "writer-1")
+    session.commit()
+    session.close()
+    assert read_router.recent_writes.get("writer-1")
+
+
+def test_read_router_retries_failed_replica_queries_on_primary(tmp_path, monkeypatch):
+    from sqlalchemy import text
+    from app import database
+    from app.database import ReadRouter, make_engine
+
+    primary = make_engine(f"sqlite:///{tmp_path / 'primary.db'}", "primary-test")
+    with primary.begin() as conn:
+        conn.execute(text("CREATE TABLE items (name TEXT)"))
+        conn.execute(text("INSERT INTO items VALUES ('from primary')"))
+    monkeypatch.setattr(database, "engine", primary)
+
+    # The replica connects fine but has not got the table yet
+    router = ReadRouter([f"sqlite:///{tmp_path / 'lagging.db'}"], window=60, retry_after=60)
+    replica = router.replica_session("u1")
+    assert replica.scalar(text("SELECT name FROM items")) == "from primary"
+    # The rest of the session stays on the primary, and the replica is skipped for a while
+    assert replica.scalar(text("SELECT COUNT(*) FROM items")) == 1
+    replica.close()
+    assert router.replica_session("u1") is None
+    primary.dispose()
+
+
+def test_expense_rows_fast_path_matches_schema_wire_format(db, monkeypatch):
+    from datetime import datetime
+    from pydantic import TypeAdapter
+    from app import serialization
+
+    user = crud.create_user(db, schemas.UserCreate(username="fast", email="fast@example.com", password="p"))
+    for i, (title, tags) in enumerate([("Café ☕", ["coffee"]), ("Plain", []), ("Tags", ["a", "b"])]):
+        crud.create_expense(db, schemas.ExpenseCreate(
+            title=title, amount=i + 0.5, tags=tags, timestamp=datetime(2024, 3, i + 1, 8, 30, 0, 250 * i)
+        ), user.id)
+
+    adapter = TypeAdapter(list[schemas.Expense])
+    expenses, _ = crud.get_expenses_page(db, user.id, limit=10)
+    expected = adapter.dump_json(adapter.validate_python(expenses, from_attributes=True))
+    rows, _ = crud.get_expense_rows_page(db, user.id, limit=10)
+    assert serialization.dumps(rows) == expected
+
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps(rows) == expected
+    in_range = crud.get_expense_rows_in_range(db, date(2024, 3, 1), date(2024, 3, 31), user.id)
+    assert sorted(row["title"] for row in in_range) == ["Café ☕", "Plain", "Tags"]
+
+
+def test_search_without_fts5_falls_back_to_substring_matching(db, monkeypatch):
+    user = crud.create_user(db, schemas.UserCreate(username="like", email="like@example.com", password="p"))
+    crud.bulk_create_expenses(db, [
+        schemas.ExpenseCreate(title="Taxi home", amount=12, tags=["travel"]),
+        schemas.ExpenseCreate(title="Lunch", amount=9, tags=["food"]),
+    ], user.id)
+    assert [row["title"] for row in crud.search_expense_rows(db, user.id, "trav", 10)] == ["Taxi home"]
+
+    monkeypatch.setattr(search, "FTS5_AVAILABLE", False)
+    assert [row["title"] for row in crud.search_expense_rows(db, user.id, "trav", 10)] == ["Taxi home"]
+    assert [row["title"] for row in crud.search_expense_rows(db, user.id, "unc", 10)] == ["Lunch"]
+
+
+@pytest.mark.skipif(not search.FTS5_AVAILABLE, reason="SQLite built without FTS5")
+def test_search_index_is_updated_by_rowid(db, tmp_path):
+    import uuid
+    from sqlalchemy import inspect, text
+    from app.migrations import drop_outdated_search_index
+
+    user = crud.create_user(db, schemas.UserCreate(username="fts", email="fts@example.com", password="p"))
+    taxi = crud.create_expense(db, schemas.ExpenseCreate(title="Taxi home", amount=12, tags=["travel"]), user.id)
+    lunch = crud.create_expense(db, schemas.ExpenseCreate(title="Lunch", amount=9), user.id)
+    crud.update_expense(db, taxi.id, schemas.ExpenseCreate(title="Train home", amount=12), user.id)
+    crud.delete_expense(db, lunch.id, user.id)
+    assert [row["title"] for row in crud.search_expense_rows(db, user.id, "home", 10)] == ["Train home"]
+    assert crud.search_expense_rows(db, user.id, "taxi", 10) == []
+    assert db.scalar(text(f"SELECT COUNT(*) FROM {search.KEYS_TABLE}")) == 1
+
+    # Documents are dropped by rowid, not by scanning the index for an id column
+    plan = db.connection().exec_driver_sql(
+        "EXPLAIN QUERY PLAN " + search._DELETE["sqlite"][0].replace(":ids", "(?)"), (uuid.UUID(taxi.id).bytes,)
+    ).all()
+    assert any(f"SCAN {search.TABLE} VIRTUAL TABLE INDEX 0:=" in row[-1] for row in plan)
+
+    old = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with old.begin() as conn:
+        conn.execute(text(f"CREATE VIRTUAL TABLE {search.TABLE} USING fts5(expense_id UNINDEXED, title)"))
+    assert drop_outdated_search_index(old) is True
+    assert not inspect(old).has_table(search.TABLE)
+    Base.metadata.create_all(bind=old)
+    assert drop_outdated_search_index(old) is False
+
+
+def test_summaries_and_rollups_keep_currencies_apart(db):
+    from app.rollup import RollupService
+
+    user = crud.create_user(db, schemas.UserCreate(username="cy", email="cy@example.com", password="pass"))
+    crud.bulk_create_expenses(db, [
+        schemas.ExpenseCreate(title="Hotel", amount=100, currency="EUR", tags=["trip"], timestamp="2024-03-02T10:00:00"),
+        schemas.ExpenseCreate(title="Taxi", amount=40, currency="USD", tags=["trip"], timestamp="2024-03-03T10:00:00"),
+        schemas.ExpenseCreate(title="Meal", amount=10, currency="USD", timestamp="2024-04-10T10:00:00"),
+    ], user.id)
+    taxi = crud.create_expense(db, schemas.ExpenseCreate(
+        title="Bus", amount=5, currency="EUR", timestamp="2024-03-20T10:00:00"), user.id)
+    crud.update_expense(db, taxi.id, schemas.ExpenseCreate(title="Bus", amount=5, currency="USD"), user.id)
+    assert RollupService.verify(db, user.id) == []
+
+    # March is read from the rollups, April 1-15 from the expenses table
+    summary = crud.get_summary(db, user.id, "month", date(2024, 3, 1), date(2024, 4, 15))
+    assert [(b.key, b.currency, b.total, b.count) for b in summary] == [
+        ("2024-03", "EUR", 100.0, 1), ("2024-03", "USD", 45.0, 2), ("2024-04", "USD", 10.0, 1),
+    ]
+    summary = crud.get_summary(db, user.id, "tag", date(2024, 3, 1), date(2024, 3, 31))
+    assert [(b.key, b.currency, b.total) for b in summary] == [
+        (None, "USD", 5.0), ("trip", "EUR", 100.0), ("trip", "USD", 40.0),
+    ]
+    summary = crud.get_summary(db, user.id, "day", date(2024, 3, 1), date(2024, 3, 31))
+    assert {(b.key, b.currency) for b in summary} == {("2024-03-02", "EUR"), ("2024-03-03", "USD"),
+                                                      ("2024-03-20", "USD")}
+
+
+def test_amounts_are_exact_minor_units(db):
+    user = crud.create_user(db, schemas.UserCreate(username="mia", email="mia@example.com", password="pass"))
+    for amount in (0.1, 0.2, 19.999):
+        crud.create_expense(db, schemas.ExpenseCreate(
+            title="Item", amount=amount, currency="USD", timestamp="2024-05-03T10:00:00"), user.id)
+    assert sorted(e.amount_minor for e in db.query(models.Expense)) == [10, 20, 2000]
+    assert {e.currency for e in db.query(models.Expense)} == {"USD"}
+
+    [bucket] = crud.get_summary(db, user.id, "type", date(2024, 5, 1), date(2024, 5, 31))
+    assert (bucket.total, bucket.count) == (20.3, 3)
+    page, _ = crud.get_expenses_page(db, user.id, schemas.ExpenseFilter(min_amount=0.2, max_amount=0.2))
+    assert [e.amount for e in page] == [0.2]
+
+
+def test_migrate_amounts_converts_float_column_in_batches(tmp_path, caplog):
+    from sqlalchemy import inspect, text
+    from app.migrations import drop_outdated_rollups, migrate_amounts
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id VARCHAR PRIMARY KEY)"))
+        conn.execute(text("CREATE TABLE expenses (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, "
+                          "amount FLOAT NOT NULL, timestamp DATETIME, type VARCHAR, "
+                          "user_id VARCHAR NOT NULL REFERENCES users (id))"))
+        conn.execute(text("CREATE INDEX ix_old_user_ts ON expenses (user_id, timestamp)"))
+        conn.execute(text("CREATE TABLE expense_tags (expense_id VARCHAR REFERENCES expenses (id))"))
+        conn.execute(text("CREATE TABLE expense_rollups (user_id VARCHAR, month VARCHAR, type VARCHAR, "
+                          "tag_key VARCHAR, total FLOAT, count INTEGER)"))
+        conn.execute(text("INSERT INTO users VALUES ('u')"))
+        conn.execute(
+            text("INSERT INTO expenses (id, title, amount, user_id) VALUES (:id, 'x', :amount, 'u')"),
+            [{"id": f"e{i}", "amount": amount}
+             for i, amount in enumerate([0.1 + 0.2, 12.5, 3, 0.005, 7.1, float("inf")])],
+        )
+        conn.execute(text("INSERT INTO expense_tags VALUES ('e1')"))
+
+    with caplog.at_level("WARNING", logger="app.migrations"):
+        assert migrate_amounts(engine, batch_size=2) == 6
+    assert "Expense e5 has amount inf" in caplog.text
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, amount_minor, currency FROM expenses ORDER BY id")).all()
+        assert conn.execute(text("PRAGMA foreign_key_check")).all() == []
+    assert [(row.amount_minor, row.currency) for row in rows] == [
+        (30, "EUR"), (1250, "EUR"), (300, "EUR"), (1, "EUR"), (710, "EUR"), (0, "EUR")
+    ]
+    columns = {column["name"]: column for column in inspect(engine).get_columns("expenses")}
+    assert "amount" not in columns and not columns["amount_minor"]["nullable"]
+    assert [fk["referred_table"] for fk in inspect(engine).get_foreign_keys("expenses")] == ["users"]
+    assert [index["name"] for index in inspect(engine).get_indexes("expenses")] == ["ix_old_user_ts"]
+    assert not inspect(engine).has_table("expense_rollups")
+    assert migrate_amounts(engine) == 0
+
+    # Rollups from before the currency key are dropped for rebuilding too
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE expense_rollups (user_id VARCHAR, month VARCHAR, type VARCHAR, "
+                          "tag_key VARCHAR, total_minor BIGINT, count INTEGER)"))
+    assert drop_outdated_rollups(engine) and not inspect(engine).has_table("expense_rollups")
+
+
+def test_new_ids_are_time_ordered_uuid7():
+    import uuid
+
+    ids = [models.new_id() for _ in range(3)]
+    assert all(uuid.UUID(value).version == 7 for value in ids)
+    assert [value[:13] for value in ids] == sorted(value[:13] for value in ids)
+
+
+def test_compact_ids_stored_as_16_bytes_and_malformed_ids_match_nothing(db):
+    from sqlalchemy import text
+
+    user = crud.create_user(db, schemas.UserCreate(username="ola", email="ola@example.com", password="pass"))
+    expense = crud.create_expense(db, schemas.ExpenseCreate(title="Tea", amount=2, tags=["drinks"]), user.id)
+    assert db.scalar(text("SELECT length(id) FROM expenses")) == 16
+    assert crud.get_expense(db, expense.id, user.id).tags[0].name == "drinks"
+    assert crud.get_expense(db, "not-a-uuid", user.id) is None
+
+
+def test_migrate_ids_converts_text_keys_in_place(tmp_path):
+    import uuid
+    from sqlalchemy import inspect, text
+    from sqlalchemy.orm import Session
+    from app.migrations import migrate_ids
+
+    user_id, expense_id, tag_id = (str(uuid.uuid4()) for _ in range(3))
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        for statement in (
+            "CREATE TABLE users (id VARCHAR PRIMARY KEY, username VARCHAR UNIQUE NOT NULL, "
+            "email VARCHAR UNIQUE NOT NULL, password_hash VARCHAR NOT NULL, created_at DATETIME)",
+            "CREATE TABLE expenses (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, amount_minor BIGINT NOT NULL, "
+            "currency VARCHAR(3) NOT NULL, timestamp DATETIME, type VARCHAR, "
+            "user_id VARCHAR NOT NULL REFERENCES users (id))",
+            "CREATE TABLE tags (id VARCHAR PRIMARY KEY, name VARCHAR NOT NULL, "
+            "user_id VARCHAR NOT NULL REFERENCES users (id))",
+            "CREATE UNIQUE INDEX uq_tags_user_name ON tags (user_id, name)",
+            "CREATE TABLE expense_tags (expense_id VARCHAR REFERENCES expenses (id), tag_id VARCHAR REFERENCES tags (id))",
+            f"INSERT INTO users VALUES ('{user_id}', 'pia', 'pia@example.com', 'x', '2024-01-01 00:00:00')",
+            f"INSERT INTO expenses VALUES ('{expense_id}', 'Lunch', 1250, 'EUR', '2024-01-02 12:00:00', 'expense', "
+            f"'{user_id}')",
+            f"INSERT INTO tags VALUES ('{tag_id}', 'food', '{user_id}')",
+            f"INSERT INTO expense_tags VALUES ('{expense_id}', '{tag_id}')",
+        ):
+            conn.execute(text(statement))
+
+    assert migrate_ids(engine, batch_size=1) == 4
+    with engine.connect() as conn:
+        assert conn.scalar(text("SELECT length(user_id) FROM expense_tags JOIN tags ON tags.id = tag_id")) == 16
+    assert not any(name.endswith("_old") for name in inspect(engine).get_table_names())
+    with Session(engine) as db:
+        expense = crud.get_expense(db, expense_id, user_id)
+        assert (expense.title, expense.amount, [t.id for t in expense.tags]) == ("Lunch", 12.5, [tag_id])
+    assert migrate_ids(engine) == 0
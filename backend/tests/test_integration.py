@@ -1,3 +1,5 @@
+import json
+import uuid
 import pytest
 from datetime import datetime
 from app import schemas
@@ -20,3 +22,308 @@ def test_register_login_expense_flow(client, test_user):
     r = client.get("/expenses", headers=headers)
     assert r.status_code == 200
     assert len(r.json()) == 1
+
+
+def _auth_headers(client, test_user):
+    client.post("/register", json=test_user)
+    r = client.post("/login", json={"username": test_user["username"], "password": test_user["password"]})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def test_list_expenses_keyset_pagination_and_filters(client, test_user):
+    headers = _auth_headers(client, test_user)
+    for day in range(1, 6):
+        client.post("/expenses", json={
+            "title": f"Item {day}",
+            "amount": day * 10,
+            "tags": ["food"] if day % 2 else ["rent"],
+            "timestamp": f"2024-01-0{day}T12:00:00",
+        }, headers=headers)
+
+    seen = []
+    r = client.get("/expenses", params={"limit": 2}, headers=headers)
+    while True:
+        assert r.status_code == 200
+        seen.extend(e["title"] for e in r.json())
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+        r = client.get("/expenses", params={"limit": 2, "cursor": cursor}, headers=headers)
+    assert seen == [f"Item {day}" for day in range(5, 0, -1)]
+
+    r = client.get("/expenses", params={"tag": "food", "min_amount": 20, "order": "asc"}, headers=headers)
+    assert [e["title"] for e in r.json()] == ["Item 3", "Item 5"]
+
+    r = client.get("/expenses", params={"q": "item 4"}, headers=headers)
+    assert [e["title"] for e in r.json()] == ["Item 4"]
+
+    r = client.get("/expenses", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert r.status_code == 400
+    for bound in ("1e300", "NaN", "-inf"):
+        assert client.get("/expenses", params={"min_amount": bound}, headers=headers).status_code == 422
+        assert client.get("/expenses", params={"max_amount": bound}, headers=headers).status_code == 422
+
+
+def test_amounts_that_do_not_fit_minor_units_are_rejected(client, test_user):
+    headers = _auth_headers(client, test_user)
+    for amount in ("1e300", "-1e300", "Infinity", "NaN"):
+        r = client.post("/expenses", content=f'{{"title": "Huge", "amount": {amount}}}',
+                        headers={**headers, "Content-Type": "application/json"})
+        assert r.status_code == 422, amount
+    r = client.post("/expenses/bulk", content='{"title": "Huge", "amount": 1e300}\n{"title": "Ok", "amount": 1}',
+                    headers={**headers, "Content-Type": "application/x-ndjson"})
+    assert (r.json()["inserted"], [e["row"] for e in r.json()["errors"]]) == (1, [1])
+
+
+def test_bulk_import_ndjson_and_csv(client, test_user):
+    headers = _auth_headers(client, test_user)
+    ndjson = "\n".join([
+        '{"title": "Rent", "amount": 900, "tags": ["home"], "timestamp": "2024-02-01T09:00:00"}',
+        '{"title": "Broken", "amount": "lots"}',
+        'not json',
+        '{"title": "Groceries", "amount": 54.2, "tags": ["food", "home"]}',
+    ])
+    r = client.post("/expenses/bulk", content=ndjson,
+                    headers={**headers, "Content-Type": "application/x-ndjson"})
+    assert r.status_code == 200
+    result = r.json()
+    assert result["inserted"] == 2
+    assert result["failed"] == 2
+    assert [e["row"] for e in result["errors"]] == [2, 3]
+
+    csv_body = 'title,amount,timestamp,tags\n"Coffee, large",3.5,2024-02-02T08:00:00,food;drinks\nNo amount,,,\n'
+    r = client.post("/expenses/bulk", content=csv_body, headers={**headers, "Content-Type": "text/csv"})
+    assert r.json()["inserted"] == 1
+    assert r.json()["errors"][0]["row"] == 2
+
+    expenses = client.get("/expenses", params={"tag": "food"}, headers=headers).json()
+    assert sorted(e["title"] for e in expenses) == ["Coffee, large", "Groceries"]
+    coffee = next(e for e in expenses if e["title"] == "Coffee, large")
+    assert sorted(t["name"] for t in coffee["tags"]) == ["drinks", "food"]
+
+
+def test_export_streams_csv_and_ndjson(client, test_user):
+    headers = _auth_headers(client, test_user)
+    for day in (1, 15, 28):
+        client.post("/expenses", json={
+            "title": f"Day {day}", "amount": day, "tags": ["x", "y"],
+            "timestamp": f"2024-03-{day:02d}T10:00:00",
+        }, headers=headers)
+
+    r = client.get("/expenses/export", params={"format": "csv"}, headers=headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    lines = r.text.strip().splitlines()
+    assert lines[0] == "id,title,amount,timestamp,type,currency,tags"
+    assert len(lines) == 4
+    assert ",Day 1,1.0,2024-03-01T10:00:00,expense,EUR," in lines[1]
+
+    r = client.get("/expenses/export", params={
+        "format": "ndjson", "start_date": "2024-03-10", "end_date": "2024-03-20"
+    }, headers=headers)
+    rows = [json.loads(line) for line in r.text.splitlines()]
+    assert [row["title"] for row in rows] == ["Day 15"]
+    assert sorted(rows[0]["tags"]) == ["x", "y"]
+
+
+def test_summary_groups_in_sql(client, test_user):
+    headers = _auth_headers(client, test_user)
+    for title, amount, tags, ts in [
+        ("A", 10, ["food"], "2024-04-01T10:00:00"),
+        ("B", 30, ["food", "fun"], "2024-04-03T10:00:00"),
+        ("C", 5, [], "2024-04-08T10:00:00"),
+        ("D", 100, ["rent"], "2024-05-01T10:00:00"),
+    ]:
+        client.post("/expenses", json={"title": title, "amount": amount, "tags": tags, "timestamp": ts},
+                    headers=headers)
+    params = {"start_date": "2024-04-01", "end_date": "2024-05-31"}
+
+    r = client.get("/expenses/summary", params={**params, "group_by": "month"}, headers=headers)
+    assert r.status_code == 200
+    assert r.json() == [
+        {"key": "2024-04", "currency": "EUR", "total": 45.0, "count": 3, "average": 15.0},
+        {"key": "2024-05", "currency": "EUR", "total": 100.0, "count": 1, "average": 100.0},
+    ]
+
+    r = client.get("/expenses/summary", params={**params, "group_by": "week"}, headers=headers)
+    assert [(b["key"], b["count"]) for b in r.json()] == [("2024-04-01", 2), ("2024-04-08", 1), ("2024-04-29", 1)]
+
+    r = client.get("/expenses/summary", params={**params, "group_by": "tag"}, headers=headers)
+    assert {b["key"]: b["total"] for b in r.json()} == {None: 5.0, "food": 40.0, "fun": 30.0, "rent": 100.0}
+
+    r = client.get("/expenses/summary", params={**params, "group_by": "year"}, headers=headers)
+    assert r.status_code == 422
+
+
+def test_conditional_get_returns_304_until_expenses_change(client, test_user):
+    headers = _auth_headers(client, test_user)
+    created = client.post("/expenses", json={"title": "Tea", "amount": 3}, headers=headers).json()
+
+    for path in ("/expenses", f"/expenses/{created['id']}",
+                 "/expenses/range?start_date=2000-01-01&end_date=2100-01-01"):
+        r = client.get(path, headers=headers)
+        etag = r.headers["ETag"]
+        assert r.status_code == 200 and etag.startswith('W/"')
+        r = client.get(path, headers={**headers, "If-None-Match": etag})
+        assert r.status_code == 304 and r.content == b"" and r.headers["ETag"] == etag
+
+    # A current ETag does not hide that an expense does not exist
+    r = client.get(f"/expenses/{uuid.uuid4()}", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 404
+
+    client.put(f"/expenses/{created['id']}", json={"title": "Green tea", "amount": 4}, headers=headers)
+    r = client.get("/expenses", headers={**headers, "If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.json()[0]["title"] == "Green tea"
+
+
+def test_range_and_summary_cache_invalidated_per_month(client, test_user):
+    from prometheus_client import REGISTRY
+
+    def hits(route):
+        return REGISTRY.get_sample_value("response_cache_requests_total", {"route": route, "result": "hit"}) or 0
+
+    headers = _auth_headers(client, test_user)
+    for title, ts in [("Jan", "2024-01-10T10:00:00"), ("Feb", "2024-02-10T10:00:00")]:
+        client.post("/expenses", json={"title": title, "amount": 10, "timestamp": ts}, headers=headers)
+    january = {"start_date": "2024-01-01", "end_date": "2024-01-31"}
+    february = {"start_date": "2024-02-01", "end_date": "2024-02-29"}
+    summary = {"start_date": "2024-01-01", "end_date": "2024-02-29", "group_by": "month"}
+
+    first = client.get("/expenses/range", params=january, headers=headers).json()
+    client.get("/expenses/range", params=february, headers=headers)
+    client.get("/expenses/summary", params=summary, headers=headers)
+    before = hits("range")
+    assert client.get("/expenses/range", params=january, headers=headers).json() == first
+    assert hits("range") == before + 1
+
+    # A February write leaves the January entry valid and refreshes February and the summary
+    client.post("/expenses", json={"title": "Feb 2", "amount": 5, "timestamp": "2024-02-20T10:00:00"},
+                headers=headers)
+    client.get("/expenses/range", params=january, headers=headers)
+    assert hits("range") == before + 2
+    assert len(client.get("/expenses/range", params=february, headers=headers).json()) == 2
+    assert hits("range") == before + 2
+    buckets = client.get("/expenses/summary", params=summary, headers=headers).json()
+    assert buckets[-1] == {"key": "2024-02", "currency": "EUR", "total": 15.0, "count": 2, "average": 7.5}
+
+
+def test_sized_lru_cache_evicts_by_bytes():
+    from app.cache import SizedLRUCache
+
+    evicted = []
+    cache = SizedLRUCache(max_bytes=10, ttl=60, on_evict=evicted.append)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    cache.get("a")
+    cache.set("c", "zzzz")
+    assert cache.get("b") is None and cache.get("a") == "xxxx" and cache.size == 8
+    assert evicted == [1]
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+
+
+def test_sized_lru_cache_counts_encoded_bytes_and_reports_every_removal(monkeypatch):
+    from app import cache as cache_module
+
+    sizes = []
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = cache_module.SizedLRUCache(max_bytes=10, ttl=60, on_resize=sizes.append)
+    cache.set("a", "€€€")  # 3 characters, 9 bytes
+    assert cache.size == 9 and sizes == [9]
+    cache.set("b", "€")
+    assert cache.get("a") is None and cache.size == 3 and sizes[-1] == 3
+
+    now[0] += 61
+    assert cache.get("b") is None
+    assert cache.size == 0 and sizes[-1] == 0
+
+
+def test_search_ranks_title_and_tag_matches_and_paginates(client, test_user):
+    headers = _auth_headers(client, test_user)
+    for title, tags in [("Coffee at Starbucks", ["drinks"]), ("Groceries", ["coffee", "food"]),
+                        ("Coffee beans", []), ("Rent", ["home"])]:
+        client.post("/expenses", json={"title": title, "amount": 5, "tags": tags}, headers=headers)
+
+    r = client.get("/expenses/search", params={"q": "coff"}, headers=headers)
+    assert r.status_code == 200
+    titles = [e["title"] for e in r.json()]
+    assert set(titles) == {"Coffee at Starbucks", "Groceries", "Coffee beans"}
+    assert titles[-1] == "Groceries"  # tag-only match ranks below title matches
+
+    r = client.get("/expenses/search", params={"q": "coffee sta"}, headers=headers)
+    assert [e["title"] for e in r.json()] == ["Coffee at Starbucks"]
+
+    first = client.get("/expenses/search", params={"q": "coffee", "limit": 2}, headers=headers)
+    second = client.get("/expenses/search", params={"q": "coffee", "limit": 2,
+                                                     "cursor": first.headers["X-Next-Cursor"]}, headers=headers)
+    assert len(first.json()) == 2 and len(second.json()) == 1
+    assert "X-Next-Cursor" not in second.headers
+
+    # The index follows updates and deletes
+    rent = next(e for e in client.get("/expenses", headers=headers).json() if e["title"] == "Rent")
+    client.put(f"/expenses/{rent['id']}", json={"title": "Rent and coffee", "amount": 5}, headers=headers)
+    assert len(client.get("/expenses/search", params={"q": "coffee"}, headers=headers).json()) == 4
+    client.delete(f"/expenses/{rent['id']}", headers=headers)
+    assert len(client.get("/expenses/search", params={"q": "coffee"}, headers=headers).json()) == 3
+    assert client.get("/expenses/search", params={"q": "\"*"}, headers=headers).json() == []
+
+
+def test_search_hits_serialize_like_other_expense_reads(client, test_user):
+    headers = _auth_headers(client, test_user)
+    created = client.post("/expenses", json={"title": "Coffee", "amount": 3.5, "tags": ["drinks"],
+                                             "timestamp": "2024-01-02T10:00:00.123456"}, headers=headers).json()
+    [hit] = client.get("/expenses/search", params={"q": "coffee"}, headers=headers).json()
+    assert hit == created
+    assert hit["timestamp"] == "2024-01-02T10:00:00.123456"
+
+
+def test_profiling_middleware_samples_requested_and_random_requests(tmp_path):
+    import time
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.profiling import ProfilingMiddleware
+
+    def busy_handler():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return {"ok": True}
+
+    profiled = FastAPI()
+    profiled.get("/busy")(busy_handler)
+    profiled.add_middleware(ProfilingMiddleware, directory=str(tmp_path), sample_rate=0, token="s3cret")
+    with TestClient(profiled) as c:
+        assert "x-profile-file" not in c.get("/busy").headers
+        assert "x-profile-file" not in c.get("/busy", headers={"X-Profile": "wrong"}).headers
+        assert list(tmp_path.iterdir()) == []
+
+        name = c.get("/busy", headers={"X-Profile": "s3cret"}).headers["x-profile-file"]
+    lines = (tmp_path / name).read_text().splitlines()
+    count = lines[0].rsplit(" ", 1)[1]
+    assert int(count) > 0 and any("busy_handler (test_integration.py" in line for line in lines)
+
+    sampled = tmp_path / "sampled"
+    profiled = FastAPI()
+    profiled.get("/busy")(busy_handler)
+    profiled.add_middleware(ProfilingMiddleware, directory=str(sampled), sample_rate=1)
+    with TestClient(profiled) as c:
+        c.get("/busy")
+    assert len(list(sampled.iterdir())) == 1
+
+
+def test_profiling_keeps_only_the_newest_profiles(tmp_path):
+    import os
+    from app.profiling import prune
+
+    for i in range(5):
+        path = tmp_path / f"{i}.folded"
+        path.write_text("main 1\n")
+        os.utime(path, (1000 + i, 1000 + i))
+    (tmp_path / "notes.txt").write_text("kept")
+
+    assert prune(str(tmp_path), 2) == 3
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["3.folded", "4.folded", "notes.txt"]
+    assert prune(str(tmp_path), 0) == 0
@@ -5,3 +5,18 @@ def test_user_model_attributes():
     u = models.User(username="a", email="a@example.com", password_hash="hash")
     assert hasattr(u, "username")
     assert hasattr(u, "email")
+
+def test_expense_pages_use_user_timestamp_index(db_session):
+    from sqlalchemy import bindparam, inspect, text
+    indexes = {index["name"]: index["column_names"] for index in inspect(db_session.bind).get_indexes("expenses")}
+    assert indexes["ix_expenses_user_ts_id"] == ["user_id", "timestamp", "id"]
+
+    # The shape of ExpenseCRUD.page_statement past a cursor
+    plan = db_session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT id FROM expenses WHERE user_id = :user_id "
+        "AND (timestamp, id) < (:timestamp, :id) ORDER BY timestamp DESC, id DESC LIMIT 21"
+    ).bindparams(bindparam("user_id", type_=models.CompactUUID), bindparam("id", type_=models.CompactUUID)), {
+        "user_id": models.new_id(), "timestamp": datetime(2024, 1, 1), "id": models.new_id(),
+    }).all()
+    assert any("ix_expenses_user_ts_id" in row[-1] for row in plan)
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)